@@ -19,10 +19,14 @@ class General:
 		raise NotImplementedError("Expected gradient function not implemented")
 		return []
 
+	# Returns the threshold values for all rows of X at once.
+	def getValuesForX(self, dist_params, a,b, params, samples,  z_0, z_1, X):
+		raise NotImplementedError("GetValuesForX function not implemented")
+		return []
+
 	# Returns the threshold value at any point.
 	def getValueForX(self, dist_params, a,b, params, samples,  z_0, z_1, x, flag):
-		raise NotImplementedError("GetValueForX function not implemented")
-		return 0
+		return self.getValuesForX(dist_params, a,b, params, samples,  z_0, z_1, np.atleast_2d(x))[0]
 
 	# Returns the value of the objective function for given parameters.
 	def getFuncValue(self, dist_params, a,b, params, samples,  z_0, z_1):
@@ -56,6 +60,8 @@ class General:
 	# Gradient Descent implementation for the optimizing the objective function.
 	# Note that one can alternately also use packages like CVXPY here.
 	# Here we use decaying step size. For certain objectives, constant step size might be better.
+	# All restarts are run at once with one row of params per restart, and the
+	# conditionals of the samples are computed once for all steps.
 	def gradientDescent(self, dist_params, a, b, samples, z_0, z_1):
 		mu = 0.01
 		minVal = 100000000
@@ -63,15 +69,19 @@ class General:
 
 		minParam = [0] * size
 
-		for i in range(1,10):
-			params = self.getStartParams(i)
-			for k in range(1,50):
-				grad = self.getExpectedGrad(dist_params, params, samples, mu, z_0, z_1, a, b)
-				for j in range(0, len(params)):
-					params[j] = params[j] - 1/k * grad[j]
-				funcVal = self.getFuncValue(dist_params, a,b, params, samples, z_0, z_1)
-				if funcVal < minVal:
-					minVal, minParam = funcVal, params
+		samples = ut.asConditionals(dist_params, samples)
+		params = np.array([self.getStartParams(i) for i in range(1,10)], dtype=float)
+		minVals = np.full(len(params), np.inf)
+		for k in range(1,50):
+			params -= 1/k * self.getExpectedGrad(dist_params, params, samples, mu, z_0, z_1, a, b)
+			funcVals = self.getFuncValue(dist_params, a,b, params, samples, z_0, z_1)
+			minVals = np.where(funcVals < minVals, funcVals, minVals)
+
+		# as in the sequential version, return the final params of the first
+		# restart that reached the lowest value
+		best = np.argmin(minVals)
+		if minVals[best] < minVal:
+			minParam = list(params[best])
 
 		return minParam
 
@@ -90,23 +100,22 @@ class General:
 		maxAcc = 0
 		maxGamma = 0
 
+		# the samples are drawn with a fixed seed, so they and the conditionals
+		# of the samples and of the training points are the same for all spans
+		samples = ut.getRandomSamples(dist_params_train)
+		samples_cond = ut.getConditionals(dist_params, samples)
+		train_cond = ut.getConditionals(dist_params, x_train)
+
 		span = self.getRange(eps, tau)
 		for (a,b) in span:
 			acc, gamma = 0, 0
 			#print("-----",a,b)
-			samples = ut.getRandomSamples(dist_params_train)
 
 			#try :
-			params = self.gradientDescent(dist_params, a, b, samples, z_0, z_1)
+			params = self.gradientDescent(dist_params, a, b, samples_cond, z_0, z_1)
 			#print(params)
-			y_res = []
-
-			for x in x_train:
-				t = self.getValueForX(dist_params, a,b, params, samples,  z_0, z_1, x, 0)
-				if t > 0 :
-					y_res.append(1)
-				else:
-					y_res.append(-1)
+			t = self.getValuesForX(dist_params, a,b, params, samples_cond,  z_0, z_1, train_cond)
+			y_res = np.where(t > 0, 1, -1)
 
 			acc = ut.getAccuracy(y_train, y_res)
 			gamma = self.getGamma(y_train, y_res, x_control_train)
@@ -120,8 +129,10 @@ class General:
 				paramsOpt = params
 
 		print("---- Training Accuracy: ", maxAcc, ", Training gamma: ", maxGamma)
+		# the model takes a single point or a matrix with one point per row
 		def model(x):
-			return self.getValueForX(dist_params, p, q, paramsOpt, samples,  z_0, z_1, x, 0)
+			t = self.getValuesForX(dist_params, p, q, paramsOpt, samples,  z_0, z_1, np.atleast_2d(x))
+			return t if np.ndim(x) > 1 else t[0]
 
 		return model
 
@@ -135,21 +146,15 @@ class General:
 		samples = ut.getRandomSamples(dist_params_train)
 
 		def model(x):
-			return self.getValueForX(dist_params, p, q, params, samples,  z_0, z_1, x, 0)
+			t = self.getValuesForX(dist_params, p, q, params, samples,  z_0, z_1, np.atleast_2d(x))
+			return t if np.ndim(x) > 1 else t[0]
 
 		return model
 
 	def processGivenData(self, tau, x_train, y_train, x_control_train, x_test, y_test, x_control_test, dist_params, dist_params_train):
 		model = self.getModel(tau, x_train, y_train, x_control_train)
 
-		y_test_res = []
-		for x in x_test:
-				#t = self.getValueForX(dist_params, p, q, paramsOpt, samples,  z_0, z_1, x, 0)
-				t = model(x)
-				if t > 0 :
-					y_test_res.append(1)
-				else:
-					y_test_res.append(-1)
+		y_test_res = list(np.where(model(np.array(x_test)) > 0, 1, -1))
 		#f.write(str(tau) + " " + str(self.getGamma(y_test, y_test_res, x_control_test)) + " " + str(ut.getAccuracy(y_test, y_test_res)) + "\n")
 		return y_test_res
 
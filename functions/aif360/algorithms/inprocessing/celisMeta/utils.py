@@ -5,52 +5,107 @@ from scipy.stats import multivariate_normal
 import scipy.stats as st
 import numpy as np
 import math
+from collections import namedtuple
 from sklearn.mixture import GaussianMixture
 import logging
 
-def getDistribution(x_train, y_train, x_control_train):
-	train = list(x_train)
-	for i in range(0,len(train)):
-		train[i] = np.append(train[i], y_train[i])
-		train[i] = np.append(train[i], x_control_train[i])
-
-	#print(train)
+# Fits Gaussians to the joint (x, y, z) training data and to x alone. The
+# frozen multivariate_normal in "density" factorizes the covariance once and
+# keeps the pseudo-inverse and log-pseudo-determinant for all later density
+# evaluations. The two-component GaussianMixture models are not used by the
+# density calls and are only fitted if fit_mixture is set.
+def getDistribution(x_train, y_train, x_control_train, fit_mixture=False):
+	train = np.column_stack([x_train, y_train, x_control_train])
 
 	mean = np.mean(train, axis=0)
 	cov = np.cov(train, rowvar=0)
-	clf = GaussianMixture(n_components=2, covariance_type='full',reg_covar=1e-05)
-	model = clf.fit(train)
+	model = None
+	if fit_mixture:
+		clf = GaussianMixture(n_components=2, covariance_type='full',reg_covar=1e-05)
+		model = clf.fit(train)
 
-	dist_params = {"mean":mean, "cov":cov, "model":model}
+	dist_params = {"mean":mean, "cov":cov, "model":model,
+		"density":multivariate_normal(mean, cov, allow_singular=1)}
 
 	mean_train = np.mean(x_train, axis=0)
 	cov_train = np.cov(x_train, rowvar=0)
-	clf_train = GaussianMixture(n_components=2, covariance_type='full',reg_covar=1e-05)
-	model_train = clf_train.fit(list(x_train))
-
-	#print(train, train_label, train_label==train)
+	model_train = None
+	if fit_mixture:
+		clf_train = GaussianMixture(n_components=2, covariance_type='full',reg_covar=1e-05)
+		model_train = clf_train.fit(np.asarray(x_train))
 
-	dist_params_train = {"mean":mean_train, "cov":cov_train, "model":model_train}
+	dist_params_train = {"mean":mean_train, "cov":cov_train, "model":model_train,
+		"density":multivariate_normal(mean_train, cov_train, allow_singular=1)}
 	return dist_params, dist_params_train
 
+# Returns the frozen density of dist_params, creating it on first use for
+# parameters that were not made by getDistribution.
+def getDensity(dist_params):
+	if dist_params.get("density") is None:
+		dist_params["density"] = multivariate_normal(dist_params["mean"],
+			dist_params["cov"], allow_singular=1)
+	return dist_params["density"]
+
 def getProbability(dist_params, x):
-	mean, cov = dist_params["mean"], dist_params["cov"]
-	return multivariate_normal.pdf(x, mean=mean, cov=cov, allow_singular=1)
+	return getDensity(dist_params).pdf(x)
+
+# (y, z) combinations appended to each x by getProbabilities
+YZ_VALUES = np.array([[1, 1], [-1, 1], [1, 0], [-1, 0]], dtype=float)
+
+# Log-densities of (x, y, z) for every row x of X and every (y, z) in
+# YZ_VALUES, evaluated in chunks of rows with the cached factorization. Returns
+# an array of shape (4, len(X)) with the rows for (1, 1), (-1, 1), (1, 0) and
+# (-1, 0).
+def getLogProbabilities(dist_params, X, chunk_size=4096):
+	density = getDensity(dist_params)
+	X = np.atleast_2d(X)
+	n, d = X.shape
+	logprobs = np.empty((len(YZ_VALUES), n))
+	for start in range(0, n, chunk_size):
+		x = X[start:start + chunk_size]
+		points = np.empty((len(YZ_VALUES), len(x), d + 2))
+		points[:, :, :d] = x
+		points[:, :, d:] = YZ_VALUES[:, np.newaxis, :]
+		logprobs[:, start:start + chunk_size] = np.reshape(
+			density.logpdf(points.reshape(-1, d + 2)), (len(YZ_VALUES), len(x)))
+	return logprobs
+
+# Densities of (x, y, z) as returned by getLogProbabilities: the rows are
+# prob_1_1, prob_m1_1, prob_1_0 and prob_m1_0.
+def getProbabilities(dist_params, X, chunk_size=4096):
+	return np.exp(getLogProbabilities(dist_params, X, chunk_size))
+
+Conditionals = namedtuple('Conditionals', ['total', 'prob_y_1', 'prob_z_0',
+	'prob_z_1', 'probc_m1_0', 'probc_m1_1'])
+
+# Conditional probabilities of y and z given each row x of X: returns the total
+# density and the arrays prob_y_1, prob_z_0, prob_z_1, probc_m1_0 and
+# probc_m1_1, where probc_m1_z = Pr[y=-1, z | x]. Rows with a total density of
+# 0 give nan.
+def getConditionals(dist_params, X):
+	prob_1_1, prob_m1_1, prob_1_0, prob_m1_0 = getProbabilities(dist_params, X)
+	total = prob_1_1 + prob_1_0 + prob_m1_0 + prob_m1_1
+	with np.errstate(divide='ignore', invalid='ignore'):
+		prob_y_1 = (prob_1_1 + prob_1_0) / total
+		prob_z_0 = (prob_m1_0 + prob_1_0) / total
+		prob_z_1 = (prob_m1_1 + prob_1_1) / total
+		probc_m1_0 = prob_m1_0 / total
+		probc_m1_1 = prob_m1_1 / total
+	return Conditionals(total, prob_y_1, prob_z_0, prob_z_1, probc_m1_0, probc_m1_1)
+
+# The conditionals do not depend on the parameters being optimized, so they can
+# be computed once and passed instead of the points themselves.
+def asConditionals(dist_params, X):
+	if isinstance(X, Conditionals):
+		return X
+	return getConditionals(dist_params, X)
 
 def getRandomSamples(dist_params_train):
-	mean, cov, model = dist_params_train["mean"], dist_params_train["cov"], dist_params_train["model"]
-	return multivariate_normal(mean, cov, allow_singular=1).rvs(size=20, random_state=12345)
+	return getDensity(dist_params_train).rvs(size=20, random_state=12345)
 
 def getAccuracy(y_test, y_res):
-	total, fail = 0, 0
-	for j in range(0,len(y_test)):
-		result = y_res[j]
-		actual = y_test[j]
-		total += 1
-		if actual != result:
-			fail += 1
-
-	return 1 - fail/(float(total))
+	fail = np.count_nonzero(np.asarray(y_test) != np.asarray(y_res))
+	return 1 - fail/(float(len(y_test)))
 
 def getStats(y_test, y_res, x_control_test):
 	try:
@@ -51,7 +51,7 @@ __all__ = ['eval', 'nb', 'lr', 'util']
 
 logger = logging.getLogger('fadm')
 if not logger.handlers:
-    logger.addHandler(logging.NullHandler)
+    logger.addHandler(logging.NullHandler())
 
 #==============================================================================
 # Test routine
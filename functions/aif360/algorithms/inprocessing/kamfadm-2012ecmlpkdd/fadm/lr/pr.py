@@ -29,10 +29,13 @@ from __future__ import unicode_literals
 #==============================================================================
 
 import logging
+import warnings
 import numpy as np
-from scipy.optimize import fmin_cg
+import scipy.sparse as sp
+from scipy.optimize import minimize
 from sklearn.linear_model import LogisticRegression
-from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.exceptions import ConvergenceWarning
 
 #==============================================================================
 # Public symbols
@@ -77,6 +80,89 @@ def sigmoid(x, w):
 
     return 1.0 / (1.0 + np.exp(-s))
 
+def sigmoid_rows(X, coef, s, intercept=None):
+    """ sigmoid(w(s_i)^T x_i) for all rows at once
+
+    Parameters
+    ----------
+    X : array or sparse matrix, shape=(n_samples, d)
+        input vectors
+    coef : array, shape=(n_sfv, d)
+        weights for each value of the sensitive feature
+    s : array, shape=(n_samples), dtype=int
+        values of the sensitive feature selecting the weights of each row
+    intercept : array, shape=(n_sfv), optional
+        constant terms added to w(s_i)^T x_i
+
+    Returns
+    -------
+    sigmoid : array, shape=(n_samples)
+        sigmoid(w(s_i)^T x_i)
+    """
+
+    if sp.issparse(X):
+        z = np.asarray(X.dot(coef.T))[np.arange(X.shape[0]), s]
+    else:
+        z = np.einsum('ij,ij->i', X, coef[s])
+    if intercept is not None:
+        z += intercept[s]
+    np.clip(z, -SIGMOID_RANGE, SIGMOID_RANGE, out=z)
+    np.negative(z, out=z)
+    np.exp(z, out=z)
+    z += 1.0
+
+    return np.reciprocal(z, out=z)
+
+def split_sensitive(X, ns):
+    """ split samples into non-sensitive and sensitive features
+
+    Parameters
+    ----------
+    X : array or sparse matrix, shape=(n_samples, n_features)
+        feature vectors of samples, the sensitive feature at column -ns
+    ns : int
+        number of sensitive features
+
+    Returns
+    -------
+    X : array or CSR matrix, shape=(n_samples, n_features - ns)
+        non-sensitive features
+    s : array, shape=(n_samples), dtype=int
+        values of the sensitive feature
+    """
+
+    if sp.issparse(X):
+        X = sp.csr_matrix(X)
+        s = X[:, -ns].toarray()
+    else:
+        X = np.atleast_2d(X)
+        s = X[:, -ns]
+
+    return X[:, :-ns], np.atleast_1d(np.squeeze(s).astype(int))
+
+def column_scale(X):
+    """ largest absolute value of each column, 1 for all-zero columns
+
+    Parameters
+    ----------
+    X : array or sparse matrix, shape=(n_samples, n_features)
+        feature vectors of samples
+
+    Returns
+    -------
+    scale : array, shape=(n_features)
+        largest absolute value of each column
+    """
+
+    if sp.issparse(X):
+        scale = abs(X).max(axis=0).toarray().ravel()
+    else:
+        scale = np.max(np.abs(X), axis=0) if X.shape[0] else np.ones(X.shape[1])
+    scale = np.asarray(scale, dtype=np.float64)
+    scale[scale == 0.0] = 1.0
+
+    return scale
+
 
 #==============================================================================
 # Classes
@@ -135,7 +221,7 @@ class LRwPR(BaseEstimator, ClassifierMixin):
 
         Parameters
         ----------
-        X : array, shape=(n_samples, n_features)
+        X : array or sparse matrix, shape=(n_samples, n_features)
             feature vectors of samples
 
         Returns
@@ -159,7 +245,7 @@ class LRwPRPredictProbaType2Mixin(LRwPR):
 
         Parameters
         ----------
-        X : array, shape=(n_samples, n_features)
+        X : array or sparse matrix, shape=(n_samples, n_features)
             feature vectors of samples
 
         Returns
@@ -168,18 +254,16 @@ class LRwPRPredictProbaType2Mixin(LRwPR):
             array of predicted class
         """
 
-        # add a constanet term
-        s = np.atleast_1d(np.squeeze(np.array(X)[:, -self.n_s_]).astype(int))
-        if self.fit_intercept:
-            X = np.c_[np.atleast_2d(X)[:, :-self.n_s_], np.ones(X.shape[0])]
-        else:
-            X = np.atleast_2d(X)[:, :-self.n_s_]
+        X, s = split_sensitive(X, self.n_s_)
         coef = self.coef_.reshape(self.n_sfv_, self.n_features_)
 
+        # the constant term is added to w(s)^T x rather than to X
         proba = np.empty((X.shape[0], N_CLASSES))
-        proba[:, 1] = [sigmoid(X[i, :], coef[s[i], :])
-                       for i in range(X.shape[0])]
-        proba[:, 0] = 1.0 - proba[:, 1]
+        if self.fit_intercept:
+            proba[:, 1] = sigmoid_rows(X, coef[:, :-1], s, coef[:, -1])
+        else:
+            proba[:, 1] = sigmoid_rows(X, coef, s)
+        np.subtract(1.0, proba[:, 1], out=proba[:, 0])
 
         return proba
 
@@ -213,7 +297,7 @@ class LRwPRFittingType1Mixin(LRwPR):
         if itype == 0:
             # clear by zeros
             self.coef_ = np.zeros(self.n_sfv_ * self.n_features_,
-                                  dtype=np.float)
+                                  dtype=np.float64)
         elif itype == 1:
             # at random
             self.coef_ = np.random.randn(self.n_sfv_ * self.n_features_)
@@ -221,7 +305,7 @@ class LRwPRFittingType1Mixin(LRwPR):
         elif itype == 2:
             # learned by standard LR
             self.coef_ = np.empty(self.n_sfv_ * self.n_features_,
-                                  dtype=np.float)
+                                  dtype=np.float64)
             coef = self.coef_.reshape(self.n_sfv_, self.n_features_)
 
             clr = LogisticRegression(C=self.C, penalty='l2',
@@ -232,7 +316,7 @@ class LRwPRFittingType1Mixin(LRwPR):
         elif itype == 3:
             # learned by standard LR
             self.coef_ = np.empty(self.n_sfv_ * self.n_features_,
-                                  dtype=np.float)
+                                  dtype=np.float64)
             coef = self.coef_.reshape(self.n_sfv_, self.n_features_)
 
             for i in range(self.n_sfv_):
@@ -243,12 +327,13 @@ class LRwPRFittingType1Mixin(LRwPR):
         else:
             raise TypeError
 
-    def fit(self, X, y, ns=N_S, itype=0, **kwargs):
+    def fit(self, X, y, ns=N_S, itype=0, coef_init=None, method='L-BFGS-B',
+            **kwargs):
         """ train this model
 
         Parameters
         ----------
-        X : array, shape = (n_samples, n_features)
+        X : array or sparse matrix, shape = (n_samples, n_features)
             feature vectors of samples
         y : array, shape = (n_samples)
             target class of samples
@@ -256,41 +341,135 @@ class LRwPRFittingType1Mixin(LRwPR):
             number of sensitive features. currently fixed to N_S
         itype : int
             type of initialization method
+        coef_init : array, shape=(`n_sfv_` * n_features), optional
+            initial coefficients, e.g. the solution for a nearby eta. if
+            given, `itype` is ignored
+        method : str
+            'L-BFGS-B' (default) or 'CG', the nonlinear conjugate gradient
+            method formerly used via fmin_cg
         kwargs : any
-            arguments to optmizer
+            options to the optimizer, e.g. maxiter (default 1000 for L-BFGS-B
+            and 100 for CG), gtol (default 1e-7 * n_samples, as the loss is a
+            sum over the samples) or ftol of L-BFGS-B (default 0, i.e. stop
+            only when the loss no longer decreases, since the default relative
+            reduction stops far from the optimum)
+
+        Notes
+        -----
+        The coefficients are optimized in units of the largest absolute value
+        of their features (see `column_scale`), which has the same solution
+        but keeps unscaled features, e.g. amounts in the thousands, from
+        making the problem ill-conditioned.
+
+        Attributes
+        ----------
+        `n_iter_` : int
+            the number of iterations run by the optimizer
+        `grad_norm_` : float
+            maximum absolute value of the final (projected) gradient with
+            respect to the scaled coefficients
+        `converged_` : bool
+            whether `grad_norm_` is at most gtol
+        `optimize_result_` : OptimizeResult
+            full result of the optimizer, including the message and the
+            numbers of loss evaluations
         """
 
         # rearrange input arguments
-        s = np.atleast_1d(np.squeeze(np.array(X)[:, -ns]).astype(int))
-        if self.fit_intercept:
-            X = np.c_[np.atleast_2d(X)[:, :-ns], np.ones(X.shape[0])]
-        else:
-            X = np.atleast_2d(X)[:, :-ns]
+        X, s = split_sensitive(X, ns)
+        if self.fit_intercept and sp.issparse(X):
+            X = sp.hstack([X, np.ones((X.shape[0], 1))], format='csr')
+        elif self.fit_intercept:
+            X = np.c_[X, np.ones(X.shape[0])]
 
         # check optimization parameters
-        if not 'disp' in kwargs:
-            kwargs['disp'] = False
+        if method not in ('L-BFGS-B', 'CG'):
+            raise TypeError
         if not 'maxiter' in kwargs:
-            kwargs['maxiter'] = 100
+            kwargs['maxiter'] = 1000 if method == 'L-BFGS-B' else 100
+        kwargs.setdefault('gtol', 1.0e-7 * X.shape[0])
+        if method == 'L-BFGS-B':
+            kwargs.setdefault('ftol', 0.0)
 
         # set instance variables
         self.n_s_ = ns
         self.n_sfv_ = np.max(s) + 1
-        self.c_s_ = np.array([np.sum(s == si).astype(np.float)
+        self.c_s_ = np.array([np.sum(s == si).astype(np.float64)
                               for si in range(self.n_sfv_)])
         self.n_features_ = X.shape[1]
         self.n_samples_ = X.shape[0]
 
         # optimization
-        self.init_coef(itype, X, y, s)
-        self.coef_ = fmin_cg(self.loss,
-                             self.coef_,
-                             fprime=self.grad_loss,
-                             args=(X, y, s),
-                             **kwargs)
+        if coef_init is None:
+            self.init_coef(itype, X, y, s)
+        else:
+            self.coef_ = np.array(coef_init, dtype=np.float64).ravel()
+            if self.coef_.shape[0] != self.n_sfv_ * self.n_features_:
+                raise ValueError("coef_init should have n_sfv * n_features "
+                                 "elements")
+        scale = np.tile(column_scale(X), self.n_sfv_)
+
+        def scaled_loss_and_grad(coef_):
+            loss, grad = self.loss_and_grad(coef_ / scale, X, y, s)
+            return loss, grad / scale
+
+        res = minimize(scaled_loss_and_grad, self.coef_ * scale,
+                       method=method, jac=True, options=kwargs)
+        self.coef_ = res.x / scale
+
+        # convergence diagnostics and final loss; the gradient norm is checked
+        # as the optimizer may also stop when the loss stalls
+        self.optimize_result_ = res
+        self.n_iter_ = res.nit
+        self.grad_norm_ = float(np.max(np.abs(res.jac), initial=0.0))
+        self.converged_ = self.grad_norm_ <= kwargs['gtol']
+        self.f_loss_ = float(res.fun)
+        self._forward_cache = None
+        if not self.converged_:
+            warnings.warn("LRwPR optimization did not converge (eta=%g): "
+                          "gradient norm %.3g > gtol %g, %s"
+                          % (self.eta, self.grad_norm_, kwargs['gtol'],
+                             res.message), ConvergenceWarning)
+
+        return self
+
+    def fit_path(self, X, y, etas, ns=N_S, itype=0, **kwargs):
+        """ train a model for each fairness penalty along a path
+
+        The models are trained in the given order and each one starts from
+        the coefficients of the previous one, so a sorted sequence of nearby
+        etas costs little more than a single fit.
 
-        # get final loss
-        self.f_loss_ = self.loss(self.coef_, X, y, s)
+        Parameters
+        ----------
+        X : array or sparse matrix, shape = (n_samples, n_features)
+            feature vectors of samples
+        y : array, shape = (n_samples)
+            target class of samples
+        etas : list(float)
+            fairness penalty parameters
+        ns : int
+            number of sensitive features. currently fixed to N_S
+        itype : int
+            type of initialization method of the first model
+        kwargs : any
+            arguments to `fit`
+
+        Returns
+        -------
+        clrs : list
+            trained copies of this model, one per eta
+        """
+
+        clrs = []
+        coef = None
+        for eta in etas:
+            clr = clone(self).set_params(eta=eta)
+            clr.fit(X, y, ns, itype=itype, coef_init=coef, **kwargs)
+            coef = clr.coef_
+            clrs.append(clr)
+
+        return clrs
 
 class LRwPRObjetiveType4Mixin(LRwPR):
     """ objective function of logistic regression with prejudice remover
@@ -298,8 +477,43 @@ class LRwPRObjetiveType4Mixin(LRwPR):
     Loss Function type 4: Weights for logistic regression are prepared for each
     value of S. Penalty for enhancing is defined as mutual information between
     Y and S.
+
+    The sigmoid values and their per-group sums are computed once for each
+    coefficient vector and shared between `loss` and `grad_loss`.
     """
 
+    def forward(self, coef_, X, s):
+        """ sigmoids and their sums per sensitive value
+
+        Parameters
+        ----------
+        `coef_` : array, shape=(`n_sfv_` * n_features)
+            coefficients of model
+        X : array, shape=(n_samples, n_features)
+            feature vectors of samples
+        s : array, shape=(n_samples)
+            values of sensitive features
+
+        Returns
+        -------
+        p : array, shape=(n_samples)
+            sigma = Pr[y=0|x,s] = sigmoid(w(s)^T x)
+        sp : array, shape=(`n_sfv_`)
+            sums of sigma over the samples of each sensitive value
+        """
+
+        cache = getattr(self, '_forward_cache', None)
+        if cache is not None and cache[0] is X and cache[1] is s \
+                and np.array_equal(cache[2], coef_):
+            return cache[3], cache[4]
+
+        coef = coef_.reshape(self.n_sfv_, self.n_features_)
+        p = sigmoid_rows(X, coef, s)
+        sp = np.bincount(s, weights=p, minlength=self.n_sfv_)
+
+        self._forward_cache = (X, s, coef_.copy(), p, sp)
+        return p, sp
+
     def loss(self, coef_, X, y, s):
         """ loss function: negative log - likelihood with l2 regularizer
         To suppress the warnings at np.log, do "np.seterr(all='ignore')"
@@ -323,39 +537,35 @@ class LRwPRObjetiveType4Mixin(LRwPR):
 
         coef = coef_.reshape(self.n_sfv_, self.n_features_)
 
-#        print >> sys.stderr, "loss:", coef[0, :], coef[1, :]
-
         ### constants
 
         # sigma = Pr[y=0|x,s] = sigmoid(w(s)^T x)
-        p = np.array([sigmoid(X[i, :], coef[s[i], :])
-                      for i in range(self.n_samples_)])
+        p, sp = self.forward(coef_, X, s)
 
         # rho(s) = Pr[y=0|s] = \sum_{(xi,si)in D st si=s} sigma(xi,si) / #D[s]
-        q = np.array([np.sum(p[s == si])
-                      for si in range(self.n_sfv_)]) / self.c_s_
+        q = sp / self.c_s_
 
         # pi = Pr[y=0] = \sum_{(xi,si)in D} sigma(xi,si)
-        r = np.sum(p) / self.n_samples_
+        r = np.sum(sp) / X.shape[0]
 
         ### loss function
 
         # likelihood
         # \sum_{x,s,y in D} y log(sigma) + (1 - y) log(1 - sigma)
-        l = np.sum(y * np.log(p) + (1.0 - y) * np.log(1.0 - p))
+        l = np.dot(y, np.log(p)) + np.dot(1.0 - y, np.log(1.0 - p))
 
         # fairness-aware regularizer
         # \sum_{x,s in D} \
         #    sigma(x,x)       [log(rho(s))     - log(pi)    ] + \
         #    (1 - sigma(x,s)) [log(1 - rho(s)) - log(1 - pi)]
-        f = np.sum(p * (np.log(q[s]) - np.log(r))
-             + (1.0 - p) * (np.log(1.0 - q[s]) - np.log(1.0 - r)))
+        # the brackets only depend on s, so the sums of sigma per s suffice
+        f = np.sum(sp * (np.log(q) - np.log(r))
+                   + (self.c_s_ - sp) * (np.log(1.0 - q) - np.log(1.0 - r)))
 
         # l2 regularizer
         reg = np.sum(coef * coef)
 
         l = -l + self.eta * f + 0.5 * self.C * reg
-#        print >> sys.stderr, l
         return l
 
     def grad_loss(self, coef_, X, y, s):
@@ -378,68 +588,84 @@ class LRwPRObjetiveType4Mixin(LRwPR):
         """
 
         coef = coef_.reshape(self.n_sfv_, self.n_features_)
-        l_ = np.empty(self.n_sfv_ * self.n_features_)
-        l = l_.reshape(self.n_sfv_, self.n_features_)
-#        print >> sys.stderr, "grad_loss:", coef[0, :], coef[1, :]
+        n_samples = X.shape[0]
+        rows = np.arange(n_samples)
 
         ### constants
         # prefix "d_": derivertive by w(s)
 
         # sigma = Pr[y=0|x,s] = sigmoid(w(s)^T x)
         # d_sigma(x,s) = d sigma / d w(s) = sigma (1 - sigma) x
-        p = np.array([sigmoid(X[i, :], coef[s[i], :])
-                      for i in range(self.n_samples_)])
-        dp = (p * (1.0 - p))[:, np.newaxis] * X
+        p, sp = self.forward(coef_, X, s)
+
+        # all sums over the samples of each s of a scalar times x are taken by
+        # a single product of X with per-s masked columns:
+        # [ (y - sigma) for each si | sigma (1 - sigma) for each si ]
+        m = np.zeros((n_samples, 2 * self.n_sfv_))
+        m[rows, s] = y - p
+        m[rows, self.n_sfv_ + s] = p * (1.0 - p)
+        sums = X.T.dot(m).T
+        l = sums[:self.n_sfv_]
+        dp_sum = sums[self.n_sfv_:]
 
         # rho(s) = Pr[y=0|s] = \sum_{(xi,si)in D st si=s} sigma(xi,si) / #D[s]
-        # d_rho(s) = \sum_{(xi,si)in D st si=s} d_sigma(xi,si) / #D[s]
-        q = np.array([np.sum(p[s == si])
-                      for si in range(self.n_sfv_)]) / self.c_s_
-        dq = np.array([np.sum(dp[s == si, :], axis=0)
-                       for si in range(self.n_sfv_)]) \
-                       / self.c_s_[:, np.newaxis]
+        q = sp / self.c_s_
 
         # pi = Pr[y=0] = \sum_{(xi,si)in D} sigma(xi,si) / #D
-        # d_pi = \sum_{(xi,si)in D} d_sigma(xi,si) / #D
-        r = np.sum(p) / self.n_samples_
-        dr = np.sum(dp, axis=0) / self.n_samples_
+        r = np.sum(sp) / n_samples
 
         # likelihood
         # l(si) = \sum_{x,y in D st s=si} (y - sigma(x, si)) x
-        for si in range(self.n_sfv_):
-            l[si, :] = np.sum((y - p)[s == si][:, np.newaxis] * X[s == si, :],
-                              axis=0)
 
         # fairness-aware regularizer
-        # differentialy by w(s)
+        # differentialy by w(si)
         # \sum_{x,s in {D st s=si} \
         #     [(log(rho(si)) - log(pi)) - (log(1 - rho(si)) - log(1 - pi))] \
         #     * d_sigma
         # + \sum_{x,s in {D st s=si} \
         #     [ {sigma(xi, si) - rho(si)} / {rho(si) (1 - rho(si))} ] \
-        #     * d_rho
-        # - \sum_{x,s in {D st s=si} \
+        #     * d_rho(si)
+        # - \sum_{x,s in D} \
         #     [ {sigma(xi, si) - pi} / {pi (1 - pi)} ] \
         #     * d_pi
+        # the second and third sums vanish because rho(si) and pi are the
+        # means of sigma they are compared with, and the bracket of the first
+        # one only depends on si. (the original code summed the third term
+        # over D st s=si only, which made the gradient inconsistent with the
+        # loss and stalled the line searches of the optimizer.)
 
-        f1 = (np.log(q[s]) - np.log(r)) \
-             - (np.log(1.0 - q[s]) - np.log(1.0 - r))
-        f2 = (p - q[s]) / (q[s] * (1.0 - q[s]))
-        f3 = (p - r) / (r * (1.0 - r))
-        f4 = f1[:, np.newaxis] * dp \
-            + f2[:, np.newaxis] * dq[s, :] \
-            - np.outer(f3, dr)
-        f = np.array([np.sum(f4[s == si, :], axis=0)
-                      for si in range(self.n_sfv_)])
+        f1 = (np.log(q) - np.log(r)) - (np.log(1.0 - q) - np.log(1.0 - r))
+        f = f1[:, np.newaxis] * dp_sum
 
         # l2 regularizer
         reg = coef
 
         # sum
-        l[:, :] = -l + self.eta * f + self.C * reg
-#        print >> sys.stderr, "l =", l
+        return (-l + self.eta * f + self.C * reg).ravel()
+
+    def loss_and_grad(self, coef_, X, y, s):
+        """ loss function and its first derivative
+
+        Parameters
+        ----------
+        `coef_` : array, shape=(`n_sfv_` * n_features)
+            coefficients of model
+        X : array, shape=(n_samples, n_features)
+            feature vectors of samples
+        y : array, shape=(n_samples)
+            target class of samples
+        s : array, shape=(n_samples)
+            values of sensitive features
+
+        Returns
+        -------
+        loss : float
+            loss function value
+        grad_loss : array, shape=(`n_sfv_` * n_features)
+            first derivative of loss function
+        """
 
-        return l_
+        return self.loss(coef_, X, y, s), self.grad_loss(coef_, X, y, s)
 
 class LRwPRType4\
     (LRwPRObjetiveType4Mixin,
@@ -479,7 +705,7 @@ class LRwPRType4\
 
 logger = logging.getLogger('fadm')
 if not logger.handlers:
-    logger.addHandler(logging.NullHandler)
+    logger.addHandler(logging.NullHandler())
 
 #==============================================================================
 # Test routine
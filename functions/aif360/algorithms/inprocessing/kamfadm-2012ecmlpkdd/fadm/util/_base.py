@@ -126,7 +126,7 @@ def decode_nfv(nfvstr, nf):
 
 logger = logging.getLogger('fadm')
 if not logger.handlers:
-    logger.addHandler(logging.NullHandler)
+    logger.addHandler(logging.NullHandler())
 
 #==============================================================================
 # Test routine
@@ -52,8 +52,8 @@ class MetaFairClassifier(Transformer):
         sens_index = dataset.feature_names.index(self.sensitive_attr)
 
         x_train = dataset.features
-        y_train = np.array([1 if y == [dataset.favorable_label] else
-                           -1 for y in dataset.labels])
+        y_train = np.where(dataset.labels[:, 0] == dataset.favorable_label,
+                           1, -1)
         x_control_train = x_train[:, sens_index].copy()
 
         self.model = self.obj.getModel(self.tau, x_train, y_train,
@@ -72,14 +72,10 @@ class MetaFairClassifier(Transformer):
         Returns:
             BinaryLabelDataset: Transformed dataset.
         """
-        predictions, scores = [], []
-        for x in dataset.features:
-            t = self.model(x)
-            predictions.append(int(t > 0))
-            scores.append((t+1)/2)
+        t = self.model(dataset.features)
 
         pred_dataset = dataset.copy()
-        pred_dataset.labels = np.array([predictions]).T
-        pred_dataset.scores = np.array([scores]).T
+        pred_dataset.labels = (t > 0).astype(np.float64)[:, np.newaxis]
+        pred_dataset.scores = ((t + 1) / 2)[:, np.newaxis]
 
         return pred_dataset
@@ -27,6 +27,8 @@ Changes made to fairness-comparison code:
         - kamfadm-2012ecmlpkdd/train_nb.py
     * fixed typo in kamfadm-2012ecmlpkdd/fadm/lr/pr.py:244 (typeError -> TypeError)
     * removed commands.py and instead use subprocess.getoutput
+    * fit and predict call LRwPRType4 in-process on the dataset arrays instead
+      of running train_pr.py and predict_lr.py on temporary text files
 
 Notes from fairness-comparison's KamishimaAlgorithm.py on changes made to
 original Kamishima code.
@@ -66,19 +68,33 @@ of the original ECML paper code.
 
 See: changes-to-downloaded-code.diff and KamishimaAlgorithm.py for more details.
 """
-import numpy as np
-import pandas as pd
-import tempfile
 import os
-import subprocess
+import sys
+
+import numpy as np
+import scipy.sparse as sp
 
 from aif360.algorithms import Transformer
 
+# the Kamishima code lives in a directory that is not a valid package name, so
+# make its `fadm` package importable directly
+_KAMISHIMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'kamfadm-2012ecmlpkdd')
+if _KAMISHIMA_PATH not in sys.path:
+    sys.path.append(_KAMISHIMA_PATH)
+
+from fadm.lr.pr import LRwPRType4
+from fadm.util import fill_missing_with_mean
+
 
 class PrejudiceRemover(Transformer):
     """Prejudice remover is an in-processing technique that adds a
     discrimination-aware regularization term to the learning objective [6]_.
 
+    Datasets with sparse features (see
+    :meth:`~aif360.datasets.StructuredDataset.to_sparse`) are used without
+    densifying them.
+
     References:
         .. [6] T. Kamishima, S. Akaho, H. Asoh, and J. Sakuma, "Fairness-Aware
            Classifier with Prejudice Remover Regularizer," Joint European
@@ -100,23 +116,41 @@ class PrejudiceRemover(Transformer):
         self.sensitive_attr = sensitive_attr
         self.class_attr = class_attr
 
-    def _create_file_in_kamishima_format(self, df, class_attr,
-                                         positive_class_val, sensitive_attrs,
-                                         single_sensitive, privileged_vals):
-        """Format the data for the Kamishima code and save it."""
-        x = []
-        for col in df:
-            if col != class_attr and col not in sensitive_attrs:
-                x.append(np.array(df[col].values, dtype=np.float64))
-        x.append(np.array(single_sensitive.isin(privileged_vals),
-                          dtype=np.float64))
-        x.append(np.array(df[class_attr] == positive_class_val,
-                          dtype=np.float64))
-
-        fd, name = tempfile.mkstemp()
-        os.close(fd)
-        np.savetxt(name, np.array(x).T)
-        return name
+    def _set_attrs(self, dataset):
+        all_sensitive_attributes = dataset.protected_attribute_names
+
+        if not self.sensitive_attr:
+            self.sensitive_attr = all_sensitive_attributes[0]
+        self.sensitive_ind = all_sensitive_attributes.index(self.sensitive_attr)
+
+        if not self.class_attr:
+            self.class_attr = dataset.label_names[0]
+
+    def _kamishima_format(self, dataset):
+        """Arrange the data as expected by the Kamishima code: non-sensitive
+        features followed by the binary sensitive feature, and binary labels.
+        Sparse features give a CSR matrix.
+        """
+        keep = [i for i, name in enumerate(dataset.feature_names)
+                if name not in dataset.protected_attribute_names]
+        sens = dataset.protected_attributes[:, self.sensitive_ind]
+        privileged_vals = dataset.privileged_protected_attributes[
+            self.sensitive_ind]
+        sens = np.isin(sens, privileged_vals).astype(np.float64)
+
+        if sp.issparse(dataset.features):
+            X = sp.hstack([dataset.features[:, keep], sens[:, np.newaxis]],
+                          format='csr')
+        else:
+            X = np.empty((dataset.features.shape[0], len(keep) + 1))
+            X[:, :-1] = dataset.features[:, keep]
+            X[:, -1] = sens
+            X = fill_missing_with_mean(X)
+
+        class_ind = dataset.label_names.index(self.class_attr)
+        y = (dataset.labels[:, class_ind] == dataset.favorable_label).astype(
+            np.float64)
+        return X, y
 
     def fit(self, dataset):
         """Learns the regularized logistic regression model.
@@ -127,45 +161,45 @@ class PrejudiceRemover(Transformer):
         Returns:
             PrejudiceRemover: Returns self.
         """
-        data = np.column_stack([dataset.features, dataset.labels])
-        columns = dataset.feature_names + dataset.label_names
-        train_df = pd.DataFrame(data=data, columns=columns)
+        self._set_attrs(dataset)
+        X, y = self._kamishima_format(dataset)
 
-        all_sensitive_attributes = dataset.protected_attribute_names
+        # same settings as train_pr.py: C=1, one sensitive feature and
+        # coefficients initialized by a standard LR per sensitive value
+        self.model = LRwPRType4(eta=self.eta, C=1.0)
+        with np.errstate(all='ignore'):
+            self.model.fit(X, y, 1, itype=3)
 
-        if not self.sensitive_attr:
-            self.sensitive_attr = all_sensitive_attributes[0]
-        self.sensitive_ind = all_sensitive_attributes.index(self.sensitive_attr)
+        return self
 
-        sens_df = pd.Series(dataset.protected_attributes[:, self.sensitive_ind],
-                            name=self.sensitive_attr)
+    def fit_path(self, dataset, etas):
+        """Learns one model per fairness penalty, starting each fit from the
+        solution of the previous eta.
 
-        if not self.class_attr:
-            self.class_attr = dataset.label_names[0]
+        Args:
+            dataset (BinaryLabelDataset): Dataset containing true labels.
+            etas (list(float)): Fairness penalty parameters, preferably
+                sorted.
 
-        fd, model_name = tempfile.mkstemp()
-        os.close(fd)
-        train_name = self._create_file_in_kamishima_format(train_df,
-                self.class_attr, dataset.favorable_label,
-                all_sensitive_attributes, sens_df,
-                dataset.privileged_protected_attributes[self.sensitive_ind])
-        # ADDED FOLLOWING LINE to get absolute path of this file, i.e.
-        # prejudice_remover.py
-        k_path = os.path.dirname(os.path.abspath(__file__))
-        train_pr = os.path.join(k_path, 'kamfadm-2012ecmlpkdd', 'train_pr.py')
-        # changed paths in the calls below to (a) specify path of train_pr,
-        # predict_lr RELATIVE to this file, and (b) compute & use absolute path
-        #  and (c) replace python3 with python
-        subprocess.call(['python', train_pr,
-                         '-e', str(self.eta),
-                         '-i', train_name,
-                         '-o', model_name,
-                         '--quiet'])
-        os.unlink(train_name)
-
-        self.model_name = model_name
+        Returns:
+            list(PrejudiceRemover): A fitted prejudice remover per eta.
+        """
+        self._set_attrs(dataset)
+        X, y = self._kamishima_format(dataset)
 
-        return self
+        with np.errstate(all='ignore'):
+            models = LRwPRType4(C=1.0).fit_path(X, y, etas, 1, itype=3)
+
+        removers = []
+        for eta, model in zip(etas, models):
+            remover = PrejudiceRemover(eta=eta,
+                                       sensitive_attr=self.sensitive_attr,
+                                       class_attr=self.class_attr)
+            remover.sensitive_ind = self.sensitive_ind
+            remover.model = model
+            removers.append(remover)
+
+        return removers
 
     def predict(self, dataset):
         """Obtain the predictions for the provided dataset using the learned
@@ -177,44 +211,15 @@ class PrejudiceRemover(Transformer):
         Returns:
             dataset (BinaryLabelDataset): Transformed dataset.
         """
-        data = np.column_stack([dataset.features, dataset.labels])
-        columns = dataset.feature_names + dataset.label_names
-        test_df = pd.DataFrame(data=data, columns=columns)
-        sens_df = pd.Series(dataset.protected_attributes[:, self.sensitive_ind],
-                            name=self.sensitive_attr)
-
-        fd, output_name = tempfile.mkstemp()
-        os.close(fd)
-
-        test_name = self._create_file_in_kamishima_format(test_df,
-                self.class_attr, dataset.favorable_label,
-                dataset.protected_attribute_names, sens_df,
-                dataset.privileged_protected_attributes[self.sensitive_ind])
-
-        # ADDED FOLLOWING LINE to get absolute path of this file, i.e.
-        # prejudice_remover.py
-        k_path = os.path.dirname(os.path.abspath(__file__))
-        predict_lr = os.path.join(k_path, 'kamfadm-2012ecmlpkdd', 'predict_lr.py')
-        # changed paths in the calls below to (a) specify path of train_pr,
-        # predict_lr RELATIVE to this file, and (b) compute & use absolute path,
-        # and (c) replace python3 with python
-        subprocess.call(['python', predict_lr,
-                         '-i', test_name,
-                         '-m', self.model_name,
-                         '-o', output_name,
-                         '--quiet'])
-        os.unlink(test_name)
-        m = np.loadtxt(output_name)
-        os.unlink(output_name)
+        X, _ = self._kamishima_format(dataset)
+        with np.errstate(all='ignore'):
+            proba = self.model.predict_proba(X)
 
         pred_dataset = dataset.copy()
-        # Columns of Outputs: (as per Kamishima implementation predict_lr.py)
-        # 0. true sample class number
-        # 1. predicted class number
-        # 2. sensitive feature
-        # 3. class 0 probability
-        # 4. class 1 probability
-        pred_dataset.labels = m[:, [1]]
-        pred_dataset.scores = m[:, [4]]
+        # predicted class number and class 1 probability, as written by
+        # predict_lr.py
+        pred_dataset.labels = np.argmax(proba, axis=1)[:, np.newaxis].astype(
+            np.float64)
+        pred_dataset.scores = proba[:, [1]]
 
         return pred_dataset
@@ -31,7 +31,7 @@
 import numpy as np
 
 from aif360.algorithms import Transformer
-from aif360.metrics import ClassificationMetric, utils
+from aif360.metrics import utils
 
 
 class CalibratedEqOddsPostprocessing(Transformer):
@@ -89,6 +89,12 @@ class CalibratedEqOddsPostprocessing(Transformer):
         """Compute parameters for equalizing generalized odds using true and
         predicted scores, while preserving calibration.
 
+        The generalized false positive and negative rates of both groups are
+        obtained in one grouped pass. The costs of the "trivial" classifier,
+        which predicts each group's base rate as its score, are computed in
+        closed form: its generalized false positive rate equals the base rate
+        and its generalized false negative rate equals one minus it.
+
         Args:
             dataset_true (BinaryLabelDataset): Dataset containing true `labels`.
             dataset_pred (BinaryLabelDataset): Dataset containing predicted
@@ -97,48 +103,34 @@ class CalibratedEqOddsPostprocessing(Transformer):
         Returns:
             CalibratedEqOddsPostprocessing: Returns self.
         """
+        _check_datasets(dataset_true, dataset_pred)
+        group = self._group_index(dataset_pred)
 
-        # Create boolean conditioning vectors for protected groups
-        cond_vec_priv = utils.compute_boolean_conditioning_vector(
-            dataset_pred.protected_attributes,
-            dataset_pred.protected_attribute_names,
-            self.privileged_groups)
-        cond_vec_unpriv = utils.compute_boolean_conditioning_vector(
-            dataset_pred.protected_attributes,
-            dataset_pred.protected_attribute_names,
-            self.unprivileged_groups)
-
-        cm = ClassificationMetric(dataset_true, dataset_pred,
-                                  unprivileged_groups=self.unprivileged_groups,
-                                  privileged_groups=self.privileged_groups)
-        self.base_rate_priv = cm.base_rate(privileged=True)
-        self.base_rate_unpriv = cm.base_rate(privileged=False)
-
-        # Create a dataset with "trivial" predictions
-        dataset_trivial = dataset_pred.copy(deepcopy=True)
-        dataset_trivial.scores[cond_vec_priv] = cm.base_rate(privileged=True)
-        dataset_trivial.scores[cond_vec_unpriv] = cm.base_rate(privileged=False)
-        cm_triv = ClassificationMetric(dataset_true, dataset_trivial,
-            unprivileged_groups=self.unprivileged_groups,
-            privileged_groups=self.privileged_groups)
+        # instance weights and weighted scores per (group, true label)
+        index = (group % 3) * 2 + np.ravel(
+            dataset_true.labels == dataset_true.favorable_label)
+        w = dataset_pred.instance_weights.ravel()
+        weights = np.bincount(index, weights=w, minlength=6).reshape(3, 2)[:2]
+        scores = np.bincount(index, weights=w * dataset_pred.scores.ravel(),
+                             minlength=6).reshape(3, 2)[:2]
 
-        if self.fn_rate == 0:
-            priv_cost = cm.generalized_false_positive_rate(privileged=True)
-            unpriv_cost = cm.generalized_false_positive_rate(privileged=False)
-            priv_trivial_cost = cm_triv.generalized_false_positive_rate(privileged=True)
-            unpriv_trivial_cost = cm_triv.generalized_false_positive_rate(privileged=False)
+        neg, pos = weights[:, 0], weights[:, 1]
+        base_rate = pos / (pos + neg)
+        gfpr = scores[:, 0] / neg
+        gfnr = (pos - scores[:, 1]) / pos
+        self.base_rate_priv, self.base_rate_unpriv = base_rate
 
+        if self.fn_rate == 0:
+            cost, trivial_cost = gfpr, base_rate
         elif self.fp_rate == 0:
-            priv_cost = cm.generalized_false_negative_rate(privileged=True)
-            unpriv_cost = cm.generalized_false_negative_rate(privileged=False)
-            priv_trivial_cost = cm_triv.generalized_false_negative_rate(privileged=True)
-            unpriv_trivial_cost = cm_triv.generalized_false_negative_rate(privileged=False)
-
+            cost, trivial_cost = gfnr, 1 - base_rate
         else:
-            priv_cost = weighted_cost(self.fp_rate, self.fn_rate, cm, privileged=True)
-            unpriv_cost = weighted_cost(self.fp_rate, self.fn_rate, cm, privileged=False)
-            priv_trivial_cost = weighted_cost(self.fp_rate, self.fn_rate, cm_triv, privileged=True)
-            unpriv_trivial_cost = weighted_cost(self.fp_rate, self.fn_rate, cm_triv, privileged=False)
+            cost = _weighted_cost(self.fp_rate, self.fn_rate, gfpr, gfnr,
+                                  base_rate)
+            trivial_cost = _weighted_cost(self.fp_rate, self.fn_rate,
+                                          base_rate, 1 - base_rate, base_rate)
+        priv_cost, unpriv_cost = cost
+        priv_trivial_cost, unpriv_trivial_cost = trivial_cost
 
         unpriv_costs_more = unpriv_cost > priv_cost
         self.priv_mix_rate = (unpriv_cost - priv_cost) / (priv_trivial_cost - priv_cost) if unpriv_costs_more else 0
@@ -150,6 +142,10 @@ class CalibratedEqOddsPostprocessing(Transformer):
         """Perturb the predicted scores to obtain new labels that satisfy
         equalized odds constraints, while preserving calibration.
 
+        Instances outside the privileged and unprivileged groups keep their
+        scores. The returned dataset shares all fields except `scores` and
+        `labels` with `dataset`.
+
         Args:
             dataset (BinaryLabelDataset): Dataset containing `scores` that needs
                 to be transformed.
@@ -159,33 +155,8 @@ class CalibratedEqOddsPostprocessing(Transformer):
         Returns:
             dataset (BinaryLabelDataset): transformed dataset.
         """
-        if self.seed is not None:
-            np.random.seed(self.seed)
-
-        cond_vec_priv = utils.compute_boolean_conditioning_vector(
-            dataset.protected_attributes,
-            dataset.protected_attribute_names,
-            self.privileged_groups)
-        cond_vec_unpriv = utils.compute_boolean_conditioning_vector(
-            dataset.protected_attributes,
-            dataset.protected_attribute_names,
-            self.unprivileged_groups)
-
-        priv_indices = (np.random.random(sum(cond_vec_priv))
-                     <= self.priv_mix_rate)
-        priv_new_pred = dataset.scores[cond_vec_priv].copy()
-        priv_new_pred[priv_indices] = self.base_rate_priv
-
-        unpriv_indices = (np.random.random(sum(cond_vec_unpriv))
-                       <= self.unpriv_mix_rate)
-        unpriv_new_pred = dataset.scores[cond_vec_unpriv].copy()
-        unpriv_new_pred[unpriv_indices] = self.base_rate_unpriv
-
-        dataset_new = dataset.copy(deepcopy=True)
-
-        dataset_new.scores = np.zeros_like(dataset.scores, dtype=np.float64)
-        dataset_new.scores[cond_vec_priv] = priv_new_pred
-        dataset_new.scores[cond_vec_unpriv] = unpriv_new_pred
+        dataset_new = dataset.copy()
+        dataset_new.scores = self._mix_scores(dataset)
 
         # Create labels from scores using a default threshold
         dataset_new.labels = np.where(dataset_new.scores >= threshold,
@@ -193,6 +164,93 @@ class CalibratedEqOddsPostprocessing(Transformer):
                                       dataset_new.unfavorable_label)
         return dataset_new
 
+    def sweep_thresholds(self, dataset_true, dataset_pred, thresholds,
+                         amounts=None, r=0.2644, loss_given_default=0.275):
+        """Evaluate the mixed predictions for many thresholds at once.
+
+        Scores are mixed once, as in `predict`, and sorted within each
+        (group, true label) cell. The instance-weighted confusion counts for
+        every threshold then follow from cumulative sums, without creating a
+        dataset per threshold.
+
+        Args:
+            dataset_true (BinaryLabelDataset): Dataset containing true `labels`.
+            dataset_pred (BinaryLabelDataset): Dataset containing predicted
+                `scores`.
+            thresholds (array-like): Thresholds for converting `scores` to
+                `labels`; scores greater than or equal to a threshold are
+                predicted to be the `favorable_label`.
+            amounts (numpy.ndarray or str, optional): Loan amounts, or the name
+                of the feature holding them. If given, the profit of each
+                threshold is returned as well.
+            r (float, optional): Total interest rate earned on a repaid loan.
+            loss_given_default (float, optional): Share of the amount lost on a
+                defaulted loan.
+
+        Returns:
+            dict: `'thresholds'`; `'counts'`, an array of shape
+            `(len(thresholds), 3, 2, 2)` with the weighted number of instances
+            per threshold, group (privileged, unprivileged, other), predicted
+            label and true label (0 = unfavorable, 1 = favorable); and
+            `'profit'` if `amounts` is given.
+        """
+        _check_datasets(dataset_true, dataset_pred)
+        thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+        scores = self._mix_scores(dataset_pred).ravel()
+        cell = (self._group_index(dataset_pred) % 3) * 2 + np.ravel(
+            dataset_true.labels == dataset_true.favorable_label)
+        w = dataset_pred.instance_weights.ravel()
+        if isinstance(amounts, str):
+            amounts = dataset_pred.features[:,
+                dataset_pred.feature_names.index(amounts)]
+
+        # weight (and amount) of each cell scored at or above each threshold
+        counts = np.zeros((len(thresholds), 3, 2, 2))
+        accepted_amounts = np.zeros((len(thresholds), 2))
+        total_amounts = np.zeros(2)
+        for c in range(6):
+            in_cell = cell == c
+            order = np.argsort(scores[in_cell])
+            cell_scores = scores[in_cell][order]
+            cum_w = np.concatenate([[0.], np.cumsum(w[in_cell][order])])
+            below = np.searchsorted(cell_scores, thresholds, side='left')
+            g, y = divmod(c, 2)
+            counts[:, g, 1, y] = cum_w[-1] - cum_w[below]
+            counts[:, g, 0, y] = cum_w[below]
+            if amounts is not None:
+                cum_a = np.concatenate([[0.], np.cumsum(
+                    (w * amounts)[in_cell][order])])
+                accepted_amounts[:, y] += cum_a[-1] - cum_a[below]
+                total_amounts[y] += cum_a[-1]
+
+        result = {'thresholds': thresholds, 'counts': counts}
+        if amounts is not None:
+            # repaid loans earn interest, defaults lose part of the amount and
+            # rejected good applicants are counted as lost interest
+            result['profit'] = (r * accepted_amounts[:, 1]
+                - loss_given_default * accepted_amounts[:, 0]
+                - r * (total_amounts[1] - accepted_amounts[:, 1]))
+        return result
+
+    def _group_index(self, dataset):
+        """0 for privileged, 1 for unprivileged and -1 for other instances."""
+        return utils.compute_group_index(dataset.protected_attributes,
+            dataset.protected_attribute_names,
+            [self.privileged_groups, self.unprivileged_groups])
+
+    def _mix_scores(self, dataset):
+        """Replace each group's scores by its base rate with the group's mixing
+        probability, drawing one uniform number per instance."""
+        rng = np.random.default_rng(self.seed)
+        group = self._group_index(dataset)
+        mix_rate = np.array([self.priv_mix_rate, self.unpriv_mix_rate, 0.])
+        base_rate = np.array([self.base_rate_priv, self.base_rate_unpriv, 0.])
+
+        scores = dataset.scores.ravel()
+        mixed = rng.random(scores.shape[0]) <= mix_rate[group]
+        return np.where(mixed, base_rate[group], scores).reshape(
+            dataset.scores.shape)
+
     def fit_predict(self, dataset_true, dataset_pred, threshold=0.5):
         """fit and predict methods sequentially."""
         return self.fit(dataset_true, dataset_pred).predict(
@@ -200,12 +258,23 @@ class CalibratedEqOddsPostprocessing(Transformer):
 
 ######### SUPPORTING FUNCTIONS ##########
 
-def weighted_cost(fp_rate, fn_rate, cm, privileged):
+def _check_datasets(dataset_true, dataset_pred):
+    """Verify that the datasets differ only in their predictions, as
+    :class:`~aif360.metrics.ClassificationMetric` does."""
+    with dataset_true.temporarily_ignore('labels', 'scores'):
+        if dataset_true != dataset_pred:
+            raise ValueError("The two datasets are expected to differ only "
+                             "in 'labels' or 'scores'.")
+
+
+def _weighted_cost(fp_rate, fn_rate, gfpr, gfnr, base_rate):
     norm_const = float(fp_rate + fn_rate) if\
                       (fp_rate != 0 and fn_rate != 0) else 1
-    return ((fp_rate / norm_const
-            * cm.generalized_false_positive_rate(privileged=privileged)
-            * (1 - cm.base_rate(privileged=privileged))) +
-           (fn_rate / norm_const
-            * cm.generalized_false_negative_rate(privileged=privileged)
-            * (1 - cm.base_rate(privileged=privileged))))
+    return ((fp_rate / norm_const * gfpr * (1 - base_rate)) +
+            (fn_rate / norm_const * gfnr * (1 - base_rate)))
+
+def weighted_cost(fp_rate, fn_rate, cm, privileged):
+    return _weighted_cost(fp_rate, fn_rate,
+        cm.generalized_false_positive_rate(privileged=privileged),
+        cm.generalized_false_negative_rate(privileged=privileged),
+        cm.base_rate(privileged=privileged))
@@ -28,11 +28,14 @@
 # under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
 # CONDITIONS OF ANY KIND, either express or implied. See the License for the
 # specific language governing permissions and limitations under the License.
+from functools import lru_cache
+
 import numpy as np
-from scipy.optimize import linprog
+import scipy.sparse as sp
+from scipy.optimize import OptimizeResult, linprog
 
 from aif360.algorithms import Transformer
-from aif360.metrics import ClassificationMetric, utils
+from aif360.metrics import utils
 
 
 class EqOddsPostprocessing(Transformer):
@@ -72,6 +75,10 @@ class EqOddsPostprocessing(Transformer):
         """Compute parameters for equalizing odds using true and predicted
         labels.
 
+        The linear program only depends on the instance-weighted confusion
+        matrices of the privileged and unprivileged groups, which are
+        computed in one grouped pass. Solutions are cached per count table.
+
         Args:
             true_dataset (BinaryLabelDataset): Dataset containing true labels.
             pred_dataset (BinaryLabelDataset): Dataset containing predicted
@@ -80,178 +87,173 @@ class EqOddsPostprocessing(Transformer):
         Returns:
             EqOddsPostprocessing: Returns self.
         """
-        metric = ClassificationMetric(dataset_true, dataset_pred,
-            unprivileged_groups=self.unprivileged_groups,
-            privileged_groups=self.privileged_groups)
-
-        # compute basic statistics
-        sbr = metric.num_instances(privileged=True) / metric.num_instances()
-        obr = metric.num_instances(privileged=False) / metric.num_instances()
-
-        fpr0 = metric.false_positive_rate(privileged=True)
-        fpr1 = metric.false_positive_rate(privileged=False)
-        fnr0 = metric.false_negative_rate(privileged=True)
-        fnr1 = metric.false_negative_rate(privileged=False)
-        tpr0 = metric.true_positive_rate(privileged=True)
-        tpr1 = metric.true_positive_rate(privileged=False)
-        tnr0 = metric.true_negative_rate(privileged=True)
-        tnr1 = metric.true_negative_rate(privileged=False)
-
-        # linear program has 4 decision variables:
-        # [Pr[label_tilde = 1 | label_hat = 1, protected_attributes = 0];
-        #  Pr[label_tilde = 1 | label_hat = 0, protected_attributes = 0];
-        #  Pr[label_tilde = 1 | label_hat = 1, protected_attributes = 1];
-        #  Pr[label_tilde = 1 | label_hat = 0, protected_attributes = 1]]
-        # Coefficients of the linear objective function to be minimized.
-        c = np.array([fpr0 - tpr0, tnr0 - fnr0, fpr1 - tpr1, tnr1 - fnr1])
-
-        # A_ub - 2-D array which, when matrix-multiplied by x, gives the values
-        # of the upper-bound inequality constraints at x
-        # b_ub - 1-D array of values representing the upper-bound of each
-        # inequality constraint (row) in A_ub.
-        # Just to keep these between zero and one
-        A_ub = np.array([[ 1,  0,  0,  0],
-                         [-1,  0,  0,  0],
-                         [ 0,  1,  0,  0],
-                         [ 0, -1,  0,  0],
-                         [ 0,  0,  1,  0],
-                         [ 0,  0, -1,  0],
-                         [ 0,  0,  0,  1],
-                         [ 0,  0,  0, -1]], dtype=np.float64)
-        b_ub = np.array([1, 0, 1, 0, 1, 0, 1, 0], dtype=np.float64)
-
-        # Create boolean conditioning vectors for protected groups
-        cond_vec_priv = utils.compute_boolean_conditioning_vector(
-            dataset_pred.protected_attributes,
-            dataset_pred.protected_attribute_names,
-            self.privileged_groups)
-        cond_vec_unpriv = utils.compute_boolean_conditioning_vector(
-            dataset_pred.protected_attributes,
-            dataset_pred.protected_attribute_names,
-            self.unprivileged_groups)
-
-        sconst = np.ravel(
-            dataset_pred.labels[cond_vec_priv] == dataset_pred.favorable_label)
-        sflip = np.ravel(
-            dataset_pred.labels[cond_vec_priv] == dataset_pred.unfavorable_label)
-        oconst = np.ravel(
-            dataset_pred.labels[cond_vec_unpriv] == dataset_pred.favorable_label)
-        oflip = np.ravel(
-            dataset_pred.labels[cond_vec_unpriv] == dataset_pred.unfavorable_label)
-
-        y_true = dataset_true.labels.ravel()
-
-        sm_tn = np.logical_and(sflip,
-            y_true[cond_vec_priv] == dataset_true.unfavorable_label,
-            dtype=np.float64)
-        sm_fn = np.logical_and(sflip,
-            y_true[cond_vec_priv] == dataset_true.favorable_label,
-            dtype=np.float64)
-        sm_fp = np.logical_and(sconst,
-            y_true[cond_vec_priv] == dataset_true.unfavorable_label,
-            dtype=np.float64)
-        sm_tp = np.logical_and(sconst,
-            y_true[cond_vec_priv] == dataset_true.favorable_label,
-            dtype=np.float64)
-
-        om_tn = np.logical_and(oflip,
-            y_true[cond_vec_unpriv] == dataset_true.unfavorable_label,
-            dtype=np.float64)
-        om_fn = np.logical_and(oflip,
-            y_true[cond_vec_unpriv] == dataset_true.favorable_label,
-            dtype=np.float64)
-        om_fp = np.logical_and(oconst,
-            y_true[cond_vec_unpriv] == dataset_true.unfavorable_label,
-            dtype=np.float64)
-        om_tp = np.logical_and(oconst,
-            y_true[cond_vec_unpriv] == dataset_true.favorable_label,
-            dtype=np.float64)
-
-        # A_eq - 2-D array which, when matrix-multiplied by x,
-        # gives the values of the equality constraints at x
-        # b_eq - 1-D array of values representing the RHS of each equality
-        # constraint (row) in A_eq.
-        # Used to impose equality of odds constraint
-        A_eq = [[(np.mean(sconst*sm_tp) - np.mean(sflip*sm_tp)) / sbr,
-                 (np.mean(sflip*sm_fn) - np.mean(sconst*sm_fn)) / sbr,
-                 (np.mean(oflip*om_tp) - np.mean(oconst*om_tp)) / obr,
-                 (np.mean(oconst*om_fn) - np.mean(oflip*om_fn)) / obr],
-                [(np.mean(sconst*sm_fp) - np.mean(sflip*sm_fp)) / (1-sbr),
-                 (np.mean(sflip*sm_tn) - np.mean(sconst*sm_tn)) / (1-sbr),
-                 (np.mean(oflip*om_fp) - np.mean(oconst*om_fp)) / (1-obr),
-                 (np.mean(oconst*om_tn) - np.mean(oflip*om_tn)) / (1-obr)]]
-
-        b_eq = [(np.mean(oflip*om_tp) + np.mean(oconst*om_fn)) / obr
-              - (np.mean(sflip*sm_tp) + np.mean(sconst*sm_fn)) / sbr,
-                (np.mean(oflip*om_fp) + np.mean(oconst*om_tn)) / (1-obr)
-              - (np.mean(sflip*sm_fp) + np.mean(sconst*sm_tn)) / (1-sbr)]
-
-        # Linear program
-        self.model_params = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq)
+        counts = self._confusion_counts(dataset_true, dataset_pred)
+        x, fun, status, message = _solve_cached(tuple(counts.ravel()))
+        self.model_params = OptimizeResult(
+            x=None if x is None else np.array(x), fun=fun, status=status,
+            success=status == 0, message=message)
 
         return self
 
+    @classmethod
+    def fit_multiple(cls, dataset_pairs, unprivileged_groups,
+                     privileged_groups, seed=None):
+        """Fit one postprocessor per (true, predicted) dataset pair, e.g. per
+        cross-validation fold, solving all linear programs in a single batched
+        call.
+
+        Args:
+            dataset_pairs (list(tuple)): Pairs of
+                (BinaryLabelDataset, BinaryLabelDataset) with true and
+                predicted labels.
+            unprivileged_groups (list(dict)): Representation for unprivileged
+                group.
+            privileged_groups (list(dict)): Representation for privileged
+                group.
+            seed (int, optional): Seed to make `predict` repeatable.
+
+        Returns:
+            list(EqOddsPostprocessing): Fitted postprocessors in the order of
+            `dataset_pairs`.
+        """
+        models = [cls(unprivileged_groups, privileged_groups, seed=seed)
+                  for _ in dataset_pairs]
+        counts = [model._confusion_counts(dataset_true, dataset_pred)
+                  for model, (dataset_true, dataset_pred)
+                  in zip(models, dataset_pairs)]
+        for model, params in zip(models, _solve_batch(counts)):
+            model.model_params = params
+        return models
+
+    def _confusion_counts(self, dataset_true, dataset_pred):
+        """Instance-weighted counts indexed by (group, predicted label, true
+        label), with labels coded 0 = unfavorable and 1 = favorable and a
+        final group row for instances outside both groups."""
+        group = self._group_index(dataset_pred)
+        y_pred = np.ravel(dataset_pred.labels == dataset_pred.favorable_label)
+        y_true = np.ravel(dataset_true.labels == dataset_true.favorable_label)
+        num_groups = len(self._groups()) + 1
+        return np.bincount((group % num_groups) * 4 + y_pred * 2 + y_true,
+                           weights=dataset_pred.instance_weights,
+                           minlength=num_groups * 4).reshape(num_groups, 2, 2)
+
     def predict(self, dataset):
         """Perturb the predicted labels to obtain new labels that satisfy
         equalized odds constraints.
 
+        Labels are mixed in a single vectorized pass: each row is looked up in
+        a (group x predicted label) table of probabilities of receiving the
+        favorable label. Rows outside the privileged and unprivileged groups
+        keep their predicted labels.
+
         Args:
             dataset (BinaryLabelDataset): Dataset containing labels that needs
                 to be transformed.
             dataset (BinaryLabelDataset): Transformed dataset.
         """
-        if self.seed is not None:
-            np.random.seed(self.seed)
-
-        # Get the model parameters output from fit
-        sp2p, sn2p, op2p, on2p = self.model_params.x
-
-        # Create boolean conditioning vectors for protected groups
-        cond_vec_priv = utils.compute_boolean_conditioning_vector(
-            dataset.protected_attributes, dataset.protected_attribute_names,
-            self.privileged_groups)
-        cond_vec_unpriv = utils.compute_boolean_conditioning_vector(
-            dataset.protected_attributes, dataset.protected_attribute_names,
-            self.unprivileged_groups)
-
-        # Randomly flip labels according to the probabilities in model_params
-        self_fair_pred = dataset.labels[cond_vec_priv].copy()
-        self_pp_indices, _ = np.nonzero(
-            dataset.labels[cond_vec_priv] == dataset.favorable_label)
-        self_pn_indices, _ = np.nonzero(
-            dataset.labels[cond_vec_priv] == dataset.unfavorable_label)
-        np.random.shuffle(self_pp_indices)
-        np.random.shuffle(self_pn_indices)
-
-        n2p_indices = self_pn_indices[:int(len(self_pn_indices) * sn2p)]
-        self_fair_pred[n2p_indices] = dataset.favorable_label
-        p2n_indices = self_pp_indices[:int(len(self_pp_indices) * (1 - sp2p))]
-        self_fair_pred[p2n_indices] = dataset.unfavorable_label
-
-        othr_fair_pred = dataset.labels[cond_vec_unpriv].copy()
-        othr_pp_indices, _ = np.nonzero(
-            dataset.labels[cond_vec_unpriv] == dataset.favorable_label)
-        othr_pn_indices, _ = np.nonzero(
-            dataset.labels[cond_vec_unpriv] == dataset.unfavorable_label)
-        np.random.shuffle(othr_pp_indices)
-        np.random.shuffle(othr_pn_indices)
-
-        n2p_indices = othr_pn_indices[:int(len(othr_pn_indices) * on2p)]
-        othr_fair_pred[n2p_indices] = dataset.favorable_label
-        p2n_indices = othr_pp_indices[:int(len(othr_pp_indices) * (1 - op2p))]
-        othr_fair_pred[p2n_indices] = dataset.unfavorable_label
+        rng = np.random.default_rng(self.seed)
+
+        # Pr[label_tilde = 1 | label_hat, group] with one row per group in
+        # `self._groups()`, columns indexed by label_hat (0 = unfavorable)
+        # and a final row that keeps the labels of all remaining instances
+        mix_table = np.vstack([self.model_params.x.reshape(-1, 2)[:, ::-1],
+                               [0., 1.]])
+        group = self._group_index(dataset)
+
+        favorable = np.ravel(dataset.labels == dataset.favorable_label)
+        favorable_prob = mix_table[group, favorable.astype(np.intp)]
+        new_labels = np.where(rng.random(favorable.shape[0]) < favorable_prob,
+                              dataset.favorable_label, dataset.unfavorable_label)
 
         # Mutated, fairer dataset with new labels
         dataset_new = dataset.copy()
+        dataset_new.labels = new_labels.reshape(dataset.labels.shape)
 
-        new_labels = np.zeros_like(dataset.labels, dtype=np.float64)
-        new_labels[cond_vec_priv] = self_fair_pred
-        new_labels[cond_vec_unpriv] = othr_fair_pred
+        return dataset_new
 
-        dataset_new.labels = new_labels
+    def _groups(self):
+        """Group definitions in the order of the decision variables."""
+        return [self.privileged_groups, self.unprivileged_groups]
 
-        return dataset_new
+    def _group_index(self, dataset):
+        """Index of each instance's group in `self._groups()`, or -1 if it
+        belongs to none of them."""
+        return utils.compute_group_index(dataset.protected_attributes,
+            dataset.protected_attribute_names, self._groups())
 
     def fit_predict(self, dataset_true, dataset_pred):
         """fit and predict methods sequentially."""
         return self.fit(dataset_true, dataset_pred).predict(dataset_pred)
+
+
+def _linear_program(counts):
+    """Objective and equality constraints of the equalized odds LP.
+
+    Args:
+        counts (numpy.ndarray): Weighted counts indexed by (group, predicted
+            label, true label), see `EqOddsPostprocessing._confusion_counts`.
+            Group 0 is privileged, group 1 unprivileged.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray): `c`, `A_eq` and `b_eq`.
+    """
+    counts = np.asarray(counts, dtype=np.float64).reshape(-1, 2, 2)
+    tn, fn = counts[:2, 0, 0], counts[:2, 0, 1]
+    fp, tp = counts[:2, 1, 0], counts[:2, 1, 1]
+
+    # group shares of all instances and within-group rates
+    size = counts[:2].sum(axis=(1, 2))
+    share = size / counts.sum()
+    tpr, fnr = tp / (tp + fn), fn / (tp + fn)
+    fpr, tnr = fp / (fp + tn), tn / (fp + tn)
+
+    # linear program has 4 decision variables:
+    # [Pr[label_tilde = 1 | label_hat = 1, protected_attributes = 0];
+    #  Pr[label_tilde = 1 | label_hat = 0, protected_attributes = 0];
+    #  Pr[label_tilde = 1 | label_hat = 1, protected_attributes = 1];
+    #  Pr[label_tilde = 1 | label_hat = 0, protected_attributes = 1]]
+    # Coefficients of the linear objective function to be minimized.
+    c = np.array([fpr[0] - tpr[0], tnr[0] - fnr[0],
+                  fpr[1] - tpr[1], tnr[1] - fnr[1]])
+
+    # A_eq - 2-D array which, when matrix-multiplied by x,
+    # gives the values of the equality constraints at x
+    # Used to impose equality of odds constraint: the weighted true and false
+    # positive rates after mixing must match between groups
+    sign = np.array([1., -1.])
+    A_eq = np.array([
+        np.ravel(np.column_stack([tp, fn]) / (size * share * sign)[:, None]),
+        np.ravel(np.column_stack([fp, tn]) / (size * (1 - share) * sign)[:, None])])
+    b_eq = np.zeros(2)
+
+    return c, A_eq, b_eq
+
+
+@lru_cache(maxsize=256)
+def _solve_cached(counts):
+    """Solve one LP, returning the immutable `(x, fun, status, message)` so
+    that models fitted on the same counts do not share a result object."""
+    c, A_eq, b_eq = _linear_program(counts)
+    res = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=(0, 1))
+    x = None if res.x is None else tuple(res.x)
+    return x, res.fun, res.status, res.message
+
+
+def _solve_batch(counts_list):
+    """Solve several equalized odds LPs as one block-diagonal program.
+
+    The objective is separable across blocks, so each block of the joint
+    solution is optimal for its own program.
+    """
+    programs = [_linear_program(counts) for counts in counts_list]
+    c = np.concatenate([p[0] for p in programs])
+    A_eq = sp.block_diag([p[1] for p in programs], format='csr')
+    b_eq = np.concatenate([p[2] for p in programs])
+    res = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=(0, 1))
+
+    results = []
+    for k, (c_k, _, _) in enumerate(programs):
+        x = res.x[4 * k:4 * (k + 1)].copy() if res.x is not None else None
+        results.append(OptimizeResult(x=x, fun=None if x is None else c_k @ x,
+            status=res.status, success=res.success, message=res.message))
+    return results
@@ -4,6 +4,7 @@ from warnings import warn
 from aif360.algorithms import Transformer
 from aif360.metrics import utils
 from aif360.metrics import BinaryLabelDatasetMetric, ClassificationMetric
+from aif360.metrics.pareto import pareto_frontier
 
 
 class RejectOptionClassification(Transformer):
@@ -215,8 +216,8 @@ class RejectOptionClassification(Transformer):
         """fit and predict methods sequentially."""
         return self.fit().predict(dataset)
 
-# Function to obtain the pareto frontier
-def _get_pareto_frontier(costs, return_mask = True):  # <- Fastest for many points
+# Function to obtain the pareto frontier, kept for backwards compatibility
+def _get_pareto_frontier(costs, return_mask = True):
     """
     :param costs: An (n_points, n_costs) array
     :param return_mask: True to return a mask, False to return integer indices of efficient points.
@@ -224,21 +225,6 @@ def _get_pareto_frontier(costs, return_mask = True):  # <- Fastest for many poin
         If return_mask is True, this will be an (n_points, ) boolean array
         Otherwise it will be a (n_efficient_points, ) integer array of indices.
 
-    adapted from: https://stackoverflow.com/questions/32791911/fast-calculation-of-pareto-front-in-python
+    See :func:`aif360.metrics.pareto.pareto_frontier`.
     """
-    is_efficient = np.arange(costs.shape[0])
-    n_points = costs.shape[0]
-    next_point_index = 0  # Next index in the is_efficient array to search for
-
-    while next_point_index<len(costs):
-        nondominated_point_mask = np.any(costs<=costs[next_point_index], axis=1)
-        is_efficient = is_efficient[nondominated_point_mask]  # Remove dominated points
-        costs = costs[nondominated_point_mask]
-        next_point_index = np.sum(nondominated_point_mask[:next_point_index])+1
-
-    if return_mask:
-        is_efficient_mask = np.zeros(n_points, dtype = bool)
-        is_efficient_mask[is_efficient] = True
-        return is_efficient_mask
-    else:
-        return is_efficient
+    return pareto_frontier(costs, return_mask=return_mask)
@@ -1,7 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import scipy.optimize as optim
 
 from aif360.algorithms import Transformer
+from aif360.algorithms.transformer import NotFittedError
 from aif360.algorithms.preprocessing.lfr_helpers import helpers as lfr_helpers
 
 
@@ -27,7 +30,14 @@ class LFR(Transformer):
                  Az=50.0,
                  print_interval=250,
                  verbose=1,
-                 seed=None):
+                 seed=None,
+                 optimizer='l-bfgs-b',
+                 batch_size=1024,
+                 num_epochs=50,
+                 learning_rate=0.01,
+                 validation_size=0.1,
+                 patience=5,
+                 callback=None):
         """
         Args:
             unprivileged_groups (tuple): Representation for unprivileged group.
@@ -37,9 +47,25 @@ class LFR(Transformer):
             Az (float, optional): Fairness constraint term weight.
             Ay (float, optional): Output prediction error.
             print_interval (int, optional): Print optimization objective value
-                every print_interval iterations.
+                every print_interval iterations if `verbose`.
             verbose (int, optional): If zero, then no output.
             seed (int, optional): Seed to make `predict` repeatable.
+            optimizer (str, optional): 'l-bfgs-b' optimizes the full-data
+                objective; 'adam' or 'sgd' train on shuffled minibatches with
+                an analytic gradient, which bounds memory use on large data.
+            batch_size (int, optional): Minibatch size ('adam' and 'sgd' only).
+            num_epochs (int, optional): Maximum number of passes over the
+                training data ('adam' and 'sgd' only).
+            learning_rate (float, optional): Step size ('adam' and 'sgd' only).
+            validation_size (float, optional): Fraction of each protected group
+                held out for early stopping ('adam' and 'sgd' only). If zero,
+                all `num_epochs` are run.
+            patience (int, optional): Number of epochs without improvement of
+                the held-out loss before training stops.
+            callback (callable, optional): Called as
+                `callback(epoch, train_loss, valid_loss)` after every epoch of
+                minibatch training, or after every iteration of 'l-bfgs-b'.
+                `valid_loss` is None without a held-out set.
         """
 
         super(LFR, self).__init__(
@@ -64,6 +90,17 @@ class LFR(Transformer):
         self.print_interval = print_interval
         self.verbose = verbose
 
+        if optimizer not in ('l-bfgs-b', 'adam', 'sgd'):
+            raise ValueError("optimizer must be one of 'l-bfgs-b', 'adam' or "
+                             "'sgd', got {!r}.".format(optimizer))
+        self.optimizer = optimizer
+        self.batch_size = batch_size
+        self.num_epochs = num_epochs
+        self.learning_rate = learning_rate
+        self.validation_size = validation_size
+        self.patience = patience
+        self.callback = callback
+
         self.learned_model = None
 
     def fit(self, dataset, **kwargs):
@@ -90,6 +127,13 @@ class LFR(Transformer):
         ytrain_nonsensitive = dataset.labels[nonsensitive_idx]
 
         model_inits = np.random.uniform(size=self.features_dim * 2 + self.k + self.features_dim * self.k)
+
+        if self.optimizer != 'l-bfgs-b':
+            self.learned_model = self._fit_minibatch(model_inits,
+                training_sensitive, training_nonsensitive,
+                ytrain_sensitive[:, 0], ytrain_nonsensitive[:, 0])
+            return self
+
         bnd = []
         for i, _ in enumerate(model_inits):
             if i < self.features_dim * 2 or i >= self.features_dim * 2 + self.k:
@@ -97,82 +141,207 @@ class LFR(Transformer):
             else:
                 bnd.append((0, 1))
 
+        args = (training_sensitive, training_nonsensitive,
+                ytrain_sensitive[:, 0], ytrain_nonsensitive[:, 0], self.k,
+                self.Ax, self.Ay, self.Az, 0, 0)
+        iteration = [0]
+
+        def progress(params):
+            # the objective is only re-evaluated when someone listens
+            iteration[0] += 1
+            report = (self.verbose and self.print_interval
+                      and iteration[0] % self.print_interval == 0)
+            if self.callback is None and not report:
+                return
+            loss = lfr_helpers.LFR_optim_obj(params, *args)
+            if report:
+                print(iteration[0], loss)
+            if self.callback is not None:
+                self.callback(iteration[0], loss, None)
+
         self.learned_model = optim.fmin_l_bfgs_b(lfr_helpers.LFR_optim_obj, x0=model_inits, epsilon=1e-5,
-                                  args=(training_sensitive, training_nonsensitive,
-                                        ytrain_sensitive[:, 0], ytrain_nonsensitive[:, 0], self.k, self.Ax,
-                                        self.Ay, self.Az, 0, self.print_interval),
-                                  bounds=bnd, approx_grad=True, maxfun=5000,
-                                  maxiter=5000, disp=self.verbose)[0]
+                                  args=args, bounds=bnd, approx_grad=True, maxfun=5000,
+                                  maxiter=5000, disp=self.verbose,
+                                  callback=progress)[0]
         return self
 
-    def transform(self, dataset, threshold=0.5, **kwargs):
+    def _fit_minibatch(self, params, X_sensitive, X_nonsensitive, y_sensitive,
+                       y_nonsensitive):
+        """Minimize the LFR objective with Adam or SGD on stratified minibatches.
+
+        Each batch holds both protected groups in their training proportions
+        and is gathered into preallocated buffers, so the work arrays are of
+        size `batch_size` x `k` and `batch_size` x `features_dim` regardless
+        of the dataset size. The parameters with the lowest held-out loss are
+        returned.
+        """
+        P, k = self.features_dim, self.k
+        w_slice = slice(2 * P, 2 * P + k)
+
+        def holdout(N):
+            order = np.random.permutation(N)
+            num_valid = int(round(N * self.validation_size))
+            return order[num_valid:], order[:num_valid]
+        train_s, valid_s = holdout(len(X_sensitive))
+        train_n, valid_n = holdout(len(X_nonsensitive))
+        Ns, Nn = len(train_s), len(train_n)
+        if min(Ns, Nn) == 0:
+            raise ValueError("Both protected groups need training instances.")
+        has_valid = len(valid_s) > 0 and len(valid_n) > 0
+
+        # stratified batches: every batch contains rows of both groups
+        num_batches = max(1, min(int(np.ceil((Ns + Nn) / self.batch_size)), Ns, Nn))
+        bs, bn = int(np.ceil(Ns / num_batches)), int(np.ceil(Nn / num_batches))
+        buffers = [lfr_helpers.minibatch_buffers(bs, P, k),
+                   lfr_helpers.minibatch_buffers(bn, P, k)]
+
+        if has_valid:
+            valid_args = (X_sensitive[valid_s], X_nonsensitive[valid_n],
+                          y_sensitive[valid_s], y_nonsensitive[valid_n], k,
+                          self.Ax, self.Ay, self.Az, Ns / len(valid_s),
+                          Nn / len(valid_n),
+                          [lfr_helpers.minibatch_buffers(len(valid_s), P, k),
+                           lfr_helpers.minibatch_buffers(len(valid_n), P, k)])
+
+        grad = np.empty_like(params)
+        m = np.zeros_like(params)
+        v = np.zeros_like(params)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        step = 0
+
+        best_params, best_loss, bad_epochs = params.copy(), np.inf, 0
+        for epoch in range(self.num_epochs):
+            train_loss = 0.0
+            for idx_s, idx_n in zip(
+                    np.array_split(np.random.permutation(train_s), num_batches),
+                    np.array_split(np.random.permutation(train_n), num_batches)):
+                b_s, b_n = buffers
+                Xs = np.take(X_sensitive, idx_s, axis=0, out=b_s['X'][:len(idx_s)])
+                Xn = np.take(X_nonsensitive, idx_n, axis=0, out=b_n['X'][:len(idx_n)])
+                ys = np.take(y_sensitive, idx_s, out=b_s['y'][:len(idx_s)])
+                yn = np.take(y_nonsensitive, idx_n, out=b_n['y'][:len(idx_n)])
+
+                train_loss += lfr_helpers.LFR_minibatch_obj(params, Xs, Xn, ys,
+                    yn, k, self.Ax, self.Ay, self.Az, Ns / len(idx_s),
+                    Nn / len(idx_n), buffers, grad=grad)
+
+                step += 1
+                if self.optimizer == 'adam':
+                    m *= beta1
+                    m += (1 - beta1) * grad
+                    v *= beta2
+                    v += (1 - beta2) * grad * grad
+                    lr = self.learning_rate * np.sqrt(1 - beta2**step) / (1 - beta1**step)
+                    params -= lr * m / (np.sqrt(v) + eps)
+                else:
+                    params -= self.learning_rate * grad
+                # project the prediction weights back onto their [0, 1] bounds
+                np.clip(params[w_slice], 0, 1, out=params[w_slice])
+            train_loss /= num_batches
+
+            valid_loss = None
+            if has_valid:
+                valid_loss = lfr_helpers.LFR_minibatch_obj(params, *valid_args)
+            if self.callback is not None:
+                self.callback(epoch, train_loss, valid_loss)
+
+            loss = valid_loss if has_valid else train_loss
+            if loss < best_loss:
+                best_params[:] = params
+                best_loss, bad_epochs = loss, 0
+            elif has_valid:
+                bad_epochs += 1
+                if bad_epochs >= self.patience:
+                    break
+
+        return best_params
+
+    def transform(self, dataset, threshold=0.5, batch_size=10000, n_jobs=1,
+                  **kwargs):
         """Transform the dataset using learned model parameters.
 
+        Labels of `dataset` are not used, so unlabelled data can be
+        transformed as well.
+
         Args:
-            dataset (BinaryLabelDataset): Dataset containing labels that needs to be transformed.
+            dataset (BinaryLabelDataset): Dataset that needs to be transformed.
             threshold(float, optional): threshold parameter used for binary label prediction.
+            batch_size (int, optional): Number of rows processed per chunk.
+            n_jobs (int, optional): Number of threads processing chunks.
         Returns:
             dataset (BinaryLabelDataset): Transformed Dataset.
         """
-        if self.seed is not None:
-            np.random.seed(self.seed)
+        protected_attributes = dataset.protected_attributes[:,
+            dataset.protected_attribute_names.index(self.protected_attribute_name)]
+        transformed_features, y_hat = self.transform_features(
+            dataset.features, protected_attributes, batch_size=batch_size,
+            n_jobs=n_jobs)
+
+        # Mutated, fairer dataset with new labels; unchanged fields are shared
+        dataset_new = dataset.copy()
+        dataset_new.features = transformed_features
+        dataset_new.labels = (y_hat > threshold).astype(np.float64).reshape(-1, 1)
 
-        num_test_samples, _ = np.shape(dataset.features)
+        return dataset_new
 
-        d = np.reshape(
-            dataset.protected_attributes[:, dataset.protected_attribute_names.index(self.protected_attribute_name)],
-            [-1, 1])
-        sensitive_idx = np.array(np.where(d == self.unprivileged_group_protected_attribute_value))[0].flatten()
-        nonsensitive_idx = np.array(np.where(d == self.privileged_group_protected_attribute_value))[0].flatten()
-        testing_sensitive = dataset.features[sensitive_idx]
-        testing_nonsensitive = dataset.features[nonsensitive_idx]
-        ytest_sensitive = dataset.labels[sensitive_idx]
-        ytest_nonsensitive = dataset.labels[nonsensitive_idx]
-
-        # extract training model parameters
-        Ns, P = testing_sensitive.shape
-        N, _ = testing_nonsensitive.shape
-        alphaoptim0 = self.learned_model[:P]
-        alphaoptim1 = self.learned_model[P: 2 * P]
-        woptim = self.learned_model[2 * P: (2 * P) + self.k]
-        voptim = np.matrix(self.learned_model[(2 * P) + self.k:]).reshape((self.k, P))
-
-        # compute distances on the test dataset using train model params
-        dist_sensitive = lfr_helpers.distances(testing_sensitive, voptim, alphaoptim1, Ns, P, self.k)
-        dist_nonsensitive = lfr_helpers.distances(testing_nonsensitive, voptim, alphaoptim0, N, P, self.k)
-
-        # compute cluster probabilities for test instances
-        M_nk_sensitive = lfr_helpers.M_nk(dist_sensitive, Ns, self.k)
-        M_nk_nonsensitive = lfr_helpers.M_nk(dist_nonsensitive, N, self.k)
-
-        # learned mappings for test instances
-        res_sensitive = lfr_helpers.x_n_hat(testing_sensitive, M_nk_sensitive, voptim, Ns, P, self.k)
-        x_n_hat_sensitive = res_sensitive[0]
-        res_nonsensitive = lfr_helpers.x_n_hat(testing_nonsensitive, M_nk_nonsensitive, voptim, N, P, self.k)
-        x_n_hat_nonsensitive = res_nonsensitive[0]
-
-        # compute predictions for test instances
-        res_sensitive = lfr_helpers.yhat(M_nk_sensitive, ytest_sensitive, woptim, Ns, self.k)
-        y_hat_sensitive = res_sensitive[0]
-        res_nonsensitive = lfr_helpers.yhat(M_nk_nonsensitive, ytest_nonsensitive, woptim, N, self.k)
-        y_hat_nonsensitive = res_nonsensitive[0]
-
-        transformed_features = np.zeros(shape=np.shape(dataset.features))
-        transformed_labels = np.zeros(shape=np.shape(dataset.labels))
-        transformed_features[sensitive_idx] = x_n_hat_sensitive
-        transformed_features[nonsensitive_idx] = x_n_hat_nonsensitive
-        transformed_labels[sensitive_idx] = np.reshape(y_hat_sensitive,
-            [-1, 1])
-        transformed_labels[nonsensitive_idx] = np.reshape(y_hat_nonsensitive,
-            [-1, 1])
-        transformed_labels = (np.array(transformed_labels) > threshold).astype(np.float64)
+    def transform_features(self, features, protected_attributes,
+                           batch_size=10000, n_jobs=1, out=None):
+        """Map raw features onto the learned fair representation.
 
-        # Mutated, fairer dataset with new labels
-        dataset_new = dataset.copy(deepcopy=True)
-        dataset_new.features = transformed_features
-        dataset_new.labels = transformed_labels
+        Rows are processed in chunks of `batch_size` into a preallocated
+        output, optionally across a thread pool. Rows whose protected
+        attribute is neither the privileged nor the unprivileged value are
+        mapped to zeros.
 
-        return dataset_new
+        Args:
+            features (numpy.ndarray): N x P feature matrix.
+            protected_attributes (numpy.ndarray): Length N values of the
+                protected attribute used in `fit`.
+            batch_size (int, optional): Number of rows processed per chunk.
+            n_jobs (int, optional): Number of threads processing chunks.
+            out (numpy.ndarray, optional): N x P array receiving the
+                transformed features, e.g. a :obj:`numpy.memmap` to stream
+                large outputs to disk.
+        Returns:
+            (numpy.ndarray, numpy.ndarray): Transformed features and predicted
+            label probabilities.
+        """
+        if self.learned_model is None:
+            raise NotFittedError("LFR must be fit before calling transform.")
+
+        N, P = np.shape(features)
+        protected_attributes = np.ravel(protected_attributes)
+        alpha0 = self.learned_model[:P]
+        alpha1 = self.learned_model[P: 2 * P]
+        w = self.learned_model[2 * P: (2 * P) + self.k]
+        v = self.learned_model[(2 * P) + self.k:].reshape((self.k, P))
+
+        if out is None:
+            out = np.empty((N, P))
+        y_hat = np.empty(N)
+
+        def transform_chunk(start):
+            stop = min(start + batch_size, N)
+            d = protected_attributes[start:stop]
+            sensitive = d == self.unprivileged_group_protected_attribute_value
+            nonsensitive = d == self.privileged_group_protected_attribute_value
+            alpha = np.where(sensitive[:, None], alpha1, alpha0)
+            lfr_helpers.LFR_transform_chunk(features[start:stop], alpha, v, w,
+                                            out[start:stop], y_hat[start:stop])
+            other = ~(sensitive | nonsensitive)
+            if other.any():
+                out[start:stop][other] = 0.0
+                y_hat[start:stop][other] = 0.0
+
+        starts = range(0, N, batch_size)
+        if n_jobs == 1:
+            for start in starts:
+                transform_chunk(start)
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(transform_chunk, starts))
+
+        return out, y_hat
 
     def fit_transform(self, dataset, seed=None):
         """fit and transform methods sequentially"""
@@ -0,0 +1,54 @@
+"""Compare the numba and NumPy implementations of the LFR objective.
+
+Usage::
+
+    python -m aif360.algorithms.preprocessing.lfr_helpers.benchmark [N] [P] [k]
+"""
+import sys
+from timeit import repeat
+
+import numpy as np
+
+from aif360.algorithms.preprocessing.lfr_helpers import helpers
+
+
+def benchmark(N=100000, P=30, k=5, number=5, seed=0):
+    """Time one evaluation of `LFR_optim_obj` with each set of kernels.
+
+    Args:
+        N (int): Number of rows, split evenly between the two groups.
+        P (int): Number of features.
+        k (int): Number of prototypes.
+        number (int): Number of timed evaluations per implementation.
+        seed (int): Seed for the random data and parameters.
+
+    Returns:
+        dict: Best time per evaluation in seconds and the objective value for
+        each available implementation.
+    """
+    rng = np.random.RandomState(seed)
+    X_s, X_n = rng.rand(N // 2, P), rng.rand(N - N // 2, P)
+    y_s, y_n = rng.randint(2, size=N // 2), rng.randint(2, size=N - N // 2)
+    params = rng.uniform(size=P * 2 + k + P * k)
+    args = (params, X_s, X_n, y_s.astype(np.float64), y_n.astype(np.float64),
+            k, 0.01, 1.0, 50.0, 0, np.inf)
+
+    implementations = {'numpy': helpers.NUMPY_KERNELS}
+    if helpers.NUMBA_KERNELS is not None:
+        implementations['numba'] = helpers.NUMBA_KERNELS
+
+    results = {}
+    for name, kernels in implementations.items():
+        # the first call triggers numba compilation
+        value = helpers.LFR_optim_obj(*args, kernels=kernels)
+        time = min(repeat(lambda: helpers.LFR_optim_obj(*args, kernels=kernels),
+                          number=number, repeat=3)) / number
+        results[name] = (time, value)
+    return results
+
+
+if __name__ == '__main__':
+    N, P, k = (list(map(int, sys.argv[1:4])) + [100000, 30, 5][len(sys.argv[1:4]):])
+    for name, (time, value) in benchmark(N, P, k).items():
+        print("{:>6}: {:8.4f} s per objective evaluation (value {:.6f})".format(
+            name, time, value))
@@ -1,68 +1,127 @@
 # Based on code from https://github.com/zjelveh/learning-fair-representations
-from numba.decorators import jit
 import numpy as np
 
-@jit
-def distances(X, v, alpha, N, P, k):
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+
+# Pure NumPy kernels, used when numba is not installed
+
+def _distances_numpy(X, v, alpha, N, P, k):
+    dists = np.dot(X * X, alpha)[:, None] - 2.0 * np.dot(X * alpha, v.T)
+    dists += np.dot(v * v, alpha)[None, :]
+    return np.maximum(dists, 0.0, out=dists)
+
+def _M_nk_numpy(dists, N, k):
+    exp = np.exp(-dists)
+    denom = exp.sum(axis=1)
+    denom[denom == 0] = 1e-6
+    return exp / denom[:, None]
+
+def _M_k_numpy(M_nk, N, k):
+    return M_nk.sum(axis=0) / N
+
+def _x_n_hat_numpy(X, M_nk, v, N, P, k):
+    x_n_hat = np.dot(M_nk, v)
+    return x_n_hat, np.sum((X - x_n_hat) ** 2)
+
+def _yhat_numpy(M_nk, y, w, N, k):
+    yhat = np.dot(M_nk, w)
+    yhat = np.where(yhat <= 0, 1e-6, yhat)
+    yhat = np.where(yhat >= 1, 0.999, yhat)
+    L_y = -np.sum(y * np.log(yhat) + (1.0 - y) * np.log(1.0 - yhat))
+    return yhat, L_y
+
+
+# Loop kernels compiled in nopython mode, parallel over rows
+
+def _distances_loops(X, v, alpha, N, P, k):
     dists = np.zeros((N, k))
-    for i in range(N):
-        for p in range(P):
-            for j in range(k):
-                dists[i, j] += (X[i, p] - v[j, p]) * (X[i, p] - v[j, p]) * alpha[p]
+    for i in prange(N):
+        for j in range(k):
+            d = 0.0
+            for p in range(P):
+                d += (X[i, p] - v[j, p]) * (X[i, p] - v[j, p]) * alpha[p]
+            dists[i, j] = d
     return dists
 
-@jit
-def M_nk(dists, N, k):
+def _M_nk_loops(dists, N, k):
     M_nk = np.zeros((N, k))
-    exp = np.zeros((N, k))
-    denom = np.zeros(N)
-    for i in range(N):
+    for i in prange(N):
+        denom = 0.0
         for j in range(k):
-            exp[i, j] = np.exp(-1 * dists[i, j])
-            denom[i] += exp[i, j]
+            M_nk[i, j] = np.exp(-1 * dists[i, j])
+            denom += M_nk[i, j]
+        if denom == 0:
+            denom = 1e-6
         for j in range(k):
-            if denom[i]:
-                M_nk[i, j] = exp[i, j] / denom[i]
-            else:
-                M_nk[i, j] = exp[i, j] / 1e-6
+            M_nk[i, j] /= denom
     return M_nk
 
-@jit
-def M_k(M_nk, N, k):
+def _M_k_loops(M_nk, N, k):
     M_k = np.zeros(k)
-    for j in range(k):
-        for i in range(N):
+    for i in range(N):
+        for j in range(k):
             M_k[j] += M_nk[i, j]
-        M_k[j] /= N
-    return M_k
+    return M_k / N
 
-@jit
-def x_n_hat(X, M_nk, v, N, P, k):
+def _x_n_hat_loops(X, M_nk, v, N, P, k):
     x_n_hat = np.zeros((N, P))
     L_x = 0.0
-    for i in range(N):
+    for i in prange(N):
         for p in range(P):
+            x = 0.0
             for j in range(k):
-                x_n_hat[i, p] += M_nk[i, j] * v[j, p]
-            L_x += (X[i, p] - x_n_hat[i, p]) * (X[i, p] - x_n_hat[i, p])
+                x += M_nk[i, j] * v[j, p]
+            x_n_hat[i, p] = x
+            L_x += (X[i, p] - x) * (X[i, p] - x)
     return x_n_hat, L_x
 
-@jit
-def yhat(M_nk, y, w, N, k):
+def _yhat_loops(M_nk, y, w, N, k):
     yhat = np.zeros(N)
     L_y = 0.0
-    for i in range(N):
+    for i in prange(N):
+        y_i = 0.0
         for j in range(k):
-            yhat[i] += M_nk[i, j] * w[j]
-        yhat[i] = 1e-6 if yhat[i] <= 0 else yhat[i]
-        yhat[i] = 0.999 if yhat[i] >= 1 else yhat[i]
-        L_y += -1 * y[i] * np.log(yhat[i]) - (1.0 - y[i]) * np.log(1.0 - yhat[i])
+            y_i += M_nk[i, j] * w[j]
+        y_i = 1e-6 if y_i <= 0 else y_i
+        y_i = 0.999 if y_i >= 1 else y_i
+        yhat[i] = y_i
+        L_y += -1 * y[i] * np.log(y_i) - (1.0 - y[i]) * np.log(1.0 - y_i)
     return yhat, L_y
 
-@jit
+
+NUMPY_KERNELS = {'distances': _distances_numpy, 'M_nk': _M_nk_numpy,
+                 'M_k': _M_k_numpy, 'x_n_hat': _x_n_hat_numpy,
+                 'yhat': _yhat_numpy}
+
+if njit is not None:
+    NUMBA_KERNELS = {
+        'distances': njit(parallel=True)(_distances_loops),
+        'M_nk': njit(parallel=True)(_M_nk_loops),
+        'M_k': njit(_M_k_loops),
+        'x_n_hat': njit(parallel=True)(_x_n_hat_loops),
+        'yhat': njit(parallel=True)(_yhat_loops)}
+    KERNELS = NUMBA_KERNELS
+else:
+    NUMBA_KERNELS = None
+    KERNELS = NUMPY_KERNELS
+
+distances = KERNELS['distances']
+M_nk = KERNELS['M_nk']
+M_k = KERNELS['M_k']
+x_n_hat = KERNELS['x_n_hat']
+yhat = KERNELS['yhat']
+
+
 def LFR_optim_obj(params, data_sensitive, data_nonsensitive, y_sensitive,
-                  y_nonsensitive, k=10, A_x = 0.01, A_y = 0.1, A_z = 0.5, results=0, print_inteval=250):
+                  y_nonsensitive, k=10, A_x = 0.01, A_y = 0.1, A_z = 0.5, results=0,
+                  print_inteval=250, kernels=None):
 
+    kernels = kernels or KERNELS
     LFR_optim_obj.iters += 1
     Ns, P = data_sensitive.shape
     Nns, _ = data_nonsensitive.shape
@@ -70,32 +129,30 @@ def LFR_optim_obj(params, data_sensitive, data_nonsensitive, y_sensitive,
     alpha0 = params[:P]
     alpha1 = params[P : 2 * P]
     w = params[2 * P : (2 * P) + k]
-    v = np.matrix(params[(2 * P) + k:]).reshape((k, P))
+    v = np.ascontiguousarray(params[(2 * P) + k:]).reshape((k, P))
 
-    dists_sensitive = distances(data_sensitive, v, alpha1, Ns, P, k)
-    dists_nonsensitive = distances(data_nonsensitive, v, alpha0, Nns, P, k)
+    dists_sensitive = kernels['distances'](data_sensitive, v, alpha1, Ns, P, k)
+    dists_nonsensitive = kernels['distances'](data_nonsensitive, v, alpha0, Nns, P, k)
 
-    M_nk_sensitive = M_nk(dists_sensitive, Ns, k)
-    M_nk_nonsensitive = M_nk(dists_nonsensitive, Nns, k)
+    M_nk_sensitive = kernels['M_nk'](dists_sensitive, Ns, k)
+    M_nk_nonsensitive = kernels['M_nk'](dists_nonsensitive, Nns, k)
 
-    M_k_sensitive = M_k(M_nk_sensitive, Ns, k)
-    M_k_nonsensitive = M_k(M_nk_nonsensitive, Nns, k)
+    M_k_sensitive = kernels['M_k'](M_nk_sensitive, Ns, k)
+    M_k_nonsensitive = kernels['M_k'](M_nk_nonsensitive, Nns, k)
 
-    L_z = 0.0
-    for j in range(k):
-        L_z += abs(M_k_sensitive[j] - M_k_nonsensitive[j])
+    L_z = np.sum(np.abs(M_k_sensitive - M_k_nonsensitive))
 
-    x_n_hat_sensitive, L_x1 = x_n_hat(data_sensitive, M_nk_sensitive, v, Ns, P, k)
-    x_n_hat_nonsensitive, L_x2 = x_n_hat(data_nonsensitive, M_nk_nonsensitive, v, Nns, P, k)
+    x_n_hat_sensitive, L_x1 = kernels['x_n_hat'](data_sensitive, M_nk_sensitive, v, Ns, P, k)
+    x_n_hat_nonsensitive, L_x2 = kernels['x_n_hat'](data_nonsensitive, M_nk_nonsensitive, v, Nns, P, k)
     L_x = L_x1 + L_x2
 
-    yhat_sensitive, L_y1 = yhat(M_nk_sensitive, y_sensitive, w, Ns, k)
-    yhat_nonsensitive, L_y2 = yhat(M_nk_nonsensitive, y_nonsensitive, w, Nns, k)
+    yhat_sensitive, L_y1 = kernels['yhat'](M_nk_sensitive, y_sensitive, w, Ns, k)
+    yhat_nonsensitive, L_y2 = kernels['yhat'](M_nk_nonsensitive, y_nonsensitive, w, Nns, k)
     L_y = L_y1 + L_y2
 
     criterion = A_x * L_x + A_y * L_y + A_z * L_z
 
-    if LFR_optim_obj.iters % print_inteval == 0:
+    if print_inteval and LFR_optim_obj.iters % print_inteval == 0:
         print(LFR_optim_obj.iters, criterion)
 
     if results:
@@ -103,3 +160,148 @@ def LFR_optim_obj(params, data_sensitive, data_nonsensitive, y_sensitive,
     else:
         return criterion
 LFR_optim_obj.iters = 0
+
+
+def minibatch_buffers(N, P, k):
+    """Preallocate the N x P and N x k work arrays used by `LFR_minibatch_obj`
+    for one protected group holding at most N rows per batch."""
+    return {'X': np.empty((N, P)), 'XP': np.empty((N, P)), 'R': np.empty((N, P)),
+            'M': np.empty((N, k)), 'G': np.empty((N, k)), 'y': np.empty(N),
+            'g': np.empty(N)}
+
+
+def _group_forward(X, y, alpha, v, w, buf):
+    N = X.shape[0]
+    Xa = np.multiply(X, alpha, out=buf['XP'][:N])
+
+    # dists = sum_p alpha_p (x_ip - v_jp)^2, expanded to avoid an N x k x P array
+    M = np.dot(Xa, v.T, out=buf['M'][:N])
+    M *= -2.0
+    M += np.einsum('ip,ip->i', X, Xa)[:, None]
+    M += np.dot(v * v, alpha)[None, :]
+
+    # M_nk = softmax(-dists), shifted by the row minimum for stability
+    M -= M.min(axis=1)[:, None]
+    np.negative(M, out=M)
+    np.exp(M, out=M)
+    M /= M.sum(axis=1)[:, None]
+
+    R = np.dot(M, v, out=buf['R'][:N])
+    R -= X
+    L_x = np.einsum('ip,ip->', R, R)
+
+    yhat = np.dot(M, w, out=buf['g'][:N])
+    clipped = (yhat < 1e-6) | (yhat > 0.999)
+    np.clip(yhat, 1e-6, 0.999, out=yhat)
+    L_y = -np.sum(y * np.log(yhat) + (1.0 - y) * np.log(1.0 - yhat))
+
+    # dL_y/dyhat, zero where the prediction was clipped
+    denom = yhat * (1.0 - yhat)
+    g = yhat
+    g -= y
+    g /= denom
+    g[clipped] = 0.0
+
+    return M, R, g, L_x, L_y
+
+
+def _group_backward(X, alpha, v, w, M, R, g, dM_k, scale, A_x, A_y, buf,
+                    grad_alpha, grad_v, grad_w):
+    N = X.shape[0]
+
+    # dL/dM_nk from the reconstruction, prediction and fairness terms
+    G = np.dot(R, v.T, out=buf['G'][:N])
+    G *= 2.0 * A_x * scale
+    for j in range(w.shape[0]):
+        G[:, j] += (A_y * scale * w[j]) * g
+    G += dM_k / N
+
+    # back through the softmax to dL/ddists
+    G -= np.einsum('ij,ij->i', M, G)[:, None]
+    G *= M
+    np.negative(G, out=G)
+
+    D_sum = G.sum(axis=0)
+    XtD = np.dot(X.T, G)
+
+    grad_w += (A_y * scale) * np.dot(M.T, g)
+    grad_v += (2.0 * A_x * scale) * np.dot(M.T, R)
+    grad_v -= 2.0 * alpha[None, :] * (XtD.T - D_sum[:, None] * v)
+    grad_alpha += (np.einsum('ip,ip,i->p', X, X, G.sum(axis=1))
+                   - 2.0 * np.einsum('jp,pj->p', v, XtD)
+                   + np.dot(D_sum, v * v))
+
+
+def LFR_minibatch_obj(params, data_sensitive, data_nonsensitive, y_sensitive,
+                      y_nonsensitive, k, A_x, A_y, A_z, scale_sensitive,
+                      scale_nonsensitive, buffers, grad=None):
+    """Vectorized LFR objective and analytic gradient on a stratified batch.
+
+    The reconstruction and prediction losses of each group are multiplied by
+    `scale_sensitive` and `scale_nonsensitive` (the ratio of the group's full
+    size to its batch size), so that the criterion estimates the full-data
+    objective of `LFR_optim_obj`. All N x P and N x k work arrays are taken
+    from `buffers`, a pair of `minibatch_buffers` for the sensitive and
+    non-sensitive rows.
+
+    Returns:
+        float: Objective value. If `grad` is given, the gradient with respect
+        to `params` is written into it.
+    """
+    P = data_sensitive.shape[1]
+    alpha0 = params[:P]
+    alpha1 = params[P : 2 * P]
+    w = params[2 * P : (2 * P) + k]
+    v = params[(2 * P) + k:].reshape((k, P))
+
+    M_s, R_s, g_s, L_x1, L_y1 = _group_forward(data_sensitive, y_sensitive,
+                                               alpha1, v, w, buffers[0])
+    M_n, R_n, g_n, L_x2, L_y2 = _group_forward(data_nonsensitive, y_nonsensitive,
+                                               alpha0, v, w, buffers[1])
+
+    M_k_diff = M_s.mean(axis=0) - M_n.mean(axis=0)
+    L_z = np.abs(M_k_diff).sum()
+    L_x = scale_sensitive * L_x1 + scale_nonsensitive * L_x2
+    L_y = scale_sensitive * L_y1 + scale_nonsensitive * L_y2
+    criterion = A_x * L_x + A_y * L_y + A_z * L_z
+
+    if grad is not None:
+        grad[:] = 0.0
+        grad_w = grad[2 * P : (2 * P) + k]
+        grad_v = grad[(2 * P) + k:].reshape((k, P))
+        dM_k = A_z * np.sign(M_k_diff)
+        _group_backward(data_sensitive, alpha1, v, w, M_s, R_s, g_s, dM_k,
+                        scale_sensitive, A_x, A_y, buffers[0],
+                        grad[P : 2 * P], grad_v, grad_w)
+        _group_backward(data_nonsensitive, alpha0, v, w, M_n, R_n, g_n, -dM_k,
+                        scale_nonsensitive, A_x, A_y, buffers[1],
+                        grad[:P], grad_v, grad_w)
+
+    return criterion
+
+
+def LFR_transform_chunk(X, alpha, v, w, x_n_hat_out, yhat_out):
+    """Map a block of rows onto the learned prototypes without using labels.
+
+    Args:
+        X (numpy.ndarray): N x P block of features.
+        alpha (numpy.ndarray): N x P distance weights of each row's group.
+        v (numpy.ndarray): k x P prototypes.
+        w (numpy.ndarray): Prototype label probabilities.
+        x_n_hat_out (numpy.ndarray): N x P output for the reconstructions.
+        yhat_out (numpy.ndarray): Length N output for the label probabilities.
+    """
+    Xa = X * alpha
+    M = np.dot(Xa, v.T)
+    M *= -2.0
+    M += np.einsum('ip,ip->i', X, Xa)[:, None]
+    M += np.dot(alpha, (v * v).T)
+
+    M -= M.min(axis=1)[:, None]
+    np.negative(M, out=M)
+    np.exp(M, out=M)
+    M /= M.sum(axis=1)[:, None]
+
+    np.matmul(M, v, out=x_n_hat_out)
+    np.matmul(M, w, out=yhat_out)
+    np.clip(yhat_out, 1e-6, 0.999, out=yhat_out)
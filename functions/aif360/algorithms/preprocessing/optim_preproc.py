@@ -229,18 +229,23 @@ def _apply_randomized_mapping(df, dfMap,
                               features=[], random_seed=None):
     """Apply Randomized mapping to create a new dataframe
 
+    The rows of `df` are factorized into their distinct combinations of
+    `features` and the cumulative mapping probabilities of these combinations
+    are computed once. All rows are then drawn together from one vector of
+    uniform random numbers with :func:`numpy.searchsorted`.
+
     Args:
         df (DataFrame): Input dataframe
         dfMap (DataFrame): Mapping parameters
         features (list): Feature names for which the mapping needs to be applied
-        random_seed (int): Random seed
+        random_seed (int): Random seed for the `numpy.random.Generator` used
+            for the draws
 
     Returns:
         Perturbed version of df according to the randomizedmapping
     """
 
-    if random_seed is not None:
-        np.random.seed(seed=random_seed)
+    rng = np.random.default_rng(random_seed)
 
     df2 = df[features].copy()
     rem_cols = [l for l in df.columns
@@ -248,17 +253,31 @@ def _apply_randomized_mapping(df, dfMap,
     if rem_cols != []:
         df3 = df[rem_cols].copy()
 
-    idx_list = [tuple(i) for i in df2.itertuples(index=False)]
+    # distinct combinations of the features and their rows in dfMap
+    codes, uniques = pd.MultiIndex.from_frame(df2).factorize()
+    map_ix = dfMap.index.get_indexer(uniques)
+    if np.any(map_ix < 0):
+        raise KeyError("Feature combinations not found in the mapping: "
+                       "{}".format(uniques[map_ix < 0].tolist()))
 
-    draw_probs = dfMap.loc[idx_list]
-    draws_possible = draw_probs.columns.tolist()
+    # cumulative probabilities, offset by the combination code so that a
+    # single sorted array covers all combinations
+    cum_probs = np.cumsum(dfMap.values[map_ix], axis=1)
+    cum_probs /= cum_probs[:, -1:]
+    cum_probs += np.arange(len(uniques))[:, np.newaxis]
 
     # Make random draws - as part of randomizing transformation
-    def draw_ind(x): return np.random.choice(range(len(draws_possible)), p=x)
-
-    draw_inds = [draw_ind(x) for x in draw_probs.values]
-
-    df2.loc[:, dfMap.columns.names] = [draws_possible[x] for x in draw_inds]
+    draws = np.searchsorted(cum_probs.ravel(), codes + rng.random(len(codes)),
+                            side='right')
+    draw_inds = np.minimum(draws - codes * dfMap.shape[1], dfMap.shape[1] - 1)
+
+    for name in dfMap.columns.names:
+        values = dfMap.columns.get_level_values(name)[draw_inds]
+        if isinstance(df2[name].dtype, pd.CategoricalDtype):
+            df2[name] = pd.Categorical(values,
+                                       categories=df2[name].cat.categories)
+        else:
+            df2[name] = np.asarray(values)
 
     if rem_cols != []:
         return pd.concat([df2, df3], axis=1)
@@ -3,6 +3,122 @@ import numpy as np
 import pandas as pd
 
 
+# Vectorized distortion functions take two DataFrames `old` and `new` with one
+# column per attribute and one row per state and return the
+# (len(old), len(new)) matrix of distortions between all pairs of states.
+# Scalar distortion functions such as get_distortion_adult take two dicts for a
+# single pair of states and are adapted with vectorize_distortion.
+
+def vectorized_distortion(get_distortion):
+    """Mark a distortion function as vectorized.
+
+    Args:
+        get_distortion (function): Function of two DataFrames `old` and `new`
+            with one column per attribute returning the (len(old), len(new))
+            distortion matrix.
+
+    Returns:
+        function: `get_distortion`, flagged with ``vectorized = True``.
+    """
+    get_distortion.vectorized = True
+    return get_distortion
+
+
+def vectorize_distortion(get_distortion):
+    """Adapt a scalar distortion function to the vectorized interface.
+
+    The scalar function is called once per pair of states and its values are
+    cached across calls, so wrapping it once and reusing the wrapper (e.g. in
+    the `optim_options` of several folds) evaluates every pair only once.
+
+    Args:
+        get_distortion (function): Scalar distortion function of two dicts
+            ``{attr: value}`` with old and new values. Vectorized functions
+            are returned unchanged.
+
+    Returns:
+        function: Vectorized distortion function with the cache in its
+        `cache` attribute.
+    """
+    if getattr(get_distortion, 'vectorized', False):
+        return get_distortion
+
+    cache = {}
+
+    @vectorized_distortion
+    def distortion(old, new):
+        values = cache.setdefault((tuple(old.columns), tuple(new.columns)), {})
+        old_keys = list(old.itertuples(index=False, name=None))
+        new_keys = list(new.itertuples(index=False, name=None))
+        old_dicts = old.to_dict('records')
+        new_dicts = new.to_dict('records')
+
+        D = np.empty((len(old), len(new)))
+        for i, (old_key, vold) in enumerate(zip(old_keys, old_dicts)):
+            for j, (new_key, vnew) in enumerate(zip(new_keys, new_dicts)):
+                key = (old_key, new_key)
+                if key not in values:
+                    values[key] = get_distortion(vold, vnew)
+                D[i, j] = values[key]
+        return D
+
+    distortion.cache = cache
+    return distortion
+
+
+def _table_distortion(table, old, new):
+    """Look up ``table.loc[new, old]`` for all pairs of `old` and `new`
+    values of an attribute, giving a (len(old), len(new)) matrix."""
+    old_ix = table.columns.get_indexer(old)
+    new_ix = table.index.get_indexer(new)
+    if np.any(old_ix < 0) or np.any(new_ix < 0):
+        unknown = set(np.asarray(old)[old_ix < 0]) | set(
+            np.asarray(new)[new_ix < 0])
+        raise KeyError("Values without distortion cost: {}".format(
+            sorted(unknown, key=str)))
+    return table.values[new_ix[np.newaxis, :], old_ix[:, np.newaxis]]
+
+
+def _rank_distortion(ranks, old, new):
+    """Absolute difference of the ranks of all pairs of `old` and `new`
+    values of an ordered attribute."""
+    ranks = pd.Series(ranks, dtype=np.float64)
+    return np.abs(_table_distortion(
+        pd.DataFrame(ranks.values[:, np.newaxis] - ranks.values,
+                     index=ranks.index, columns=ranks.index), old, new))
+
+
+def _rename(values, names):
+    """Replace the values found in the dict `names`."""
+    return np.array([names.get(v, v) for v in values], dtype=object)
+
+
+def _as_float(values):
+    """Numeric values of an attribute, which may be de-dummy coded strings."""
+    return pd.to_numeric(np.asarray(values, dtype=object)).astype(np.float64)
+
+
+def _credit_label_distortion(old, new):
+    """Distortion of the credit label: turning good credit into bad costs
+    2, turning bad credit into good costs 1. Accepts both the numeric labels
+    (1.0 good, 2.0 bad) and their names from the dataset `label_maps`."""
+    distort = pd.DataFrame({'Bad':  [0., 1.],
+                            'Good': [2., 0.]},
+                           index=['Bad', 'Good'])
+    labels = {1.0: 'Good', 2.0: 'Bad'}
+    return _table_distortion(distort, _rename(old, labels),
+                             _rename(new, labels))
+
+
+def _age_distortion(old, new):
+    """Distortion of the protected age group: any change costs 2. Accepts
+    both the numeric groups (1.0 old, 0.0 young) and their names."""
+    groups = {1.0: 'Old', 0.0: 'Young'}
+    old = _rename(old, groups)
+    new = _rename(new, groups)
+    return 2. * (old[:, np.newaxis] != new[np.newaxis, :])
+
+
 def get_distortion_adult(vold, vnew):
     """Distortion function for the adult dataset. We set the distortion
     metric here. See section 4.3 in supplementary material of
@@ -187,3 +303,100 @@ def get_distortion_compas(vold, vnew):
             total_cost += distort[k].loc[vnew[k], vold[k]]
 
     return total_cost
+
+
+@vectorized_distortion
+def get_distortion_german_credit(old, new):
+    """Vectorized distortion function for the german credit data as prepared
+    by `load_data.load_dataset(path, 'german')`, where the categorical
+    attributes keep the raw codes X1, X2, ... of the original data.
+
+    The costs follow :func:`get_distortion_german`: the codes of
+    `account_status`, `credit_history`, `savings` and `employment` are grouped
+    into the same three ordered levels, moving by one level costs 1 and by two
+    levels 2. Changing `AGE` costs 2, and so does changing a good `TARGET`
+    into a bad one, while a bad one becomes good at a cost of 1. Other
+    attributes are ignored.
+
+    Args:
+        old (DataFrame): Old states with one column per attribute.
+        new (DataFrame): New states with one column per attribute.
+
+    Returns:
+        numpy.ndarray: (len(old), len(new)) distortion matrix.
+    """
+    ranks = {
+        # 'None' < '<200' < '200+'
+        'account_status': {'X4': 0, 'X1': 1, 'X2': 1, 'X3': 2},
+        # 'None/Paid' < 'Delay' < 'Other'
+        'credit_history': {'X1': 0, 'X2': 0, 'X3': 0, 'X4': 1, 'X5': 2},
+        # 'Unknown/None' < '<500' < '500+'
+        'savings':        {'X5': 0, 'X1': 1, 'X2': 1, 'X3': 2, 'X4': 2},
+        # 'Unemployed' < '1-4 years' < '4+ years'
+        'employment':     {'X1': 0, 'X2': 0, 'X3': 1, 'X4': 2, 'X5': 2}}
+
+    D = np.zeros((len(old), len(new)))
+    for k in old.columns:
+        if k not in new.columns:
+            continue
+        if k in ranks:
+            D += _rank_distortion(ranks[k], np.asarray(old[k]), np.asarray(new[k]))
+        elif k == 'AGE':
+            D += _age_distortion(np.asarray(old[k]), np.asarray(new[k]))
+        elif k == 'TARGET':
+            D += _credit_label_distortion(np.asarray(old[k]), np.asarray(new[k]))
+
+    return D
+
+
+@vectorized_distortion
+def get_distortion_taiwan(old, new):
+    """Vectorized distortion function for the taiwan credit data as prepared
+    by `load_data.load_dataset(path, 'taiwan')`.
+
+    The repayment statuses `PAY_2`, ..., `PAY_6` (months of payment delay)
+    may change by one month at a cost of 1; larger changes get the cost
+    `bad_val` of 3 of events that should not occur. `EDUCATION` costs 1 per
+    step between high school, university and graduate school and 1 for any
+    change to or from 'others'. Changing `MARRIAGE` costs 1, changing `SEX`
+    or `AGE` 2. A good `TARGET` becomes bad at a cost of 2, a bad one good at
+    a cost of 1. Other attributes are ignored.
+
+    Args:
+        old (DataFrame): Old states with one column per attribute.
+        new (DataFrame): New states with one column per attribute.
+
+    Returns:
+        numpy.ndarray: (len(old), len(new)) distortion matrix.
+    """
+    # value that will be returned for events that should not occur
+    bad_val = 3.0
+
+    pay_features = ['PAY_2', 'PAY_3', 'PAY_4', 'PAY_5', 'PAY_6']
+    distort_edu = pd.DataFrame(
+                    {'high_school':     [0., 1., 2., 1.],
+                     'university':      [1., 0., 1., 1.],
+                     'graduate_school': [2., 1., 0., 1.],
+                     'others':          [1., 1., 1., 0.]},
+                     index=['high_school', 'university', 'graduate_school',
+                            'others'])
+
+    D = np.zeros((len(old), len(new)))
+    for k in old.columns:
+        if k not in new.columns:
+            continue
+        if k in pay_features:
+            delay = np.abs(_as_float(old[k])[:, np.newaxis]
+                           - _as_float(new[k]))
+            D += np.where(delay > 1, bad_val, delay)
+        elif k == 'EDUCATION':
+            D += _table_distortion(distort_edu, np.asarray(old[k]), np.asarray(new[k]))
+        elif k in ('MARRIAGE', 'SEX'):
+            cost = 1. if k == 'MARRIAGE' else 2.
+            D += cost * (np.asarray(old[k])[:, np.newaxis] != np.asarray(new[k]))
+        elif k == 'AGE':
+            D += _age_distortion(np.asarray(old[k]), np.asarray(new[k]))
+        elif k == 'TARGET':
+            D += _credit_label_distortion(np.asarray(old[k]), np.asarray(new[k]))
+
+    return D
@@ -11,9 +11,13 @@
 # specific language governing permissions and limitations under the License.
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import cvxpy as cp
 from cvxpy import Problem, Minimize, Variable
 
+from aif360.algorithms.preprocessing.optim_preproc_helpers.distortion_functions import (
+    vectorize_distortion)
+
 
 class OptTools():
     """Class that implements the optimization for optimized pre-processing.
@@ -57,8 +61,8 @@ class OptTools():
             values
 
         clist (list): Distance thresholds for individual distortion
-        CMlist (list): List of constraint matrices corresponding to each
-            threshold in clist
+        CMlist (list): List of sparse constraint matrices corresponding to
+            each threshold in clist
         dfD (DataFrame): distortion matrix with indices and columns
         dlist (list): Probability bounds given in eq. 5 of the paper for
             each threshold in clist
@@ -97,8 +101,7 @@ class OptTools():
         # build joint distribution
         self.dfJoint = self.df.groupby(self.features).size().reset_index()
         self.dfJoint.rename(columns={0: 'Count'}, inplace=True)
-        self.dfJoint['Frequency'] = self.dfJoint['Count'].apply(
-            lambda x: x/float(len(self.df)))
+        self.dfJoint['Frequency'] = self.dfJoint['Count'] / float(len(self.df))
 
         # initialize the features that will be used for optimization
         self.D_features = []    # discriminatory features
@@ -121,6 +124,38 @@ class OptTools():
         # excess distortion matrices
         self.CMlist = []
 
+        # cvxpy problem, built on the first call to optimize
+        self._problem = None
+
+    @staticmethod
+    def get_indicator(rows, cols):
+        """Sparse indicator matrix of the entries of the multindex `rows` that
+        agree with the entries of `cols` on the levels of `cols`.
+
+        The levels of `cols` are looked up in `rows` and the matching column
+        of every row is found with a single hash lookup
+        (:meth:`pandas.Index.get_indexer`) instead of comparing all pairs.
+
+        Args:
+            rows (MultiIndex): Index of the rows.
+            cols (Index or MultiIndex): Index of the columns. Its level names
+                must be a subset of the level names of `rows`.
+
+        Returns:
+            scipy.sparse.csr_matrix: A (len(rows), len(cols)) matrix with ones
+            where the row and column values match.
+        """
+        target_ix = list(cols.names)
+        if isinstance(cols, pd.MultiIndex):
+            keys = pd.MultiIndex.from_arrays(
+                [rows.get_level_values(name) for name in target_ix])
+        else:
+            keys = rows.get_level_values(target_ix[0])
+        col_ix = cols.get_indexer(keys)
+        row_ix = np.flatnonzero(col_ix >= 0)
+        return sp.csr_matrix((np.ones(len(row_ix)), (row_ix, col_ix[row_ix])),
+                             shape=(len(rows), len(cols)))
+
     def get_mask(self, dfRef):
         """Create a mask assuming the multindex column is a subset of the
         multindex rows. This mask will be used for marginalizing distributions.
@@ -131,16 +166,10 @@ class OptTools():
 
         # generates a mask assuming the multindex column is a subset of the
         # multindex rows
-        target_ix = list(dfRef.columns.names)
-        dfRows = pd.DataFrame(index=dfRef.index).reset_index()[target_ix].values
-        dfCols = pd.DataFrame(index=dfRef.columns).reset_index()[target_ix].values
-
-        for i in range(dfRef.shape[0]):
-            val1 = dfRows[i, :]
-            for j in range(dfRef.shape[1]):
-                val2 = dfCols[j, :]
-                if np.all(val1 == val2):
-                    dfRef.iat[i, j] = 1.0
+        mask = self.get_indicator(dfRef.index, dfRef.columns).tocoo()
+        values = dfRef.values.copy()
+        values[mask.row, mask.col] = 1.0
+        dfRef.iloc[:, :] = values
 
         return dfRef
 
@@ -157,6 +186,7 @@ class OptTools():
         self.D_features = D
         self.Y_features = Y
         self.X_features = X
+        self._problem = None
 
         # Get values for Pandas multindex
         self.D_values = [self.dfJoint[feature].unique().tolist()
@@ -193,16 +223,11 @@ class OptTools():
         # Generate masks for recovering marginals
         ###
         self.dfPxyd = pd.DataFrame(index=self.dfP.index, columns=['Frequency'])
-        index_list = [list(x) for x in self.dfPxyd.index.tolist()]
 
         # find corresponding frequency value
-        i = 0
-        for comb in self.dfJoint[self.DXY_features].values.tolist():
-            # get the entry corresponding to the combination
-            idx = index_list.index(comb)
-            # add marginal to list
-            self.dfPxyd.iloc[idx, 0] = self.dfJoint.loc[i, 'Frequency']
-            i += 1
+        idx = self.dfPxyd.index.get_indexer(
+            pd.MultiIndex.from_frame(self.dfJoint[self.DXY_features]))
+        self.dfPxyd.iloc[idx, 0] = self.dfJoint['Frequency'].values
 
         # create mask that reduces Pxyd to Pxy
         # so Pxyd.dot(dfMask1) = Pxy
@@ -253,69 +278,41 @@ class OptTools():
     def set_distortion(self, get_distortion, clist=[]):
         """Create distortion and constraint matrices
         Args:
-            get_distortion (function): Distortion function name
-                (See optim_preproc_helper.get_distortion for an example)
+            get_distortion (function): Distortion function, either scalar
+                (see distortion_functions.get_distortion_adult for an example)
+                or vectorized (see distortion_functions.vectorize_distortion)
             clist (list): Distance thresholds for individual distortion
         """
 
         # set constraint list
         self.clist = clist
+        self._problem = None
 
-        # create row dictionay (rows represent old values)
-        # this will make it easier to compute distrotion metric
-        rows_tuple = self.dfD.index.tolist()
-        rows_dict = [{self.XY_features[i]:t[i]
-                     for i in range(len(self.XY_features))} for t in rows_tuple]
-
-        # create columns dictionay (columns represent new values)
-        cols_tuple = self.dfD.columns.tolist()
-        cols_dict = [{self.XY_features[i]:t[i]
-                     for i in range(len(self.XY_features))} for t in cols_tuple]
-
-        # Create distortion matrix
-        for i in range(self.dfD.shape[0]):
-            old_values = rows_dict[i]
-            for j in range(self.dfD.shape[1]):
-                new_values = cols_dict[j]
-                self.dfD.iat[i, j] = get_distortion(old_values, new_values)
-
-        Dmatrix = self.dfD.values
+        # Create distortion matrix (rows represent old values, columns new
+        # values) in one call of the vectorized distortion function
+        get_distortion = vectorize_distortion(get_distortion)
+        Dmatrix = np.asarray(get_distortion(
+            self.dfD.index.to_frame(index=False),
+            self.dfD.columns.to_frame(index=False)), dtype=np.float64)
+        self.dfD = pd.DataFrame(Dmatrix, index=self.dfD.index,
+                                columns=self.dfD.columns)
 
         # Create constraint matrix list for excess distortion
-        # since old values index the rows, we go through the D matrix line by
-        # line, marking as 1 events where the threshold is violated. This will
-        # be multiplied by the probability matrix, resulting in the excess
-        # distortion metric
-        self.CMlist = [np.zeros(Dmatrix.shape) for i in range(len(self.clist))]
-        for x in range(len(self.CMlist)):
-            c = self.clist[x]
-            for i in range(Dmatrix.shape[0]):
-                for j in range(Dmatrix.shape[1]):
-                    if Dmatrix[i, j] >= c:
-                        self.CMlist[x][i, j] = 1.0
-
-    def optimize(self, epsilon=1., dlist=[], verbose=True):
-        """Main optimization routine to estimate the pre-processing
-        transformation.
-
-        The particular formulation implemented here is:
-        1. l1 distance between input and transformed distributions
-        2. "Excess distortion constraint" - eqn 5 in paper.
-        3. Discrimination constraints for all combinations of groups specified
-           (there is no distinction between protected and unprotected groups).
-           The constraints are given in eqn 2, 3 in the paper. We use a single
-           /\epsilon value for all combinations of y and d values
-
-        See section 4.3 in supplementary material of the paper for an example
-
-        Args:
-            epsilon (float): Distance thresholds for individual distortion
-            dlist (list): Probability bounds given in eq. 5 of the paper for
-                each threshold in clist
-            verbose (bool): Verbosity flag
+        # since old values index the rows, the matrices mark with 1 the events
+        # where the threshold is violated. They will be multiplied by the
+        # probability matrix, resulting in the excess distortion metric
+        self.CMlist = [sp.csr_matrix(Dmatrix >= c, dtype=np.float64)
+                       for c in self.clist]
+
+    def _build_problem(self):
+        """Build the convex program of :meth:`optimize` with `epsilon` and
+        `dlist` as cvxpy parameters, so that it is only canonicalized once
+        for a given set of features and distortion constraints.
+
+        Returns:
+            tuple: The problem, the mapping variable, the epsilon and dlist
+            parameters and the list of excess distortion expressions.
         """
-        self.epsilon = epsilon
-        self.dlist = dlist
 
         # main conditional map
         Pmap = Variable((self.dfP.shape[0], self.dfP.shape[1]))
@@ -325,13 +322,21 @@ class OptTools():
         PYhgD = Variable((self.dfD_to_Y_address.shape[1],
                           self.dfD_to_Y_address.shape[0]))
 
+        epsilon = cp.Parameter(nonneg=True)
+        dlist = (cp.Parameter((len(self.CMlist),), nonneg=True)
+                 if self.CMlist else None)
+
         # marginal distribution
         dfMarginal = self.dfJoint.groupby(self.DXY_features)['Frequency'].sum()
         PxydMarginal = pd.concat([self.dfP, dfMarginal],
                                  axis=1).fillna(0)['Frequency'].values
         self.PxydMarginal = PxydMarginal
-        PdMarginal = PxydMarginal.dot(self.dfMask_Pxyd_to_Pd).T
-        PxyMarginal = PxydMarginal.dot(self.dfMask_Pxyd_to_Pxy).T
+
+        mask_Pxyd_to_Pd = sp.csr_matrix(self.dfMask_Pxyd_to_Pd.values)
+        mask_Pxyd_to_Pxy = sp.csr_matrix(self.dfMask_Pxyd_to_Pxy.values)
+        mask_Pxy_to_Py = sp.csr_matrix(self.dfMask_Pxy_to_Py.values)
+        PdMarginal = mask_Pxyd_to_Pd.T.dot(PxydMarginal)
+        PxyMarginal = mask_Pxyd_to_Pxy.T.dot(PxydMarginal)
 
         # add constraints
         # 1. valid distribution
@@ -339,45 +344,72 @@ class OptTools():
         constraints.append(Pmap >= 0)
 
         # 2. definition of marginal PxhYh
-        constraints.append(PXhYh == cp.sum(np.diag(PxydMarginal)*Pmap,
-                                                axis=0).T)
+        constraints.append(PXhYh == PxydMarginal @ Pmap)
 
         # add the conditional mapping
-        constraints.append(
-            PYhgD == np.diag(np.ravel(PdMarginal)**(-1)).dot(
-                     self.dfMask_Pxyd_to_Pd.values.T).dot(
-                     np.diag(PxydMarginal)) *
-                     Pmap * self.dfMask_Pxy_to_Py.values)
+        Pd_xyd = (sp.diags(PdMarginal**(-1)) @ mask_Pxyd_to_Pd.T
+                  @ sp.diags(PxydMarginal)).tocsr()
+        constraints.append(PYhgD == Pd_xyd @ Pmap @ mask_Pxy_to_Py)
 
         # 3. add excess distorion
-        # print(PxyMarginal)
-        # Pxy_xhyh = np.nan_to_num(np.diag(PxyMarginal**(-1))).dot(self.dfMask_Pxyd_to_Pxy.values.T).dot(np.diag(PxydMarginal))*Pmap
-        Pxy_xhyh = np.nan_to_num(np.diag((PxyMarginal+1e-10)**(-1))).dot(
-            self.dfMask_Pxyd_to_Pxy.values.T).dot(
-            np.diag(PxydMarginal+1e-10)) * Pmap
+        Pxy_xyd = (sp.diags((PxyMarginal+1e-10)**(-1)) @ mask_Pxyd_to_Pxy.T
+                   @ sp.diags(PxydMarginal+1e-10)).tocsr()
+        Pxy_xhyh = Pxy_xyd @ Pmap
 
-        for i in range(len(self.CMlist)):
-            constraints.append(
-                cp.sum(cp.multiply(self.CMlist[i], Pxy_xhyh), axis=1) <=
-                self.dlist[i])
+        excess = [cp.sum(cp.multiply(CM, Pxy_xhyh), axis=1)
+                  for CM in self.CMlist]
+        for i in range(len(excess)):
+            constraints.append(excess[i] <= dlist[i])
 
         # 4. Discrimination control
         for d in range(self.dfMask_Pxyd_to_Pd.shape[1]):
             for d2 in range(self.dfMask_Pxyd_to_Pd.shape[1]):
                 if d > d2:
                     continue
-                # constraints.append(PYhgD[d,:].T<=PYhgD[d2,:].T*(1+self.epsilon))
-                # constraints.append(PYhgD[d2,:].T<=PYhgD[d,:].T*(1+self.epsilon))
-                constraints.append(
-                    PYhgD[d, :].T - PYhgD[d2, :].T <= self.epsilon)
-                constraints.append(
-                    PYhgD[d2, :].T - PYhgD[d, :].T <= self.epsilon)
+                constraints.append(PYhgD[d, :].T - PYhgD[d2, :].T <= epsilon)
+                constraints.append(PYhgD[d2, :].T - PYhgD[d, :].T <= epsilon)
 
         # 5. Objective is l1 distance between the original
         # and perturbed distributions
         obj = Minimize(cp.norm(PXhYh-PxyMarginal, 1)/2)
 
-        prob = Problem(obj, constraints)
+        return Problem(obj, constraints), Pmap, epsilon, dlist, excess
+
+    def optimize(self, epsilon=1., dlist=[], verbose=True):
+        """Main optimization routine to estimate the pre-processing
+        transformation.
+
+        The particular formulation implemented here is:
+        1. l1 distance between input and transformed distributions
+        2. "Excess distortion constraint" - eqn 5 in paper.
+        3. Discrimination constraints for all combinations of groups specified
+           (there is no distinction between protected and unprotected groups).
+           The constraints are given in eqn 2, 3 in the paper. We use a single
+           /\epsilon value for all combinations of y and d values
+
+        See section 4.3 in supplementary material of the paper for an example
+
+        The problem is built from sparse masks and constraint matrices on the
+        first call. Later calls with other values of `epsilon` and `dlist`
+        only update its parameters and re-solve it.
+
+        Args:
+            epsilon (float): Distance thresholds for individual distortion
+            dlist (list): Probability bounds given in eq. 5 of the paper for
+                each threshold in clist
+            verbose (bool): Verbosity flag
+        """
+        self.epsilon = epsilon
+        self.dlist = dlist
+
+        if self._problem is None:
+            self._problem = self._build_problem()
+        prob, Pmap, epsilon_param, dlist_param, excess = self._problem
+
+        epsilon_param.value = epsilon
+        if dlist_param is not None:
+            dlist_param.value = np.asarray(dlist, dtype=np.float64)
+
         prob.solve(verbose=verbose)
 
         if prob.status in ["optimal", "optimal_inaccurate"]:
@@ -389,12 +421,7 @@ class OptTools():
 
         self.dfP.loc[:, :] = Pmap.value
         self.optimum = prob.value
-        self.const = []
-
-        for i in range(len(self.CMlist)):
-            self.const.append(
-                cp.sum(cp.multiply(self.CMlist[i], Pxy_xhyh),
-                            axis=1).value.max())
+        self.const = [e.value.max() for e in excess]
 
     def compute_marginals(self):
         """Compute a bunch of required marginal distributions."""
@@ -1,22 +1,36 @@
 from collections import defaultdict
 from contextlib import contextmanager
 from copy import deepcopy
+import json
 from logging import warning
+import os
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
 from aif360.datasets import Dataset
+from aif360.delayed_import_error import DelayedImportError
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = feather = pq = DelayedImportError("pyarrow is required to export "
+        "and import datasets: pip install pyarrow")
 
 
 class StructuredDataset(Dataset):
     """Base class for all structured datasets.
 
     A StructuredDataset requires data to be stored in :obj:`numpy.ndarray`
-    objects with :obj:`~numpy.dtype` as :obj:`~numpy.float64`.
+    objects with :obj:`~numpy.dtype` as :obj:`~numpy.float64`. `features` may
+    also be a :obj:`scipy.sparse.csr_matrix` (see :meth:`to_sparse`).
 
     Attributes:
-        features (numpy.ndarray): Dataset features for each instance.
+        features (numpy.ndarray or scipy.sparse.csr_matrix): Dataset features
+            for each instance.
         labels (numpy.ndarray): Generic label corresponding to each instance
             (could be ground-truth, predicted, cluster assignments, etc.).
         scores (numpy.ndarray): Probability score associated with each label.
@@ -149,6 +163,23 @@ class StructuredDataset(Dataset):
             privileged_protected_attributes=privileged_protected_attributes,
             metadata=metadata)
 
+    # fields that convert_to_dataframe builds the DataFrame from; reassigning
+    # any of them drops the cached DataFrame
+    _dataframe_fields = frozenset(['features', 'labels', 'protected_attributes',
+        'feature_names', 'label_names', 'protected_attribute_names',
+        'instance_names'])
+
+    def __setattr__(self, name, value):
+        if name in self._dataframe_fields:
+            self.__dict__.pop('_dataframe', None)
+        super(StructuredDataset, self).__setattr__(name, value)
+
+    def __getstate__(self):
+        # copies and pickles rebuild the DataFrame when they need it
+        state = self.__dict__.copy()
+        state.pop('_dataframe', None)
+        return state
+
     def __eq__(self, other):
         """Equality comparison for StructuredDatasets.
 
@@ -158,6 +189,9 @@ class StructuredDataset(Dataset):
             return False
 
         def _eq(x, y):
+            if sp.issparse(x) or sp.issparse(y):
+                return (sp.issparse(x) and sp.issparse(y)
+                        and x.shape == y.shape and (x != y).nnz == 0)
             if isinstance(x, np.ndarray) and isinstance(y, np.ndarray):
                 return np.all(x == y)
             elif isinstance(x, list) and isinstance(y, list):
@@ -165,7 +199,8 @@ class StructuredDataset(Dataset):
             return x == y
 
         return all(_eq(self.__dict__[k], other.__dict__[k])
-                   for k in self.__dict__.keys() if k not in self.ignore_fields)
+                   for k in self.__dict__.keys()
+                   if k not in self.ignore_fields and k != '_dataframe')
 
     def __ne__(self, other):
         return not self == other
@@ -175,8 +210,18 @@ class StructuredDataset(Dataset):
         return str(self)
 
     def __str__(self):
-        df, _ = self.convert_to_dataframe()
-        df.insert(0, 'instance_weights', self.instance_weights)
+        # pandas only displays the head and tail rows of a long DataFrame, so
+        # only these are built (one row more than max_rows keeps the display
+        # truncated) and the cached DataFrame is neither used nor created
+        n = self.features.shape[0]
+        max_rows = pd.get_option('display.max_rows')
+        if max_rows and n > max_rows:
+            parts = [slice(0, max_rows // 2 + 1), slice(n - max_rows // 2, n)]
+        else:
+            parts = [slice(None)]
+        df = pd.concat([self._build_dataframe(rows) for rows in parts])
+        df.insert(0, 'instance_weights', np.concatenate(
+            [self.instance_weights[rows] for rows in parts]))
         highest_level = ['instance weights'] + \
                         ['features']*len(self.feature_names) + \
                         ['labels']*len(self.label_names)
@@ -189,7 +234,15 @@ class StructuredDataset(Dataset):
         df.columns = pd.MultiIndex.from_arrays(
             [highest_level, middle_level, lowest_level])
         df.index.name = 'instance names'
-        return str(df)
+        if len(parts) == 1:
+            return str(df)
+
+        # the dimensions of the built rows would be shown, so show n instead
+        with pd.option_context('display.show_dimensions', False):
+            text = str(df)
+        if pd.get_option('display.show_dimensions'):
+            text += '\n\n[{} rows x {} columns]'.format(n, df.shape[1])
+        return text
 
     # TODO: *_names checks
     def validate_dataset(self):
@@ -205,14 +258,20 @@ class StructuredDataset(Dataset):
         # =========================== TYPE CHECKING ============================
         for f in [self.features, self.protected_attributes, self.labels,
                   self.scores, self.instance_weights]:
-            if not isinstance(f, np.ndarray):
+            if not isinstance(f, np.ndarray) and not (f is self.features
+                                                      and sp.issparse(f)):
                 raise TypeError("'{}' must be an np.ndarray.".format(f.__name__))
 
         # convert ndarrays to float64
-        self.features = self.features.astype(np.float64)
-        self.protected_attributes = self.protected_attributes.astype(np.float64)
-        self.labels = self.labels.astype(np.float64)
-        self.instance_weights = self.instance_weights.astype(np.float64)
+        if sp.issparse(self.features):
+            self.features = sp.csr_matrix(self.features, dtype=np.float64)
+        else:
+            self.features = self.features.astype(np.float64, copy=False)
+        self.protected_attributes = self.protected_attributes.astype(
+            np.float64, copy=False)
+        self.labels = self.labels.astype(np.float64, copy=False)
+        self.instance_weights = self.instance_weights.astype(np.float64,
+                                                             copy=False)
 
         # =========================== SHAPE CHECKING ===========================
         if len(self.labels.shape) == 1:
@@ -331,11 +390,50 @@ class StructuredDataset(Dataset):
 
         return new
 
+    def _build_dataframe(self, rows=slice(None)):
+        """Build the numeric DataFrame of features and labels for `rows`, with
+        the columns of the protected attributes taken from
+        `protected_attributes`."""
+        features = self.features[rows]
+        if sp.issparse(features):
+            features = features.toarray()
+
+        # one column per array slice, so the arrays are copied once into the
+        # DataFrame and the protected attribute columns are never overwritten
+        columns = dict(zip(self.feature_names, features.T))
+        columns.update(zip(self.label_names, self.labels[rows].T))
+        columns.update(zip(self.protected_attribute_names,
+                           self.protected_attributes[rows].T))
+        return pd.DataFrame(columns, index=self.instance_names[rows],
+                            columns=list(columns))
+
+    def _decode_dataframe(self, df, sep='=', set_category=True):
+        """De-dummy code `df` and map label and protected attribute values to
+        the names in the `metadata`."""
+        df = self._de_dummy_code_df(df, sep=sep, set_category=set_category)
+        if 'label_maps' in self.metadata:
+            for i, label in enumerate(self.label_names):
+                df[label] = df[label].replace(self.metadata['label_maps'][i])
+        if 'protected_attribute_maps' in self.metadata:
+            for i, prot_attr in enumerate(self.protected_attribute_names):
+                df[prot_attr] = df[prot_attr].replace(
+                    self.metadata['protected_attribute_maps'][i])
+        return df
+
     # TODO: Should we store the protected attributes as a separate dataframe
     def convert_to_dataframe(self, de_dummy_code=False, sep='=',
-                             set_category=True):
+                             set_category=True, copy=True):
         """Convert the StructuredDataset to a :obj:`pandas.DataFrame`.
 
+        With ``copy=False`` the numeric DataFrame is cached until `features`,
+        `labels`, `protected_attributes` or their names are reassigned, and
+        later calls reuse it. In-place changes to these arrays (e.g.
+        ``dataset.labels[0] = 1.``) are not detected; reassign the array (or
+        work on a :meth:`copy`, which never shares the cache) to refresh it.
+        Calls with the default ``copy=True`` build a new DataFrame (or copy the
+        cached one) and do not keep a cache, so the dataset never holds a
+        second copy of its data unless asked to.
+
         Args:
             de_dummy_code (bool): Performs de_dummy_coding, converting dummy-
                 coded columns to categories. If `de_dummy_code` is `True` and
@@ -344,6 +442,9 @@ class StructuredDataset(Dataset):
                 convert those as well.
             set_category (bool): Set the de-dummy coded features to categorical
                 type.
+            copy (bool): Return a DataFrame owned by the caller. If `False`,
+                the numeric DataFrame is cached and, if `de_dummy_code` is
+                `False`, returned itself, so it must not be modified.
 
         Returns:
             (pandas.DataFrame, dict):
@@ -361,21 +462,17 @@ class StructuredDataset(Dataset):
                   returned.
 
         """
-        df = pd.DataFrame(np.hstack((self.features, self.labels)),
-            columns=self.feature_names+self.label_names,
-            index=self.instance_names)
-        df.loc[:, self.protected_attribute_names] = self.protected_attributes
+        df = self.__dict__.get('_dataframe')
+        if df is None:
+            df = self._build_dataframe()
+            if not copy:
+                self.__dict__['_dataframe'] = df
+        elif copy and not de_dummy_code:
+            df = df.copy()
 
         # De-dummy code if necessary
         if de_dummy_code:
-            df = self._de_dummy_code_df(df, sep=sep, set_category=set_category)
-            if 'label_maps' in self.metadata:
-                for i, label in enumerate(self.label_names):
-                    df[label] = df[label].replace(self.metadata['label_maps'][i])
-            if 'protected_attribute_maps' in self.metadata:
-                for i, prot_attr in enumerate(self.protected_attribute_names):
-                    df[prot_attr] = df[prot_attr].replace(
-                        self.metadata['protected_attribute_maps'][i])
+            df = self._decode_dataframe(df, sep=sep, set_category=set_category)
 
         # Attributes
         attributes = {
@@ -390,25 +487,298 @@ class StructuredDataset(Dataset):
 
         return df, attributes
 
-    def export_dataset(self, export_metadata=False):
-        """
-        Export the dataset and supporting attributes
-        TODO: The preferred file format is HDF
+    def iter_dataframe(self, chunk_size=100000, de_dummy_code=False, sep='=',
+                       set_category=True):
+        """Convert the StructuredDataset to :obj:`pandas.DataFrame` chunks of
+        consecutive rows, without building (or caching) the whole DataFrame.
+
+        Useful for exporting large datasets, e.g.::
+
+            for i, df in enumerate(dataset.iter_dataframe()):
+                df.to_csv(path, mode='a', header=(i == 0))
+
+        Args:
+            chunk_size (int): Number of rows per chunk.
+            de_dummy_code (bool): See :meth:`convert_to_dataframe`.
+            sep (str): See :meth:`convert_to_dataframe`.
+            set_category (bool): See :meth:`convert_to_dataframe`. The
+                categories of each chunk are those observed in the chunk.
+
+        Yields:
+            pandas.DataFrame: The rows of :meth:`convert_to_dataframe` from
+            ``i * chunk_size`` to ``(i + 1) * chunk_size``.
         """
+        for start in range(0, self.features.shape[0], chunk_size):
+            df = self._build_dataframe(slice(start, start + chunk_size))
+            if de_dummy_code:
+                df = self._decode_dataframe(df, sep=sep,
+                                            set_category=set_category)
+            yield df
 
-        if export_metadata:
-            raise NotImplementedError("The option to export metadata has not been implemented yet")
+    # scalar attributes of subclasses (e.g. BinaryLabelDataset) that are
+    # written by export_dataset and restored by import_dataset
+    _exported_attributes = ('favorable_label', 'unfavorable_label')
+
+    @staticmethod
+    def _file_format(path, format):
+        if format is None:
+            ext = os.path.splitext(str(path))[1].lower()
+            format = 'arrow' if ext in ('.arrow', '.feather', '.ipc') else 'parquet'
+        if format not in ('parquet', 'arrow'):
+            raise ValueError("format must be 'parquet' or 'arrow', got "
+                             "{!r}".format(format))
+        return format
+
+    def export_dataset(self, path=None, format=None, export_metadata=False,
+                       all_fields=False, compression=None, batch_size=65536):
+        """Export the dataset to a Parquet or Arrow IPC (Feather) file.
+
+        The file has one typed float64 column per feature and label, as in
+        :meth:`convert_to_dataframe` (the `protected_attributes` override the
+        corresponding features). Names, protected attribute values and label
+        values are stored in the schema metadata so that
+        :meth:`import_dataset` restores the dataset. Columns are handed to
+        pyarrow without building a DataFrame, and a file is written in
+        batches of rows so that features held in a :obj:`numpy.memmap` are
+        never copied into memory as a whole.
 
-        return None
+        Args:
+            path (str, optional): Output file. If `None`, the
+                :obj:`pyarrow.Table` is returned instead of being written.
+            format (str, optional): 'parquet' or 'arrow'. By default inferred
+                from the extension of `path` ('.arrow', '.feather' and '.ipc'
+                for Arrow IPC, Parquet otherwise).
+            export_metadata (bool): Also store the 'label_maps' and
+                'protected_attribute_maps' of the `metadata`.
+            all_fields (bool): Also write `instance_weights`, `scores` and
+                `instance_names` as columns 'instance_weights', '<label>_score'
+                and 'instance_names'. Leave `False` for files read as plain
+                feature tables, e.g. by the R models.
+            compression (str, optional): Compression codec passed to pyarrow.
+                Defaults to pyarrow's default for the format.
+            batch_size (int): Number of rows written at a time.
 
-    def import_dataset(self, import_metadata=False):
-        """ Import the dataset and supporting attributes
-            TODO: The preferred file format is HDF
+        Returns:
+            pyarrow.Table: The exported table if `path` is `None`, otherwise
+            `None`.
         """
+        fields = {}
+        if all_fields:
+            fields = {
+                'instance_weights': 'instance_weights',
+                'scores': ['{}_score'.format(l) for l in self.label_names],
+                'instance_names': 'instance_names'}
+            clash = (set(self.feature_names) | set(self.label_names)) & set(
+                fields['scores'] + ['instance_weights', 'instance_names'])
+            if clash:
+                raise ValueError("Columns {} clash with the instance_weights, "
+                                 "scores or instance_names columns.".format(
+                                     sorted(clash)))
+
+        info = {
+            'class': type(self).__name__,
+            'feature_names': self.feature_names,
+            'label_names': self.label_names,
+            'protected_attribute_names': self.protected_attribute_names,
+            'privileged_protected_attributes': [np.asarray(v).tolist()
+                for v in self.privileged_protected_attributes],
+            'unprivileged_protected_attributes': [np.asarray(v).tolist()
+                for v in self.unprivileged_protected_attributes],
+            'attributes': {name: getattr(self, name)
+                for name in self._exported_attributes if hasattr(self, name)},
+            'fields': fields}
+        if export_metadata:
+            # lists of (value, name) pairs keep the float values of the maps
+            info['metadata'] = {key: [list(m.items()) for m in self.metadata[key]]
+                for key in ('label_maps', 'protected_attribute_maps')
+                if key in self.metadata}
+        schema_metadata = {'aif360': json.dumps(info)}
+
+        def rows(start, stop):
+            # slicing rows first keeps a memmap slice small and contiguous
+            features = self.features[start:stop]
+            if sp.issparse(features):
+                features = features.toarray()
+            columns = {name: features[:, j]
+                       for j, name in enumerate(self.feature_names)}
+            columns.update(zip(self.label_names, self.labels[start:stop].T))
+            columns.update(zip(self.protected_attribute_names,
+                               self.protected_attributes[start:stop].T))
+            if all_fields:
+                columns['instance_weights'] = self.instance_weights[start:stop]
+                columns.update(zip(fields['scores'],
+                                   self.scores[start:stop].T))
+                columns['instance_names'] = [str(n) for n in
+                                             self.instance_names[start:stop]]
+            return pa.table({name: pa.array(values)
+                             for name, values in columns.items()},
+                            metadata=schema_metadata)
+
+        n = self.features.shape[0]
+        if path is None:
+            return rows(0, n)
 
+        first = rows(0, min(batch_size, n))
+        if self._file_format(path, format) == 'parquet':
+            writer = pq.ParquetWriter(path, first.schema,
+                                      compression=compression or 'snappy')
+        else:
+            if compression is None:
+                # the default of feather.write_feather
+                compression = 'lz4' if pa.Codec.is_available('lz4') else None
+            elif compression == 'uncompressed':
+                compression = None
+            writer = pa.ipc.new_file(path, first.schema,
+                options=pa.ipc.IpcWriteOptions(compression=compression))
+        with writer:
+            writer.write_table(first)
+            for start in range(batch_size, n, batch_size):
+                writer.write_table(rows(start, start + batch_size))
+
+    @classmethod
+    def import_dataset(cls, path, format=None, import_metadata=False,
+                       memmap_file=None, batch_size=65536):
+        """Import a dataset written by :meth:`export_dataset`.
+
+        The feature, label and protected attribute arrays are assembled
+        directly from the columns of the file without building a DataFrame.
+
+        Args:
+            path (str or pyarrow.Table): Parquet or Arrow IPC file, or a table
+                returned by :meth:`export_dataset`.
+            format (str, optional): 'parquet' or 'arrow'. By default inferred
+                from the extension of `path`.
+            import_metadata (bool): Restore the 'label_maps' and
+                'protected_attribute_maps' if they were exported.
+            memmap_file (str, optional): Write the features to this '.npy'
+                file and return them as a :obj:`numpy.memmap`, filled
+                `batch_size` rows at a time, instead of in memory.
+            batch_size (int): Number of rows copied at a time into
+                `memmap_file`.
+
+        Returns:
+            StructuredDataset: A dataset of this class, e.g.
+            ``BinaryLabelDataset.import_dataset(path)`` returns a
+            :obj:`BinaryLabelDataset`.
+        """
+        if isinstance(path, pa.Table):
+            table = path
+        elif cls._file_format(path, format) == 'parquet':
+            table = pq.read_table(path)
+        else:
+            table = feather.read_table(path)
+
+        if not table.schema.metadata or b'aif360' not in table.schema.metadata:
+            raise ValueError("{} was not written by export_dataset.".format(
+                path))
+        info = json.loads(table.schema.metadata[b'aif360'])
+        fields = info['fields']
+        n = table.num_rows
+
+        def block(names, table=table):
+            if not names:
+                return np.empty((table.num_rows, 0))
+            return np.column_stack([table.column(name).to_numpy()
+                                    for name in names]).astype(np.float64)
+
+        if memmap_file is None:
+            features = block(info['feature_names'])
+        else:
+            features = np.lib.format.open_memmap(memmap_file, mode='w+',
+                dtype=np.float64, shape=(n, len(info['feature_names'])))
+            for start in range(0, n, batch_size):
+                features[start:start + batch_size] = block(
+                    info['feature_names'],
+                    table.slice(start, batch_size))
+            features.flush()
+
+        metadata = {}
         if import_metadata:
-            raise NotImplementedError("The option to import metadata has not been implemented yet")
-        return None
+            metadata = {key: [{k: v for k, v in m} for m in maps]
+                        for key, maps in info.get('metadata', {}).items()}
+
+        dataset = cls.from_arrays(
+            features, block(info['label_names']),
+            info['feature_names'], info['label_names'],
+            info['protected_attribute_names'],
+            info['privileged_protected_attributes'],
+            info['unprivileged_protected_attributes'],
+            scores=block(fields['scores']) if 'scores' in fields else None,
+            instance_weights=(table.column(fields['instance_weights'])
+                              .to_numpy().astype(np.float64)
+                              if 'instance_weights' in fields else None),
+            instance_names=(table.column(fields['instance_names']).to_pylist()
+                            if 'instance_names' in fields else None),
+            metadata=metadata, **info['attributes'])
+        dataset.metadata.update({
+            'transformer': '{}.import_dataset'.format(cls.__name__),
+            'params': {'path': path if not isinstance(path, pa.Table) else None,
+                       'format': format, 'import_metadata': import_metadata,
+                       'memmap_file': memmap_file}})
+        return dataset
+
+    @classmethod
+    def from_arrays(cls, features, labels, feature_names, label_names,
+                    protected_attribute_names, privileged_protected_attributes,
+                    unprivileged_protected_attributes, scores=None,
+                    instance_weights=None, instance_names=None, metadata=None,
+                    **attributes):
+        """Create a dataset directly from arrays, e.g. ones filled chunk by
+        chunk, without building a DataFrame.
+
+        Unlike the constructor, float64 arrays are not copied, so `features`
+        may be a :obj:`numpy.memmap`.
+
+        Args:
+            features (numpy.ndarray): An (n_instances, n_features) array.
+            labels (numpy.ndarray): An (n_instances, n_labels) array.
+            feature_names (list(str)): Names of the columns of `features`.
+            label_names (list(str)): Names of the columns of `labels`.
+            protected_attribute_names (list(str)): Names of the features which
+                are protected attributes.
+            privileged_protected_attributes (list): Privileged values of each
+                protected attribute.
+            unprivileged_protected_attributes (list): Unprivileged values of
+                each protected attribute.
+            scores (numpy.ndarray, optional): Defaults to a copy of `labels`.
+            instance_weights (numpy.ndarray, optional): Defaults to ones.
+            instance_names (list, optional): Defaults to the row numbers.
+            metadata (dict, optional): Additional metadata to append.
+            **attributes: Attributes of the dataset class, e.g.
+                `favorable_label` and `unfavorable_label` of a
+                :obj:`BinaryLabelDataset`.
+
+        Returns:
+            StructuredDataset: A dataset of this class.
+        """
+        n = features.shape[0]
+        dataset = cls.__new__(cls)
+        for name, value in attributes.items():
+            setattr(dataset, name, value)
+        dataset.feature_names = list(feature_names)
+        dataset.label_names = list(label_names)
+        dataset.protected_attribute_names = list(protected_attribute_names)
+        dataset.features = features
+        dataset.labels = labels
+        prot = features[:, [dataset.feature_names.index(name)
+                            for name in dataset.protected_attribute_names]]
+        dataset.protected_attributes = (prot.toarray() if sp.issparse(prot)
+                                        else prot)
+        dataset.scores = scores if scores is not None else labels.copy()
+        dataset.instance_weights = (instance_weights
+            if instance_weights is not None else np.ones(n))
+        dataset.instance_names = (list(map(str, instance_names))
+            if instance_names is not None else list(map(str, range(n))))
+        dataset.privileged_protected_attributes = [np.array(v, dtype=np.float64)
+            for v in privileged_protected_attributes]
+        dataset.unprivileged_protected_attributes = [
+            np.array(v, dtype=np.float64)
+            for v in unprivileged_protected_attributes]
+        dataset.ignore_fields = {'metadata', 'ignore_fields'}
+
+        # sets metadata and validates the dataset
+        super(StructuredDataset, dataset).__init__(metadata=metadata)
+        return dataset
 
     def split(self, num_or_size_splits, shuffle=False, seed=None):
         """Split the dataset into multiple datasets
@@ -433,28 +803,20 @@ class StructuredDataset(Dataset):
         else:
             num_folds = num_or_size_splits
 
-        order = list(np.random.permutation(n) if shuffle else range(n))
+        order = np.random.permutation(n) if shuffle else np.arange(n)
         folds = [self.copy() for _ in range(num_folds)]
 
-        features = np.array_split(self.features[order], num_or_size_splits)
-        labels = np.array_split(self.labels[order], num_or_size_splits)
-        scores = np.array_split(self.scores[order], num_or_size_splits)
-        protected_attributes = np.array_split(self.protected_attributes[order],
-            num_or_size_splits)
-        instance_weights = np.array_split(self.instance_weights[order],
-            num_or_size_splits)
-        instance_names = np.array_split(np.array(self.instance_names)[order],
-            num_or_size_splits)
-        for fold, feats, labs, scors, prot_attrs, inst_wgts, inst_name in zip(
-                folds, features, labels, scores, protected_attributes, instance_weights,
-                instance_names):
-
-            fold.features = feats
-            fold.labels = labs
-            fold.scores = scors
-            fold.protected_attributes = prot_attrs
-            fold.instance_weights = inst_wgts
-            fold.instance_names = list(map(str, inst_name))
+        # split the row order rather than each array so that sparse features
+        # are split the same way
+        instance_names = np.array(self.instance_names)
+        for fold, rows in zip(folds, np.array_split(order, num_or_size_splits)):
+
+            fold.features = self.features[rows]
+            fold.labels = self.labels[rows]
+            fold.scores = self.scores[rows]
+            fold.protected_attributes = self.protected_attributes[rows]
+            fold.instance_weights = self.instance_weights[rows]
+            fold.instance_names = list(map(str, instance_names[rows]))
             fold.metadata = fold.metadata.copy()
             fold.metadata.update({
                 'transformer': '{}.split'.format(type(self).__name__),
@@ -465,6 +827,27 @@ class StructuredDataset(Dataset):
 
         return folds
 
+    def to_sparse(self):
+        """Convert the features to a compressed sparse row matrix.
+
+        Useful for mostly zero, e.g. dummy coded, features. Algorithms that
+        accept sparse features (e.g.
+        :obj:`~aif360.algorithms.inprocessing.PrejudiceRemover`) then avoid
+        dense copies; other fields stay dense.
+
+        Returns:
+            StructuredDataset: A shallow copy with
+            :obj:`scipy.sparse.csr_matrix` features.
+        """
+        sparse = self.copy()
+        sparse.features = sp.csr_matrix(self.features, dtype=np.float64)
+        sparse.metadata.update({
+            'transformer': '{}.to_sparse'.format(type(self).__name__),
+            'params': {},
+            'previous': [self]
+        })
+        return sparse
+
     @staticmethod
     def _de_dummy_code_df(df, sep="=", set_category=False):
         """De-dummy code a dummy-coded dataframe obtained with pd.get_dummies().
@@ -472,6 +855,10 @@ class StructuredDataset(Dataset):
         After reversing dummy coding the corresponding fields will be converted
         to categorical.
 
+        Each block of dummy columns is decoded at once into integer codes (the
+        last dummy equal to 1, missing if there is none) and the categorical
+        is built from the codes of its observed categories.
+
         Args:
             df (pandas.DataFrame): Input dummy coded dataframe
             sep (char): Separator between base name and dummy code
@@ -488,20 +875,30 @@ class StructuredDataset(Dataset):
         """
 
         feature_names_dum_d, feature_names_nodum = \
-            StructuredDataset._parse_feature_names(df.columns)
-        df_new = pd.DataFrame(index=df.index,
-            columns=feature_names_nodum + list(feature_names_dum_d.keys()))
-
-        for fname in feature_names_nodum:
-            df_new[fname] = df[fname].values.copy()
+            StructuredDataset._parse_feature_names(df.columns, sep=sep)
+        columns = {fname: df[fname].values.copy()
+                   for fname in feature_names_nodum}
 
         for fname, vl in feature_names_dum_d.items():
-            for v in vl:
-                df_new.loc[df[fname+sep+str(v)] == 1, fname] = str(v)
+            # code of the last dummy equal to 1, or -1 (NaN) if there is none
+            dummies = df[[fname+sep+str(v) for v in vl]].values == 1
+            codes = np.max(dummies * np.arange(1, len(vl) + 1), axis=1) - 1
 
-        if set_category:
-            for fname in feature_names_dum_d.keys():
-                df_new[fname] = df_new[fname].astype('category')
+            # keep only the observed categories, in sorted order
+            counts = np.bincount(codes + 1, minlength=len(vl) + 1)[1:]
+            observed = sorted(np.flatnonzero(counts), key=lambda c: vl[c])
+            recode = np.full(len(vl) + 1, -1)
+            recode[observed] = np.arange(len(observed))
+            values = pd.Categorical.from_codes(recode[codes],
+                [str(vl[c]) for c in observed])
+
+            columns[fname] = values
+
+        df_new = pd.DataFrame(columns, index=df.index,
+            columns=feature_names_nodum + list(feature_names_dum_d.keys()))
+        if not set_category:
+            df_new = df_new.astype({fname: object
+                                    for fname in feature_names_dum_d.keys()})
 
         return df_new
 
@@ -0,0 +1,161 @@
+"""Pareto frontiers of trade-offs between metrics, e.g. profit vs. fairness."""
+import numpy as np
+
+
+def _as_costs(points, maximize=None):
+    """Return `points` as a float (n_points, n_objectives) array of costs to be
+    minimized, negating the objectives flagged in `maximize`."""
+    costs = np.array(points, dtype=np.float64, ndmin=2)
+    if maximize is not None:
+        maximize = np.broadcast_to(np.asarray(maximize, dtype=bool),
+                                   costs.shape[1:])
+        costs[:, maximize] = -costs[:, maximize]
+    return costs
+
+
+def _frontier_2d(costs):
+    # sort by the first cost, ties by the second, and scan: a point is
+    # efficient if it has the lowest second cost among points with the same
+    # first cost and beats every point with a strictly lower first cost
+    order = np.lexsort((costs[:, 1], costs[:, 0]))
+    c0, c1 = costs[order, 0], costs[order, 1]
+
+    new_group = np.empty(len(c0), dtype=bool)
+    new_group[:1] = True
+    np.not_equal(c0[1:], c0[:-1], out=new_group[1:])
+    group_start = np.maximum.accumulate(
+        np.where(new_group, np.arange(len(c0)), 0))
+
+    best_before = np.concatenate([[np.inf], np.minimum.accumulate(c1)])
+    efficient = (c1 == c1[group_start]) & (c1 < best_before[group_start])
+
+    mask = np.zeros(len(c0), dtype=bool)
+    mask[order[efficient]] = True
+    return mask
+
+
+def _dominated(costs, others):
+    """Which rows of `costs` are dominated by any row of `others`."""
+    weakly_better = np.all(others[None, :, :] <= costs[:, None, :], axis=2)
+    strictly_better = np.any(others[None, :, :] < costs[:, None, :], axis=2)
+    return np.any(weakly_better & strictly_better, axis=1)
+
+
+def _frontier_nd(costs, chunk_size):
+    # a dominating point has a lower sum of costs (and is lexicographically
+    # smaller on ties), so in this order a chunk can only be dominated by the
+    # frontier found so far or by points of the same chunk
+    order = np.lexsort(tuple(costs[:, ::-1].T) + (costs.sum(axis=1),))
+    sorted_costs = costs[order]
+
+    efficient = np.zeros(costs.shape[0], dtype=bool)
+    frontier = sorted_costs[:0]
+    for start in range(0, costs.shape[0], chunk_size):
+        chunk = sorted_costs[start:start + chunk_size]
+        keep = ~(_dominated(chunk, frontier) | _dominated(chunk, chunk))
+        efficient[start:start + chunk_size] = keep
+        frontier = np.vstack([frontier, chunk[keep]])
+
+    mask = np.zeros(costs.shape[0], dtype=bool)
+    mask[order[efficient]] = True
+    return mask
+
+
+def pareto_frontier(points, maximize=None, return_mask=True, chunk_size=256):
+    """Find the Pareto-efficient (non-dominated) points.
+
+    A point is dominated if another point is at least as good in every
+    objective and strictly better in at least one. Duplicated efficient points
+    are all kept. Two objectives are handled by sorting and scanning in
+    O(n log n); more objectives by a vectorized dominance check of chunks of
+    `chunk_size` points against the frontier found so far.
+
+    Args:
+        points (array-like): An (n_points, n_objectives) array.
+        maximize (bool or list(bool), optional): Objectives to be maximized.
+            By default all objectives are minimized.
+        return_mask (bool): Return a boolean mask if `True`, else the integer
+            indices of efficient points.
+        chunk_size (int): Number of points checked at once when there are more
+            than two objectives.
+
+    Returns:
+        numpy.ndarray: An (n_points,) boolean mask or the
+        (n_efficient_points,) sorted indices of the efficient points.
+
+    Examples:
+        >>> # minimize fairness difference, maximize profit
+        >>> pareto_frontier([[0.1, 5.], [0.2, 4.], [0.3, 6.]],
+        ...                 maximize=[False, True])
+        array([ True, False,  True])
+    """
+    costs = _as_costs(points, maximize)
+    if costs.shape[0] == 0:
+        mask = np.zeros(0, dtype=bool)
+    elif costs.shape[1] == 1:
+        mask = costs[:, 0] == costs[:, 0].min()
+    elif costs.shape[1] == 2:
+        mask = _frontier_2d(costs)
+    else:
+        mask = _frontier_nd(costs, chunk_size)
+
+    return mask if return_mask else np.flatnonzero(mask)
+
+
+class ParetoFrontier(object):
+    """Pareto frontier that is updated as new points arrive.
+
+    Only the current frontier is stored, so each insertion costs
+    O((f + m) log(f + m)) for a frontier of f points and m new points with two
+    objectives.
+
+    Examples:
+        >>> frontier = ParetoFrontier(maximize=[False, True])
+        >>> frontier.add([[0.1, 5.], [0.2, 4.]], keys=['ROC', 'EOP'])
+        >>> frontier.add([[0.3, 6.]], keys=['PR'])
+        >>> frontier.keys
+        ['ROC', 'PR']
+    """
+
+    def __init__(self, maximize=None, chunk_size=256):
+        """
+        Args:
+            maximize (bool or list(bool), optional): Objectives to be
+                maximized. By default all objectives are minimized.
+            chunk_size (int): See :func:`pareto_frontier`.
+        """
+        self.maximize = maximize
+        self.chunk_size = chunk_size
+        self.points = None
+        self.keys = []
+        self.num_added = 0
+
+    def add(self, points, keys=None):
+        """Insert new points and drop everything they dominate.
+
+        Args:
+            points (array-like): An (n_points, n_objectives) array.
+            keys (list, optional): Identifiers of the new points, e.g.
+                (processor, hyperparameter, model, fold) tuples. Defaults to
+                the running number of each point across all insertions.
+
+        Returns:
+            numpy.ndarray(bool): Which of the new points entered the frontier.
+        """
+        points = np.array(points, dtype=np.float64, ndmin=2)
+        if keys is None:
+            keys = list(range(self.num_added, self.num_added + len(points)))
+        elif len(keys) != len(points):
+            raise ValueError("keys and points should have the same length.")
+
+        num_old = 0 if self.points is None else len(self.points)
+        candidates = points if self.points is None else np.vstack(
+            [self.points, points])
+        mask = pareto_frontier(candidates, maximize=self.maximize,
+                               chunk_size=self.chunk_size)
+
+        self.num_added += len(points)
+        all_keys = self.keys + list(keys)
+        self.points = candidates[mask]
+        self.keys = [k for k, m in zip(all_keys, mask) if m]
+        return mask[num_old:]
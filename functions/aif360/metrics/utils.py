@@ -38,6 +38,28 @@ def compute_boolean_conditioning_vector(X, feature_names, condition=None):
 
     return overall_cond
 
+def compute_group_index(X, feature_names, conditions):
+    """Compute the index of the first condition each instance satisfies.
+
+    Args:
+        X (numpy.ndarray): Dataset features.
+        feature_names (list): Names of the features.
+        conditions (list(list(dict))): Conditions in the same format as
+            :func:`compute_boolean_conditioning_vector`, e.g.
+            `[privileged_groups, unprivileged_groups]`.
+
+    Returns:
+        numpy.ndarray(int): Group index vector. Shape is `[n]` where `n` is
+        `X.shape[0]`. Values are the position in `conditions` of the first
+        condition satisfied by the corresponding row, or `-1` if it satisfies
+        none of them.
+    """
+    group = np.full(X.shape[0], -1, dtype=np.intp)
+    for g in reversed(range(len(conditions))):
+        group[compute_boolean_conditioning_vector(X, feature_names,
+                                                  conditions[g])] = g
+    return group
+
 def compute_num_instances(X, w, feature_names, condition=None):
     """Compute the number of instances, :math:`n`, conditioned on the protected
     attribute(s).
@@ -4,34 +4,64 @@
 #
 ###########################
 
+import hashlib
+import inspect
+import os
+import re
+import warnings
+
 import pandas as pd
 from aif360.datasets import BinaryLabelDataset
 from aif360.datasets import StandardDataset
 import numpy as np
 
-def load_dataset(path, data):
-    '''Imports and prepares data set using one of helper functions'''
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+
+# label and protected attribute maps shared by all data sets
+label_map               = {1.0: 'Good', 2.0: 'Bad'}
+protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
+
+# registry of data set specs, see the data set sections below
+datasets = {}
+
+
+def load_dataset(path, data, cache = True, cache_dir = None, **kwargs):
+    '''Imports and prepares data set using its spec in the registry
     
-    if data == 'taiwan':
-        df = load_taiwan(path)
-        
-    if data == 'german':
-        df = load_german(path)
-        
-    if data == 'uk':
-        df = load_uk(path)  
-        
-    if data == 'bene':
-        df = load_bene(path)  
-        
-    if data == 'homecredit':
-        df = load_homecredit(path)  
-        
-    if data == 'gmsc':
-        df = load_gmsc(path)          
-        
-    if data == 'pkdd':
-        df = load_pkdd(path)          
+    path is the raw CSV or the folder holding the file named in the spec.
+    Prepared data sets are cached in cache_dir (defaults to the cache/ folder
+    next to the raw CSV), so repeated loads of an unchanged CSV and spec read
+    a memory-mapped Arrow file instead of parsing and encoding the CSV again.
+    Set cache = False to always rebuild the data set. Further arguments are
+    passed to load_spec, e.g. chunksize to stream large CSV files and
+    memmap_file to keep the features on disk.'''
+    
+    if data not in datasets:
+        raise ValueError('Unknown data set: {}'.format(data))
+    spec = datasets[data]
+    
+    if os.path.isdir(path):
+        path = os.path.join(path, spec['file'])
+    
+    if not cache:
+        return load_spec(path, spec, **kwargs)
+    
+    if feather is None:
+        warnings.warn('pyarrow is not installed, data set is not cached')
+        return load_spec(path, spec, **kwargs)
+    
+    # cache the data set before shuffling so that every load gets a new order
+    shuffle     = spec.get('shuffle', False)
+    memmap_file = kwargs.pop('memmap_file', None)
+    build_file  = unshuffled_file(memmap_file) if shuffle and memmap_file else memmap_file
+    
+    df = load_cached(data, spec, path, cache_dir, memmap_file = build_file, **kwargs)
+    if shuffle:
+        df = shuffle_dataset(df, memmap_file)
 
     return df
 
@@ -39,112 +69,120 @@ def load_dataset(path, data):
 
 ###########################
 #
-#         TAIWAN
+#         COMPILED LOADER
 #
 ###########################
 
-def load_taiwan(filepath):
-    '''Imports and prepares taiwan data set'''
+# A data set spec is a dict with the keys:
+#   file        - name of the raw CSV
+#   read_args   - optional extra arguments of pd.read_csv
+#   protected   - {name: expression}, rows where the expression holds are
+#                 privileged (1.0), e.g. {'AGE': 'age > 25'}
+#   rename      - {raw name: name}, renamed columns are moved to the end
+#   derive      - optional {name: expression} of new columns
+#   query       - optional expression of the rows to keep
+#   recode      - optional {name: (map, default)}, values missing from the
+#                 map become default or are kept if default is None
+#   label_map   - map of the TARGET values to 1.0 (good) and 2.0 (bad)
+#   features    - features to keep, including the protected attribute
+#   categorical - features to one-hot encode
+#   shuffle     - optional, shuffle the rows on every load
+# Expressions are evaluated by DataFrame.eval on the raw column names.
+
+def compile_spec(spec):
+    '''Compiles data set spec into read_csv and StandardDataset arguments'''
     
-    # read CSV
-    df = pd.read_csv(filepath, sep = ',', na_values = [])
+    rename      = spec.get('rename', {})
+    derive      = spec.get('derive', {})
+    recode      = spec.get('recode', {})
+    categorical = spec.get('categorical', [])
+    features    = spec['features'] + ['TARGET']
     
-    # prepare features
-    df = df.rename(columns = {'default.payment.next.month': 'TARGET'})
-    del df['ID']
-    df['AGE'] = df['AGE'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    df['CREDIT_AMNT'] = df['BILL_AMT1'] - df['PAY_AMT1']
-    df = df.loc[df['CREDIT_AMNT'] > 0].reset_index(drop = True)
-    df = df.sample(frac = 1).reset_index(drop = True)
-
-    # feature lists
-    XD_features = ["LIMIT_BAL", "SEX","EDUCATION","MARRIAGE","AGE",
-                "PAY_2","PAY_3","PAY_4","PAY_5","PAY_6","BILL_AMT1",
-                "BILL_AMT2","BILL_AMT3","BILL_AMT4","BILL_AMT5","BILL_AMT6",
-                "PAY_AMT1","PAY_AMT2","PAY_AMT3","PAY_AMT4","PAY_AMT5",
-                "PAY_AMT6", "CREDIT_AMNT"]
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = ['SEX', 'EDUCATION', 'MARRIAGE', "PAY_0",
-                            "PAY_2","PAY_3","PAY_4","PAY_5","PAY_6"]
-    
-    # protected attrbute
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
+    # raw columns: kept features under their raw names and expression inputs
+    raw_names   = {v: k for k, v in rename.items()}
+    expressions = list(spec['protected'].values()) + list(derive.values()) + [spec.get('query', '')]
+    inputs      = set(re.findall(r'[A-Za-z_]\w*', ' '.join(expressions)))
+    raw_columns = set(raw_names.get(f, f) for f in features + categorical) | inputs
+    
+    # numeric columns are parsed as floats, categorical codes keep inferred
+    # dtypes as their values become dummy names (e.g. PAY_2=0)
+    dtypes = {c: np.float64 for c in raw_columns if rename.get(c, c) not in categorical + ['TARGET']}
+    
+    read_args = dict(sep = ',', na_values = [], dtype = dtypes)
+    read_args.update(spec.get('read_args', {}))
+    # an unnamed index column cannot be selected by name
+    if 'index_col' not in read_args:
+        read_args['usecols'] = lambda c: c in raw_columns
+    
+    # vectorized preprocessing
+    def preprocessing(df):
         
-    # define factor encoding
-    def default_preprocessing(df):
+        # protected attributes, renamed and derived columns
+        for name, expression in spec['protected'].items():
+            df[name] = np.where(df.eval(expression), 1.0, 0.0)
+        for raw, name in rename.items():
+            df[name] = df.pop(raw)
+        for name, expression in derive.items():
+            df[name] = df.eval(expression)
         
-        def label_sex(x):
-            if x == 1:
-                return 'Male'
-            elif x == 2:
-                return 'Female'
-            else:
-                return 'NA'
-
-        def label_education(x):
-            if x == 1:
-                return 'graduate_school'
-            elif x == 2:
-                return 'university'
-            elif x == 3:
-                return 'high_school'
-            elif x == 4:
-                return 'others'
-            elif x == 5:
-                return 'others'
-            elif x == 6:
-                return 'others'
+        # factor encoding
+        for name, (mapping, default) in recode.items():
+            if default is None:
+                df[name] = df[name].replace(mapping)
             else:
-                return 'others'
-
-        def label_marriage(x):
-            if x == 1:
-                return 'married'
-            elif x == 2:
-                return 'single'
-            elif x == 3:
-                return 'others'
-            else:
-                return 'others'
+                df[name] = df[name].map(mapping).fillna(default)
         
-        def label_pay(x):
-            if x in [-2,-1]:
-                return 0
-            else:
-                return x
-    
-        # apply emcoding
-        df['SEX']       = df['SEX'].apply(lambda x: label_sex(x))
-        df['EDUCATION'] = df['EDUCATION'].apply(lambda x: label_education(x))
-        df['MARRIAGE']  = df['MARRIAGE'].apply(lambda x: label_marriage(x))
+        # target encoding
+        df['TARGET'] = df['TARGET'].map(spec['label_map'])
         
-        # pay features
-        pay_col = ["PAY_0","PAY_2","PAY_3","PAY_4","PAY_5","PAY_6"]
-        for p in pay_col:
-            df[p] = df[p].apply(lambda x: label_pay(x))
+        # row filter
+        if spec.get('query'):
+            df = df[df.eval(spec['query']).to_numpy()]
         
-        # target encoding
-        status_map   = {0: 1.0, 1: 2.0}
-        df['TARGET'] = df['TARGET'].replace(status_map)
-                
         return df
     
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
+    dataset_args = dict(
+        label_name                = 'TARGET',
         favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
+        protected_attribute_names = list(spec['protected']),
+        privileged_classes        = [[1.0]] * len(spec['protected']),
         instance_weights_name     = None,
-        categorical_features      = categorical_features,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]},
-        custom_preprocessing      = default_preprocessing)
+        categorical_features      = categorical,
+        features_to_keep          = features,
+        metadata                  = {'label_maps':               spec.get('label_maps', [label_map]),
+                                     'protected_attribute_maps': spec.get('protected_attribute_maps',
+                                                                          [protected_attribute_map])},
+        custom_preprocessing      = preprocessing)
+    
+    return read_args, dataset_args
+
+
+def load_spec(filepath, spec, shuffle = None, chunksize = None, memmap_file = None):
+    '''Imports and prepares data set described by spec
+    
+    shuffle defaults to the spec. Large CSV files can be streamed in chunks
+    of chunksize rows, see load_chunked. If memmap_file is given, the
+    features are returned as a memory-mapped .npy file.'''
+    
+    if shuffle is None:
+        shuffle = spec.get('shuffle', False)
+    build_file = unshuffled_file(memmap_file) if shuffle and memmap_file else memmap_file
+    
+    read_args, dataset_args = compile_spec(spec)
+    
+    # convert DF
+    if chunksize:
+        df_standard = load_chunked(filepath, read_args, chunksize, memmap_file = build_file, **dataset_args)
+    else:
+        df_standard = StandardDataset(df = pd.read_csv(filepath, **read_args), **dataset_args)
+        if build_file:
+            features    = np.lib.format.open_memmap(build_file, mode = 'w+', dtype = np.float64,
+                                                    shape = df_standard.features.shape)
+            features[:] = df_standard.features
+            df_standard.features = features
+    
+    if shuffle:
+        df_standard = shuffle_dataset(df_standard, memmap_file)
     
     return df_standard
 
@@ -152,174 +190,338 @@ def load_taiwan(filepath):
 
 ###########################
 #
-#         GERMAN
+#         CACHE
 #
 ###########################
 
-def load_german(filepath):
-    '''Imports and prepares german data set'''
+def cache_key(spec, filepath):
+    '''Computes hash of the raw CSV contents and the data set spec'''
+    
+    key = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            key.update(block)
     
-    # read CSV
-    df = pd.read_csv(filepath, sep=',', na_values=[], index_col=0)
+    # rebuild the cache when the spec, the loader or the libraries change
+    key.update(repr(sorted(spec.items())).encode())
+    key.update(inspect.getsource(compile_spec).encode())
+    key.update(' '.join([pd.__version__, np.__version__]).encode())
     
-    # prepare features
-    df['AGE'] = df['age'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    del df['age']
-    df['CREDIT_AMNT'] = df['amount']
-    del df['amount']
-    df['TARGET'] = df['BAD']
-    del df['BAD']
+    return key.hexdigest()[:16]
 
-    # feature lists
-    XD_features = ["account_status", "duration","credit_history","purpose","CREDIT_AMNT","savings",
-                "employment","installment_rate","status_gender","guarantors","resident_since","property",
-                "AGE","other_plans","housing","num_credits","job",
-                "people_maintenance","phone","foreign"]
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = ['account_status', 'credit_history', 'purpose', "savings",
-                            "employment","status_gender","guarantors","property","other_plans",
-                           'housing', 'job', 'phone', 'foreign']
 
-    # protected attribtue
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
+def load_cached(data, spec, filepath, cache_dir = None, **kwargs):
+    '''Imports data set from cache or prepares and caches it
+    
+    With memmap_file, a cached data set is copied into the memory-mapped
+    features in blocks of rows, and a new one is written in blocks of rows.'''
+    
+    # cache file
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), 'cache')
+    cache_file = os.path.join(cache_dir, data + '_' + cache_key(spec, filepath) + '.arrow')
+    
+    if os.path.exists(cache_file):
+        table = feather.read_table(cache_file, memory_map = True)
+        df = StandardDataset.import_dataset(table, memmap_file = kwargs.get('memmap_file'))
+        df.metadata.update({'label_maps':               spec.get('label_maps', [label_map]),
+                            'protected_attribute_maps': spec.get('protected_attribute_maps',
+                                                                 [protected_attribute_map])})
+        return df
+    
+    # prepare data set
+    df = load_spec(filepath, spec, shuffle = False, **kwargs)
+    
+    # replace outdated cache files of the same data set, leaving other files alone
+    os.makedirs(cache_dir, exist_ok = True)
+    for f in os.listdir(cache_dir):
+        if re.fullmatch(re.escape(data) + r'_[0-9a-f]{16}\.arrow', f):
+            os.remove(os.path.join(cache_dir, f))
+    
+    # write uncompressed Arrow file to allow memory mapping
+    tmp_file = cache_file + '.' + str(os.getpid())
+    df.export_dataset(tmp_file, format = 'arrow', all_fields = True, compression = 'uncompressed')
+    os.replace(tmp_file, cache_file)
+    
+    return df
 
-    # target encoding
-    status_map   = {'GOOD': 1.0, 'BAD': 2.0}
-    df['TARGET'] = df['TARGET'].replace(status_map)
+
+def unshuffled_file(memmap_file):
+    '''Temporary file of memory-mapped features before shuffling'''
     
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
-        favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
-        instance_weights_name     = None,
-        categorical_features      = categorical_features,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]})
+    return os.path.splitext(memmap_file)[0] + '_unshuffled.npy'
+
+
+def shuffle_dataset(df, memmap_file = None, block_size = 65536):
+    '''Shuffles rows of data set and resets instance names
     
-    return df_standard
+    If memmap_file is given, the shuffled features are copied into it in
+    blocks of rows, so that memory-mapped features are never held in memory.
+    The temporary unshuffled_file of memmap_file is removed afterwards.'''
+    
+    idx = np.random.permutation(df.features.shape[0])
+    
+    if memmap_file is None:
+        df.features = df.features[idx]
+    else:
+        source   = df.features
+        features = np.lib.format.open_memmap(memmap_file, mode = 'w+', dtype = np.float64, shape = source.shape)
+        for start in range(0, len(idx), block_size):
+            features[start:start + block_size] = source[idx[start:start + block_size]]
+        features.flush()
+        df.features = features
+        
+        temp_file = unshuffled_file(memmap_file)
+        if isinstance(source, np.memmap) and os.path.abspath(source.filename) == os.path.abspath(temp_file):
+            del source
+            os.remove(temp_file)
+    
+    df.labels               = df.labels[idx]
+    df.scores               = df.scores[idx]
+    df.protected_attributes = df.protected_attributes[idx]
+    df.instance_weights     = df.instance_weights[idx]
+    df.instance_names       = [str(i) for i in range(len(idx))]
+    
+    return df
 
 
 
 ###########################
 #
-#         UK
+#         CHUNKED LOADING
 #
 ###########################
 
-def load_uk(filepath):
-    '''Imports and prepares uk data set'''
-    
-    # read CSV
-    df = pd.read_csv(filepath, sep = ',', na_values = [])
-    
-    # prepare features
-    df['AGE'] = df['Age'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    del df['Age']
-    df['CREDIT_AMNT'] = df['Amount']
-    del df['Amount']
-    df['TARGET'] = df['BAD']
-    del df['BAD']
-
-    # feature lists
-    XD_features = ["AGE", "CREDIT_AMNT", "Curadd", "Curremp", "Custgend", "Depchild", "Freqpaid", "Homephon",
-                   "Insprem", "Loantype", "Marstat", "Term", "Homeowns", "Purpose"] 
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = ['Custgend', 'Freqpaid', 'Homephon', "Loantype",
-                            "Marstat","Homeowns","Purpose"]
-
-    # protected attribute
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
-
-    # target encoding
-    status_map   = {'GOOD': 1.0, 'BAD': 2.0}
-    df['TARGET'] = df['TARGET'].replace(status_map)
+def load_chunked(filepath, read_args, chunksize, label_name, favorable_classes,
+                 protected_attribute_names, privileged_classes, instance_weights_name = None,
+                 categorical_features = [], features_to_keep = [], metadata = None,
+                 custom_preprocessing = None, memmap_file = None):
+    '''Imports and prepares large data set in chunks
     
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
-        favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
-        instance_weights_name     = None,
-        categorical_features      = categorical_features,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]})
+    Takes the arguments of StandardDataset and returns the same data set
+    without holding more than one chunk of the CSV as a DataFrame. A first
+    pass fixes the number of rows, the categories of each categorical feature
+    and the values of the label and protected attributes. A second pass
+    encodes each chunk into preallocated arrays. If memmap_file is given, the
+    features are written to a memory-mapped .npy file instead of memory.'''
     
-    return df_standard
+    def read_chunks():
+        for df in pd.read_csv(filepath, chunksize = chunksize, **read_args):
+            if custom_preprocessing:
+                df = custom_preprocessing(df)
+            keep = (set(features_to_keep or df.columns) | set(protected_attribute_names)
+                  | set(categorical_features) | set([label_name]))
+            if instance_weights_name:
+                keep |= set([instance_weights_name])
+            df = df[sorted(keep, key = df.columns.get_loc)]
+            yield df.dropna(), len(df)
+    
+    
+    ##### FIRST PASS
+    
+    n_rows, n_missing, columns = 0, 0, None
+    levels         = {f: [] for f in categorical_features}
+    label_values   = set()
+    label_numeric  = True
+    attr_values    = {a: set() for a in protected_attribute_names}
+    attr_numeric   = {a: True for a in protected_attribute_names}
+    
+    for df, n in read_chunks():
+        n_rows   += len(df)
+        n_missing += n - len(df)
+        columns   = df.columns
+        for f in categorical_features:
+            levels[f].append(df[f].drop_duplicates())
+        label_values.update(df[label_name].unique())
+        label_numeric &= np.issubdtype(df[label_name].dtype, np.number)
+        for a in protected_attribute_names:
+            attr_values[a].update(df[a].unique())
+            attr_numeric[a] &= np.issubdtype(df[a].dtype, np.number)
+    
+    if n_missing > 0:
+        warnings.warn('Missing Data: {} rows removed from StandardDataset.'.format(n_missing))
+    
+    # category vocabulary in the order of pd.get_dummies
+    categorical_features = sorted(categorical_features, key = columns.get_loc)
+    levels = {f: pd.Index(pd.concat(levels[f]).unique()).sort_values() for f in categorical_features}
+    
+    # feature names in the order of StandardDataset
+    numeric_features = [c for c in columns if c not in categorical_features
+                        and c not in [label_name, instance_weights_name]]
+    feature_names = numeric_features + ['{}={}'.format(f, v) for f in categorical_features for v in levels[f]]
+    
+    # map protected attributes to privileged/unprivileged
+    attr_maps, privileged, unprivileged = [], [], []
+    for a, vals in zip(protected_attribute_names, privileged_classes):
+        if callable(vals):
+            attr_maps.append(lambda x, vals = vals: x.apply(vals))
+            privileged.append([1.])
+            unprivileged.append([0.])
+        elif attr_numeric[a]:
+            attr_maps.append(lambda x: x)
+            privileged.append(vals)
+            unprivileged.append(list(attr_values[a].difference(vals)))
+        else:
+            attr_maps.append(lambda x, vals = vals: np.where(x.isin(vals), 1., 0.))
+            privileged.append([1.])
+            unprivileged.append([0.])
+    
+    # make labels binary
+    if callable(favorable_classes):
+        label_map_fn = lambda x: x.apply(favorable_classes)
+        favorable_label, unfavorable_label = 1., 0.
+    elif label_numeric and len(label_values) == 2:
+        label_map_fn = lambda x: x
+        favorable_label   = favorable_classes[0]
+        unfavorable_label = label_values.difference(favorable_classes).pop()
+    else:
+        label_map_fn = lambda x: np.where(x.isin(favorable_classes), 1., 0.)
+        favorable_label, unfavorable_label = 1., 0.
+    
+    
+    ##### SECOND PASS
+    
+    shape = (n_rows, len(feature_names))
+    if memmap_file:
+        features = np.lib.format.open_memmap(memmap_file, mode = 'w+', dtype = np.float64, shape = shape)
+    else:
+        features = np.zeros(shape)
+    labels           = np.empty((n_rows, 1))
+    instance_weights = np.ones(n_rows)
+    instance_names   = []
+    
+    start = 0
+    for df, _ in read_chunks():
+        stop = start + len(df)
+        rows = np.arange(start, stop)
+        
+        df = df.assign(**{a: attr_map(df[a]) for a, attr_map in zip(protected_attribute_names, attr_maps)})
+        features[start:stop, :len(numeric_features)] = df[numeric_features].to_numpy(dtype = np.float64)
+        
+        # one-hot encoding with the fixed vocabulary
+        offset = len(numeric_features)
+        for f in categorical_features:
+            codes = pd.Categorical(df[f], categories = levels[f]).codes
+            features[rows, offset + codes] = 1.0
+            offset += len(levels[f])
+        
+        labels[start:stop, 0] = label_map_fn(df[label_name])
+        if instance_weights_name:
+            instance_weights[start:stop] = df[instance_weights_name]
+        instance_names.extend(df.index.astype(str))
+        start = stop
+    
+    return StandardDataset.from_arrays(
+        features, labels, feature_names, [label_name], protected_attribute_names,
+        privileged, unprivileged,
+        instance_weights  = instance_weights,
+        instance_names    = instance_names,
+        metadata          = metadata,
+        favorable_label   = float(favorable_label),
+        unfavorable_label = float(unfavorable_label))
 
 
 
 ###########################
 #
-#         BENE
+#         TAIWAN
 #
 ###########################
 
-def load_bene(filepath):
-    '''Imports and prepares bene data set'''
-    
-    # read CSV
-    df = pd.read_csv(filepath, sep = ',', na_values = [])
-    
-    # prepare features
-    df['AGE'] = df['DGEBOA11'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    del df['DGEBOA11'], df['bin_DGEBOA11']
-    df['CREDIT_AMNT'] = df['BLENIA1']
-    del df['BLENIA1']
-    df['TARGET'] = df['BAD']
-    del df['BAD']
+datasets['taiwan'] = {
+    'file':        'taiwan.csv',
+    'protected':   {'AGE': 'AGE > 25'},
+    'rename':      {'default.payment.next.month': 'TARGET'},
+    'derive':      {'CREDIT_AMNT': 'BILL_AMT1 - PAY_AMT1'},
+    'query':       'CREDIT_AMNT > 0',
+    'recode':      {'SEX':       ({1: 'Male', 2: 'Female'}, 'NA'),
+                    'EDUCATION': ({1: 'graduate_school', 2: 'university', 3: 'high_school'}, 'others'),
+                    'MARRIAGE':  ({1: 'married', 2: 'single'}, 'others'),
+                    'PAY_0':     ({-2: 0, -1: 0}, None),
+                    'PAY_2':     ({-2: 0, -1: 0}, None),
+                    'PAY_3':     ({-2: 0, -1: 0}, None),
+                    'PAY_4':     ({-2: 0, -1: 0}, None),
+                    'PAY_5':     ({-2: 0, -1: 0}, None),
+                    'PAY_6':     ({-2: 0, -1: 0}, None)},
+    'label_map':   {0: 1.0, 1: 2.0},
+    'features':    ["LIMIT_BAL", "SEX","EDUCATION","MARRIAGE","AGE",
+                "PAY_2","PAY_3","PAY_4","PAY_5","PAY_6","BILL_AMT1",
+                "BILL_AMT2","BILL_AMT3","BILL_AMT4","BILL_AMT5","BILL_AMT6",
+                "PAY_AMT1","PAY_AMT2","PAY_AMT3","PAY_AMT4","PAY_AMT5",
+                "PAY_AMT6", "CREDIT_AMNT"],
+    'categorical': ['SEX', 'EDUCATION', 'MARRIAGE', "PAY_0",
+                            "PAY_2","PAY_3","PAY_4","PAY_5","PAY_6"],
+    'shuffle':     True,
+}
+
+
+
+###########################
+#
+#         GERMAN
+#
+###########################
+
+datasets['german'] = {
+    'file':        'german.csv',
+    'read_args':   {'index_col': 0},
+    'protected':   {'AGE': 'age > 25'},
+    'rename':      {'amount': 'CREDIT_AMNT', 'BAD': 'TARGET'},
+    'label_map':   {'GOOD': 1.0, 'BAD': 2.0},
+    'features':    ["account_status", "duration","credit_history","purpose","CREDIT_AMNT","savings",
+                "employment","installment_rate","status_gender","guarantors","resident_since","property",
+                "AGE","other_plans","housing","num_credits","job",
+                "people_maintenance","phone","foreign"],
+    'categorical': ['account_status', 'credit_history', 'purpose', "savings",
+                            "employment","status_gender","guarantors","property","other_plans",
+                           'housing', 'job', 'phone', 'foreign'],
+}
+
 
-    # feature lists
-    XD_features = ["AGE", "CREDIT_AMNT",
+
+###########################
+#
+#         UK
+#
+###########################
+
+datasets['uk'] = {
+    'file':        'uk.csv',
+    'protected':   {'AGE': 'Age > 25'},
+    'rename':      {'Amount': 'CREDIT_AMNT', 'BAD': 'TARGET'},
+    'label_map':   {'GOOD': 1.0, 'BAD': 2.0},
+    'features':    ["AGE", "CREDIT_AMNT", "Curadd", "Curremp", "Custgend", "Depchild", "Freqpaid", "Homephon",
+                   "Insprem", "Loantype", "Marstat", "Term", "Homeowns", "Purpose"],
+    'categorical': ['Custgend', 'Freqpaid', 'Homephon', "Loantype",
+                            "Marstat","Homeowns","Purpose"],
+}
+
+
+
+###########################
+#
+#         BENE
+#
+###########################
+
+datasets['bene'] = {
+    'file':        'bene.csv',
+    'protected':   {'AGE': 'DGEBOA11 > 25'},
+    'rename':      {'BLENIA1': 'CREDIT_AMNT', 'BAD': 'TARGET'},
+    'label_map':   {'GOOD': 1.0, 'BAD': 2.0},
+    'features':    ["AGE", "CREDIT_AMNT",
                     "BFACTA1",      "PLASTA1",     "PDUURA2",      "BMENSA1",      "BSPARA11",   
                     "BUITGA21",     "BINKOA11",     "DBEGIA21",     "DVERBA11",         "DVERBA21",    
                     "DCLIEA11",     "DLLENA11",     "ACONTCV1",     "ACONTTM1",     "ACONTHY1",     "APERSA11",   
                     "bin_BFACTA1",  "bin_PLASTA1",  "bin_PDUURA2",  "bin_CDOELA2",  "bin_CGEBRA1", 
                     "bin_BMENSA1",  "bin_BSPARA11", "bin_BINKOA11",  "bin_CPRIVA11", "bin_CBURGA11",
                     "bin_DVERBA21", "bin_CTROSA11", "bin_CEIGEA11", "bin_DCLIEA11", "bin_DLLENA11", "bin_ACONTCV1",
-                    "bin_ACONTHY1", "bin_CECOTA11", "bin_CVOLTA11", "bin_CAANSA11"]
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = ["bin_BFACTA1",  "bin_PLASTA1",  "bin_PDUURA2",  "bin_CDOELA2",  "bin_CGEBRA1", 
+                    "bin_ACONTHY1", "bin_CECOTA11", "bin_CVOLTA11", "bin_CAANSA11"],
+    'categorical': ["bin_BFACTA1",  "bin_PLASTA1",  "bin_PDUURA2",  "bin_CDOELA2",  "bin_CGEBRA1", 
                     "bin_BMENSA1",  "bin_BSPARA11", "bin_BINKOA11",  "bin_CPRIVA11", "bin_CBURGA11",
                     "bin_DVERBA21", "bin_CTROSA11", "bin_CEIGEA11", "bin_DCLIEA11", "bin_DLLENA11", "bin_ACONTCV1",
-                    "bin_ACONTHY1", "bin_CECOTA11", "bin_CVOLTA11", "bin_CAANSA11"]
-
-    # protected attribute
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
-
-    # target encoding
-    status_map   = {'GOOD': 1.0, 'BAD': 2.0}
-    df['TARGET'] = df['TARGET'].replace(status_map)
-    
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
-        favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
-        instance_weights_name     = None,
-        categorical_features      = categorical_features,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]})
-    
-    return df_standard
+                    "bin_ACONTHY1", "bin_CECOTA11", "bin_CVOLTA11", "bin_CAANSA11"],
+}
 
 
 
@@ -329,23 +531,12 @@ def load_bene(filepath):
 #
 ###########################
 
-def load_homecredit(filepath):
-    '''Imports and prepares homecredit data set'''
-    
-    # read CSV
-    df = pd.read_csv(filepath, sep = ',', na_values = [])
-    
-    # prepare features
-    df['AGE'] = df['app_DAYS_BIRTH'] / 12
-    df['AGE'] = df['AGE'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    del df['app_DAYS_BIRTH']
-    df['CREDIT_AMNT'] = df['app_AMT_CREDIT']
-    del df['app_AMT_CREDIT']
-    df['TARGET'] = df['BAD']
-    del df['BAD']
-
-    # feature lists
-    XD_features = ["AGE", "CREDIT_AMNT",
+datasets['homecredit'] = {
+    'file':        'homecredit.csv',
+    'protected':   {'AGE': 'app_DAYS_BIRTH / 12 > 25'},
+    'rename':      {'app_AMT_CREDIT': 'CREDIT_AMNT', 'BAD': 'TARGET'},
+    'label_map':   {'GOOD': 1.0, 'BAD': 2.0},
+    'features':    ["AGE", "CREDIT_AMNT",
                    'app_CNT_CHILDREN', 'app_AMT_INCOME_TOTAL', 'app_AMT_ANNUITY', 
                    'app_AMT_GOODS_PRICE', 'app_REGION_POPULATION_RELATIVE', 'app_DAYS_EMPLOYED',
                    'app_DAYS_REGISTRATION', 'app_DAYS_ID_PUBLISH', 'app_OWN_CAR_AGE', 'app_FLAG_MOBIL', 'app_FLAG_EMP_PHONE',
@@ -369,33 +560,8 @@ def load_homecredit(filepath):
                    'app_ANNUITY_BY_INCOME', 'app_GOODS_PRICE_BY_INCOME', 'app_INCOME_PER_PERSON', 'app_PERCENT_WORKED', 
                    'app_CNT_ADULTS', 'app_CHILDREN_RATIO', 'app_ANNUITY.LENGTH', 'app_EXT_SOURCE_MEAN', 'app_NUM_EXT_SOURCES', 
                    'app_NUM_DOCUMENTS', 'app_OWN_CAR_AGE_RATIO', 'app_DAYS_ID_PUBLISHED_RATIO', 'app_DAYS_REGISTRATION_RATIO', 
-                   'app_DAYS_LAST_PHONE_CHANGE_RATIO']
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = []
-
-    # protected attribute
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
-
-    # target encoding
-    status_map   = {'GOOD': 1.0, 'BAD': 2.0}
-    df['TARGET'] = df['TARGET'].replace(status_map)
-    
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
-        favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
-        instance_weights_name     = None,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]})
-    
-    return df_standard
+                   'app_DAYS_LAST_PHONE_CHANGE_RATIO'],
+}
 
 
 
@@ -405,21 +571,12 @@ def load_homecredit(filepath):
 #
 ###########################
 
-def load_gmsc(filepath):
-    '''Imports and prepares gmsc data set'''
-    
-    # read CSV
-    df = pd.read_csv(filepath, sep = ',', na_values = [])
-    
-    # prepare features
-    df['AGE'] = df['age'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    del df['age']
-    df['CREDIT_AMNT'] = df['CREDIT_AMNT']
-    df['TARGET'] = df['BAD']
-    del df['BAD']
-
-    # feature lists
-    XD_features = ["AGE", "CREDIT_AMNT",
+datasets['gmsc'] = {
+    'file':        'gmsc.csv',
+    'protected':   {'AGE': 'age > 25'},
+    'rename':      {'BAD': 'TARGET'},
+    'label_map':   {'GOOD': 1.0, 'BAD': 2.0},
+    'features':    ["AGE", "CREDIT_AMNT",
                   'UnknownNumberOfDependents', 'UnknownMonthlyIncome', 'NoDependents', 'NoIncome', 'ZeroDebtRatio',
                    'UnknownIncomeDebtRatio', 'WeirdRevolvingUtilization', 'ZeroRevolvingUtilization', 'Log.Debt',
                    'RevolvingLines', 'HasRevolvingLines', 'HasRealEstateLoans', 'HasMultipleRealEstateLoans', 'EligibleSS',
@@ -438,33 +595,8 @@ def load_gmsc(filepath):
                    'AnyOpenCreditLinesOrLoans', 'Log.NumberOfOpenCreditLinesAndLoans', 
                    'Log.NumberOfOpenCreditLinesAndLoansPerPerson', 'Has.Dependents', 'Log.HouseholdSize', 'Log.DebtRatio', 
                    'Log.UnknownIncomeDebtRatio', 'Log.UnknownIncomeDebtRatioPerPerson', 'Log.UnknownIncomeDebtRatioPerLine', 
-                   'Log.UnknownIncomeDebtRatioPerRealEstateLine', 'Log.NumberRealEstateLoansOrLines']
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = []
-
-    # protected attribute
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
-
-    # target encoding
-    status_map   = {'GOOD': 1.0, 'BAD': 2.0}
-    df['TARGET'] = df['TARGET'].replace(status_map)
-    
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
-        favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
-        instance_weights_name     = None,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]})
-    
-    return df_standard
+                   'Log.UnknownIncomeDebtRatioPerRealEstateLine', 'Log.NumberRealEstateLoansOrLines'],
+}
 
 
 
@@ -474,52 +606,19 @@ def load_gmsc(filepath):
 #
 ###########################
 
-def load_pkdd(filepath):
-    '''Imports and prepares pkdd data set'''
-    
-    # read CSV
-    df = pd.read_csv(filepath, sep = ',', na_values = [])
-    
-    # prepare features
-    df = df.sample(frac = 1).reset_index(drop = True)
-    df['AGE'] = df['AGE'].apply(lambda x: np.where(x > 25, 1.0, 0.0))
-    df['CREDIT_AMNT'] = df['CREDIT_AMNT']
-    df['TARGET'] = df['BAD']
-    del df['BAD']
-
-    # feature lists
-    XD_features = ["AGE", "CREDIT_AMNT",
+datasets['pkdd'] = {
+    'file':        'pkdd.csv',
+    'protected':   {'AGE': 'AGE > 25'},
+    'rename':      {'BAD': 'TARGET'},
+    'label_map':   {'GOOD': 1.0, 'BAD': 2.0},
+    'features':    ["AGE", "CREDIT_AMNT",
                    'PAYMENT_DAY', 'APPLICATION_SUBMISSION_TYPE', 'SEX', 'MARITAL_STATUS', 'QUANT_DEPENDANTS', 'STATE_OF_BIRTH', 
                    'NATIONALITY', 'RESIDENTIAL_STATE', 'FLAG_RESIDENCIAL_PHONE', 'RESIDENCE_TYPE', 'MONTHS_IN_RESIDENCE', 
                    'FLAG_EMAIL', 'PERSONAL_MONTHLY_INCOME', 'OTHER_INCOMES', 'FLAG_VISA', 'FLAG_MASTERCARD', 
                    'QUANT_SPECIAL_BANKING_ACCOUNTS', 'QUANT_CARS', 'COMPANY', 'PROFESSIONAL_STATE', 'FLAG_PROFESSIONAL_PHONE',
-                   'PROFESSION_CODE', 'OCCUPATION_TYPE', 'MATE_PROFESSION_CODE', 'EDUCATION_LEVEL2', 'PRODUCT']
-    D_features = ['AGE']
-    Y_features = ['TARGET']
-    X_features = list(set(XD_features) - set(D_features))
-    categorical_features = ['PAYMENT_DAY', 'APPLICATION_SUBMISSION_TYPE', 'SEX', 'MARITAL_STATUS', 'STATE_OF_BIRTH',
+                   'PROFESSION_CODE', 'OCCUPATION_TYPE', 'MATE_PROFESSION_CODE', 'EDUCATION_LEVEL2', 'PRODUCT'],
+    'categorical': ['PAYMENT_DAY', 'APPLICATION_SUBMISSION_TYPE', 'SEX', 'MARITAL_STATUS', 'STATE_OF_BIRTH',
                             'NATIONALITY', 'RESIDENTIAL_STATE', 'RESIDENCE_TYPE', 'PROFESSIONAL_STATE', 'PROFESSION_CODE',
-                            'OCCUPATION_TYPE', 'MATE_PROFESSION_CODE', 'EDUCATION_LEVEL2', 'PRODUCT']
-
-    # protected attribute
-    privileged_class        = {"AGE": [1.0]}
-    protected_attribute_map = {"AGE": {1.0: 'Old', 0.0: 'Young'}}
-
-    # target encoding
-    status_map   = {'GOOD': 1.0, 'BAD': 2.0}
-    df['TARGET'] = df['TARGET'].replace(status_map)
-    
-    # convert DF
-    df_standard = StandardDataset(
-        df                        = df,
-        label_name                = Y_features[0],
-        favorable_classes         = [1],
-        protected_attribute_names = D_features,
-        privileged_classes        = [privileged_class["AGE"]],
-        instance_weights_name     = None,
-        categorical_features      = categorical_features,
-        features_to_keep          = X_features + Y_features + D_features,
-        metadata                  = {'label_maps':               [{1.0: 'Good', 2.0: 'Bad'}],
-                                     'protected_attribute_maps': [protected_attribute_map]})
-    
-    return df_standard
\ No newline at end of file
+                            'OCCUPATION_TYPE', 'MATE_PROFESSION_CODE', 'EDUCATION_LEVEL2', 'PRODUCT'],
+    'shuffle':     True,
+}